@@ -0,0 +1,547 @@
+"""
+Benchmarks for the game physics and drawing. Run with: python benchmark.py
+
+Every benchmark prints a table and returns its measurements, which are written to a json file with --json.
+With --baseline the measurements are compared against a stored baseline and the run fails if any of them is
+worse by more than the tolerance. --save-baseline stores this run as the new baseline. The baseline holds timings
+of the computer it was made on, which say nothing about any other, so it is not kept in git: save one before
+making a change and compare against it afterwards on the same computer.
+
+The benchmarks that start the game run it in a temporary folder, so the player's log, settings and telemetry are
+never touched.
+"""
+import contextlib # Import the contextlib module used for the temporary folder the game runs in
+import argparse # Import the argparse module
+import json # Import the json module
+import os # Import the os module
+import platform # Import the platform module
+import random # Import the random module
+import subprocess # Import the subprocess module used to time importing the game in a new interpreter
+import sys # Import the sys module
+import shutil # Import the shutil module used to copy the assets when they cannot be linked
+import tempfile # Import the tempfile module used for the level packs that are timed and the folder the game runs in
+import time # Import the time module
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy") # Draw to memory so no window is needed
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+import numpy as np # Import the numpy module
+import pygame # Import the pygame module
+from simulation import Volley, VOLLEY_FLYING, GRAVITY, DT, MAX_VEL, simulate_batch, solve_power, solve_aim, launch_velocity, crossing_heights # Import the volley and the aim solvers
+from levelpack import LevelPack, save_pack, random_levels # Import the level packs
+from levels import place_obstacles # Import the random placement of obstacles
+from environment import ShotEnvironment # Import the headless games
+from telemetry import Telemetry # Import the shot telemetry
+from game import Game, Projectile, ProjectileImage, Obstacle, ObstacleGrid, ObstacleSet, HUD, INTEGRATOR_DT, find_nearby # Import the game classes and the default integrator time steps
+
+LANDING_TOLERANCE = 2 # The largest distance in pixels a landing point may be from the Euler landing point
+BASELINE_FILE = "benchmark_baseline.json" # The stored measurements new runs are compared against
+TOLERANCE = 0.25 # How much worse than the baseline a measurement may be, as a fraction of the baseline
+
+# Launch velocities used by the integrator benchmark
+SHOTS = [(40, 30), (80, 60), (20, 70), (100, -20), (100, 100), (5, 5), (60, 10), (30, 90)]
+
+# Window sizes used by the render benchmark
+RENDER_SIZES = [(640, 480), (1000, 800), (1920, 1080)]
+RENDER_OBSTACLES = 10 # The number of obstacles in the level drawn by bench_render
+
+def metric(value, unit, higher_is_better=False):
+    """
+    A function to make a measurement that can be written to json and compared against a baseline.
+    """
+    return {"value": float(value), "unit": unit, "higher_is_better": higher_is_better}
+
+@contextlib.contextmanager
+def scratch_folder():
+    """
+    A function to run the code in a with statement from a new temporary folder, with the assets linked into it,
+    so a game started there writes its log, settings and telemetry to the temporary folder.
+    """
+    home = os.getcwd()
+    assets = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets")
+    with tempfile.TemporaryDirectory() as folder:
+        try:
+            os.symlink(assets, os.path.join(folder, "assets"), target_is_directory=True)
+        except OSError: # Links need extra permissions on some systems
+            shutil.copytree(assets, os.path.join(folder, "assets"))
+        os.chdir(folder)
+        try:
+            yield folder
+        finally:
+            os.chdir(home)
+
+def close_game(game):
+    """
+    A function to stop the threads of a game and write its files, as the game does when it quits.
+    """
+    game.predictor.close()
+    game.levelGenerator.close()
+    if game.telemetry is not None:
+        game.telemetry.close()
+    game.settings.close()
+    game.logger.close()
+
+def simulate_shot(integrator, vx, vy, floor_y=800):
+    """
+    A function to fly one shot until it crosses the floor and return the landing x-position and the number of steps.
+    """
+    projectile = Projectile(130, 425, vx, vy, 2, 0.52, 0.00004, 9.81)
+    projectile.set_wind(2.8, 171)
+    projectile.set_integrator(integrator)
+    steps = 0
+    while projectile.y < floor_y and steps < 100000:
+        last_x, last_y = projectile.get_position()
+        projectile.update_position()
+        steps += 1
+    frac = (floor_y - last_y) / (projectile.y - last_y) # How far through the last step the floor was crossed
+    return last_x + (projectile.x - last_x) * frac, steps
+
+def bench_integrators():
+    """
+    A function to report steps per shot, wall time and landing error for each integrator compared to Euler.
+    """
+    results = {}
+    reference = [simulate_shot("euler", vx, vy)[0] for vx, vy in SHOTS] # The landing points of the original integrator
+    print(f"{'integrator':<14}{'dt':>6}{'steps/shot':>12}{'ms/shot':>10}{'max error px':>14}")
+    for integrator in INTEGRATOR_DT:
+        start = time.perf_counter()
+        shots = [simulate_shot(integrator, vx, vy) for vx, vy in SHOTS]
+        elapsed = time.perf_counter() - start
+        steps = sum(shot[1] for shot in shots) / len(SHOTS)
+        error = max(abs(shot[0] - ref) for shot, ref in zip(shots, reference))
+        status = "" if error <= LANDING_TOLERANCE else " (over tolerance)"
+        print(f"{integrator:<14}{INTEGRATOR_DT[integrator]:>6}{steps:>12.0f}{elapsed / len(SHOTS) * 1000:>10.2f}{error:>14.3f}{status}")
+        results[f"integrator.{integrator}.ms_per_shot"] = metric(elapsed / len(SHOTS) * 1000, "ms")
+        results[f"integrator.{integrator}.max_error"] = metric(error, "px")
+    return results
+
+def bench_update_position(steps=200000):
+    """
+    A function to report how many times per second Projectile.update_position can run with each integrator.
+    """
+    results = {}
+    print(f"{'integrator':<14}{'steps/s':>14}")
+    for integrator in INTEGRATOR_DT:
+        projectile = Projectile(130, 425, 60, 40, 2, 0.52, 0.00004, 9.81)
+        projectile.set_wind(2.8, 171)
+        projectile.set_integrator(integrator)
+        start = time.perf_counter()
+        for i in range(steps // 1000):
+            projectile.set_position(130, 425) # Fire again every 1000 steps so the projectile stays at game speeds
+            projectile.set_vx_vy(60, 40)
+            for j in range(1000):
+                projectile.update_position()
+        rate = steps / (time.perf_counter() - start)
+        print(f"{integrator:<14}{rate:>14.0f}")
+        results[f"update_position.{integrator}.steps_per_s"] = metric(rate, "steps/s", higher_is_better=True)
+    return results
+
+def bench_collisions(counts=(10, 100, 1000, 5000), frames=1000):
+    """
+    A function to report the collision cost per frame as the number of obstacles grows, for a linear scan and for the grid,
+    and the cost of a whole collision step as the game does it: finding the obstacles along the step and bouncing off them.
+    """
+    results = {}
+    rng = random.Random(1) # Use a fixed seed so every run places the same obstacles
+    path = [(rng.uniform(0, 1000), rng.uniform(0, 800)) for i in range(frames)] # Projectile positions, one per frame
+    moves = [(rng.uniform(-5, 5), rng.uniform(-5, 5)) for i in range(frames)] # The distance moved in one physics step at each position
+    print(f"{'obstacles':>10}{'linear us/frame':>18}{'grid us/frame':>16}{'step us/frame':>16}")
+    for count in counts:
+        obstacles = [Obstacle(rng.randint(0, 1000), rng.randint(0, 800), rng.randint(20, 100), rng.randint(20, 100)) for i in range(count)]
+        grid = ObstacleGrid()
+        grid.build(obstacles)
+
+        start = time.perf_counter()
+        linear_hits = sum(obstacle.overlaps(x, y, 5, 5) for x, y in path for obstacle in obstacles)
+        linear = (time.perf_counter() - start) / frames
+
+        start = time.perf_counter()
+        grid_hits = sum(obstacle.overlaps(x, y, 5, 5) for x, y in path for obstacle in grid.query(x, y, 5, 5))
+        indexed = (time.perf_counter() - start) / frames
+
+        assert linear_hits == grid_hits, "the grid missed an obstacle" # Both methods must find the same collisions
+
+        projectile = Projectile(0, 0, 10, 10, 2, 0.52, 0.00004, 9.81)
+        projectileImage = ProjectileImage(0, 0, 5)
+        start = time.perf_counter()
+        for (x, y), (dx, dy) in zip(path, moves):
+            projectile.set_position(x, y) # Move the projectile one step from each point of the path
+            projectile.x, projectile.y = x + dx, y + dy
+            for obstacle in find_nearby(projectile, projectileImage, grid):
+                obstacle.resolve_collision(projectile, projectileImage)
+        step = (time.perf_counter() - start) / frames
+
+        print(f"{count:>10}{linear * 1e6:>18.1f}{indexed * 1e6:>16.1f}{step * 1e6:>16.1f}")
+        results[f"collisions.{count}.linear"] = metric(linear * 1e6, "us/frame")
+        results[f"collisions.{count}.grid"] = metric(indexed * 1e6, "us/frame")
+        results[f"collisions.{count}.step"] = metric(step * 1e6, "us/frame")
+    return results
+
+def bench_swept(dt_values=(0.01, 0.05, 0.1, 0.2), shots=200):
+    """
+    A function to count how many fast shots pass straight through a thin wall with the end-of-step test and with the swept test.
+    """
+    results = {}
+    rng = random.Random(2)
+    wall = Obstacle(500, 0, 5, 800) # A wall 5 pixels thick across the whole screen
+    print(f"{'dt':>6}{'end-of-step misses':>20}{'swept misses':>14}")
+    for dt in dt_values:
+        point_misses = 0
+        swept_misses = 0
+        for i in range(shots):
+            projectile = Projectile(100, 400, rng.uniform(60, 100), rng.uniform(-20, 20), 2, 0.52, 0.00004, 9.81)
+            projectile.set_integrator("rk4", dt)
+            point_hit = swept_hit = False
+            while projectile.x < 600: # Fly until the projectile is past the wall
+                projectile.update_position()
+                point_hit = point_hit or wall.overlaps(projectile.x, projectile.y, 5, 5)
+                swept_hit = swept_hit or point_hit or wall.get_time_of_impact(projectile, 5, 5) is not None
+            point_misses += not point_hit
+            swept_misses += not swept_hit
+        print(f"{dt:>6}{point_misses:>20}{swept_misses:>14}")
+        results[f"swept.{dt}.misses"] = metric(swept_misses, "shots")
+    return results
+
+def bench_hud(frames=2000):
+    """
+    A function to report the time per frame spent drawing the HUD text with and without the HUD cache.
+    While aiming both lines stay the same, in flight the velocity line changes every frame.
+    """
+    results = {}
+    pygame.init()
+    screen = pygame.display.set_mode((1000, 800))
+    font = pygame.font.SysFont("consolas", 20)
+    static_line = "Drag Coefficient: 0.52, Mass: 2Kg, Air Resistance: 4e-05"
+    print(f"{'state':<10}{'uncached ms/frame':>20}{'cached ms/frame':>18}{'saved ms/frame':>16}")
+    for state in ("aiming", "in flight"):
+        def velocity_line(frame):
+            vx = 40.0 if state == "aiming" else 40.0 + frame * 0.01
+            return f"Cannon Velocity: {round(vx, 2)}, 30.0 Wind Speed: 2.7918m/s"
+
+        start = time.perf_counter()
+        for frame in range(frames): # Render every line from scratch, as the game did before
+            screen.blit(font.render(velocity_line(frame), True, (255, 255, 255)), (10, 10))
+            screen.blit(font.render(static_line, True, (255, 255, 255)), (10, 30))
+        uncached = (time.perf_counter() - start) / frames
+
+        hud = HUD(font)
+        start = time.perf_counter()
+        for frame in range(frames):
+            hud.draw_line(screen, velocity_line(frame), (10, 10))
+            hud.draw_line(screen, static_line, (10, 30))
+        cached = (time.perf_counter() - start) / frames
+        print(f"{state:<10}{uncached * 1000:>20.3f}{cached * 1000:>18.3f}{(uncached - cached) * 1000:>16.3f}")
+        results[f"hud.{state.replace(' ', '_')}.cached"] = metric(cached * 1000, "ms/frame")
+    pygame.quit()
+    return results
+
+def bench_render(sizes=RENDER_SIZES, frames=2000):
+    """
+    A function to report the time Game.drawFrame takes at several window sizes while a shot is in flight.
+    The projectile is moved with update_position between frames, the way the game runs about five physics steps per frame.
+    Every size draws the same number of obstacles placed from a fixed seed, rather than whatever the level generator
+    finds in its time budget, which can be none at all.
+    """
+    results = {}
+    print(f"{'window':>12}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for width, height in sizes:
+        with scratch_folder():
+            times = time_render(width, height, frames)
+        name = f"{width}x{height}"
+        print(f"{name:>12}{times.mean():>10.3f}{np.percentile(times, 50):>10.3f}{np.percentile(times, 95):>10.3f}{np.percentile(times, 99):>10.3f}")
+        results[f"render.{name}.p50"] = metric(np.percentile(times, 50), "ms/frame")
+        results[f"render.{name}.p95"] = metric(np.percentile(times, 95), "ms/frame")
+    pygame.quit()
+    return results
+
+def time_render(width, height, frames):
+    """
+    A function to time drawing frames of a game at one window size for bench_render. Returns the times in ms.
+    """
+    game = Game(seed=1, settings={"win_width": width, "win_height": height, "levelCounter": 0})
+    try:
+        game.setupLevel()
+        fixed = [(0, height - 5, width, 50), (0, -45, width, 50), (width - 5, 0, 50, height)] # The floor, ceiling and wall, as obstacleManager
+        cannon_width, cannon_height = game.cannon.cannon_image.get_size()
+        margin = 30 # The gap kept around the cannon and the target, as obstacleManager
+        keep_clear = [(game.cannon.x - margin, game.cannon.y - margin, cannon_width + margin * 2, cannon_height + margin * 2),
+                      (game.target.x - margin, game.target.y - margin, game.target.width + margin * 2, game.target.height + margin * 2)]
+        game.setObstacles(ObstacleSet(fixed + place_obstacles(random.Random(1), width, height, RENDER_OBSTACLES, keep_clear)))
+        steps_per_frame = round(game.physics_rate / 60)
+        times = []
+        for frame in range(frames):
+            if not game.in_flight: # Fire the next shot from the cannon
+                game.projectile.set_position(*game.cannon.get_center())
+                game.projectile.trajectory.clear()
+                game.projectile.set_vx_vy(60, 40)
+                game.in_flight = True
+            for i in range(steps_per_frame):
+                game.projectile.update_position()
+            if game.projectile.x > width or game.projectile.y > height or game.projectile.x < 0:
+                game.in_flight = False
+            start = time.perf_counter()
+            game.drawFrame(0.5)
+            times.append(time.perf_counter() - start)
+    finally:
+        close_game(game)
+    return np.array(times[10:]) * 1000 # Leave out the first frames, which draw the level layer and the whole screen
+
+def bench_volley(counts=(100, 300, 1000), frames=600, obstacles=20):
+    """
+    A function to report the time per frame to move, collide and draw a volley of projectiles, with the five physics
+    steps the game runs each frame. Every projectile is fired again when the whole volley has finished.
+    """
+    results = {}
+    rng = random.Random(3)
+    rects = [(0, 795, 1000, 50), (0, -45, 1000, 50), (995, 0, 50, 800)] + [(rng.randint(300, 1000), rng.randint(0, 800), rng.randint(20, 100), rng.randint(20, 100)) for i in range(obstacles)]
+    goal = (900, 400, 20, 20)
+    pygame.init()
+    screen = pygame.display.set_mode((1000, 800))
+    print(f"{'projectiles':>12}{'physics ms':>12}{'draw ms':>10}{'p95 ms':>10}{'max fps':>10}")
+    for count in counts:
+        volley = Volley(count)
+        volley.set_wind(2.8, 171)
+        volley.set_obstacles(rects) # Binned once, as the game does for each level
+        spread = np.random.default_rng(4)
+        angle = np.radians(30 + spread.uniform(-4, 4, count))
+        power = 70 * spread.uniform(0.9, 1.05, count)
+        physics = []
+        draw = []
+        for frame in range(frames):
+            if volley.count(VOLLEY_FLYING) == 0:
+                volley.fire(130, 425, np.cos(angle) * power, np.sin(angle) * power)
+            start = time.perf_counter()
+            for i in range(5):
+                volley.step()
+                volley.collide(None, goal, 1000, 800)
+            physics.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            screen.fill((30, 30, 30))
+            for x, y in volley.get_positions(0.5).tolist():
+                screen.fill((255, 255, 255), (x - 2.5, y - 2.5, 5, 5))
+            draw.append(time.perf_counter() - start)
+        physics = np.array(physics) * 1000
+        draw = np.array(draw) * 1000
+        total = physics + draw
+        print(f"{count:>12}{physics.mean():>12.3f}{draw.mean():>10.3f}{np.percentile(total, 95):>10.3f}{1000 / total.mean():>10.0f}")
+        results[f"volley.{count}.physics"] = metric(physics.mean(), "ms/frame")
+        results[f"volley.{count}.p95"] = metric(np.percentile(total, 95), "ms/frame")
+    pygame.quit()
+    return results
+
+def aim_at(x0, y0, target_x, target_y, angles, mass=2, Cd=0.52, B2=0.00004, wind_speed=0, wind_angle=0,
+           gravity=GRAVITY, dt=DT, height=800, min_power=1, max_power=MAX_VEL * 2 ** 0.5, iterations=14, max_time=20):
+    """
+    A function to find, for each launch angle (degrees), the power that makes the shot pass through (target_x, target_y).
+    This is the plain bisection solve_power replaced, kept here as the baseline it is timed against.
+    For a fixed angle more power makes the shot cross target_x higher up, so the power is found by bisection with
+    every angle simulated together. Returns an array of powers, NaN where no power reaches the target.
+    Shots that take longer than max_time seconds to get there are treated as not reaching it.
+    Obstacles are not taken into account.
+    """
+    angles = np.asarray(angles, dtype=float)
+    low = np.full(angles.shape, float(min_power)) # Powers known to be too weak
+    high = np.full(angles.shape, float(max_power)) # Powers known to be too strong
+
+    def crossing_height(powers):
+        vx0, vy0 = launch_velocity(angles, powers)
+        result = simulate_batch(x0, y0, vx0, vy0, mass, Cd, B2, wind_speed, wind_angle, gravity=gravity, dt=dt,
+                                floor_y=height, x_min=-np.inf, x_max=target_x, max_steps=int(max_time / dt))
+        crossed = ~result.landed & (result.landing_x >= target_x) # The shot reached target_x before the floor
+        return np.where(crossed, result.landing_y, np.inf) # Shots that never got there count as far too low
+
+    reachable = crossing_height(high) <= target_y # The strongest shot has to pass above the target
+    for i in range(iterations):
+        middle = (low + high) / 2
+        too_low = crossing_height(middle) > target_y # The screen y-axis points down, so a larger y is lower
+        low = np.where(too_low, middle, low)
+        high = np.where(too_low, high, middle)
+    return np.where(reachable, (low + high) / 2, np.nan)
+
+def bench_aim(runs=5):
+    """
+    A function to compare solve_power against the bisection of aim_at for the levels' launch angles, report how far
+    the solved shots pass from the target, and time solve_aim finding the feasible shots through a layout of obstacles.
+    """
+    angles = np.arange(-80, 86, 5.0)
+    rects = [(0, 795, 1000, 50), (0, -45, 1000, 50), (995, 0, 50, 800), (400, 300, 80, 80), (600, 450, 60, 200)]
+    goal = (850, 380, 50, 40)
+    target_x, target_y = goal[0] + goal[2] / 2, goal[1] + goal[3] / 2
+    bisect, secant, full, errors = [], [], [], []
+    for i in range(runs):
+        start = time.perf_counter()
+        aim_at(130, 425, target_x, target_y, angles, wind_speed=3, wind_angle=171)
+        bisect.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        powers, simulations = solve_power(130, 425, target_x, target_y, angles, wind_speed=3, wind_angle=171)
+        secant.append(time.perf_counter() - start)
+        solution = solve_aim(130, 425, goal, rects, wind_speed=3, wind_angle=171)
+        full.append(solution.elapsed)
+    found = np.isfinite(powers)
+    vx0, vy0 = launch_velocity(angles[found], powers[found])
+    heights = crossing_heights(130, 425, vx0, vy0, target_x, wind_speed=3, wind_angle=171, max_steps=20000)
+    error = np.abs(heights - target_y).max()
+    bisect, secant, full = (np.median(times) * 1000 for times in (bisect, secant, full))
+    print(f"{'aim':<12}{'ms':>10}{'simulations':>13}")
+    print(f"{'aim_at':<12}{bisect:>10.1f}{15:>13}")
+    print(f"{'solve_power':<12}{secant:>10.1f}{simulations:>13}")
+    print(f"{'solve_aim':<12}{full:>10.1f}{solution.simulations:>13}")
+    print(f"{len(solution)} feasible shots, solved shots pass within {error:.3f}px of the target")
+    return {"aim.solve_power": metric(secant, "ms"),
+            "aim.solve_aim": metric(full, "ms"),
+            "aim.max_error": metric(error, "px")}
+
+def bench_levelpack(levels=20, obstacles=(1000, 50000), runs=5):
+    """
+    A function to report the time to open a level pack, load its last level and build the obstacle set and grid the
+    game collides with, for levels of a few and of tens of thousands of obstacles.
+    """
+    results = {}
+    print(f"{'obstacles':>10}{'open ms':>10}{'load ms':>10}{'build ms':>10}")
+    with tempfile.TemporaryDirectory() as folder:
+        for count in obstacles:
+            file_name = os.path.join(folder, f"pack{count}.bin")
+            save_pack(file_name, random_levels(levels, count))
+            opened, loaded, built = [], [], []
+            for i in range(runs):
+                start = time.perf_counter()
+                pack = LevelPack(file_name)
+                opened.append(time.perf_counter() - start)
+                start = time.perf_counter()
+                level = pack.get_level(levels - 1)
+                loaded.append(time.perf_counter() - start)
+                start = time.perf_counter()
+                grid = ObstacleGrid()
+                grid.build(ObstacleSet(level.obstacles))
+                built.append(time.perf_counter() - start)
+                del level, grid
+                pack.close()
+            opened, loaded, built = (np.median(times) * 1000 for times in (opened, loaded, built))
+            print(f"{count:>10}{opened:>10.3f}{loaded:>10.3f}{built:>10.2f}")
+            results[f"levelpack.{count}.load"] = metric(opened + loaded, "ms")
+            results[f"levelpack.{count}.build"] = metric(built, "ms")
+    return results
+
+def bench_environment(games=1000, shots=3, level=6):
+    """
+    A function to report how many shots an hour the headless games fly in one process, with random shots at levels
+    of random obstacles. Every shot is flown until it ends, so the time is set by the longest shot of each step.
+    """
+    rng = np.random.default_rng(5)
+    with ShotEnvironment(games, solvable=False) as environment:
+        environment.reset(5, level)
+        elapsed = 0.0
+        hits = 0
+        for shot in range(shots):
+            result = environment.step(np.column_stack((rng.uniform(-30, 80, games), rng.uniform(20, 100, games))))
+            elapsed += result.elapsed
+            hits += int(result.rewards.sum())
+    rate = games * shots / elapsed * 3600
+    print(f"{'games':>8}{'shots':>8}{'ms/step':>10}{'hits':>8}{'shots/hour':>14}")
+    print(f"{games:>8}{games * shots:>8}{elapsed / shots * 1000:>10.0f}{hits:>8}{rate:>14,.0f}")
+    return {"environment.shots_per_hour": metric(rate, "shots/hour", higher_is_better=True)}
+
+def bench_telemetry(shots=100000):
+    """
+    A function to report the time the game spends recording a shot and how fast the thread writes them to the database.
+    """
+    with tempfile.TemporaryDirectory() as folder:
+        telemetry = Telemetry(os.path.join(folder, "telemetry.db"), {"seed": 1}, max_queue=shots + 1)
+        start = time.perf_counter()
+        for shot in range(shots):
+            telemetry.record_shot(shot % 50, shot % 50, 60.0, 40.0, 1.5, 90, 12, 900, 3.0, 620.0, 500.0, 300.0, 2, shot % 4)
+        recorded = time.perf_counter() - start
+        telemetry.close() # Waits for every shot to be written
+        written = time.perf_counter() - start
+    print(f"{'shots':>8}{'record us':>11}{'written/s':>11}")
+    print(f"{shots:>8}{recorded / shots * 1e6:>11.2f}{telemetry.written / written:>11,.0f}")
+    return {"telemetry.record": metric(recorded / shots * 1e6, "us/shot")}
+
+def bench_startup(runs=3):
+    """
+    A function to report the time to the first frame, broken down by the phases of starting the game, and the time
+    importing the game takes in a fresh interpreter.
+    """
+    totals = []
+    phases = {}
+    for i in range(runs):
+        with scratch_folder(): # A new folder each time, so every run starts from the default settings
+            game = Game(seed=1)
+            game.setupLevel()
+            game.drawFrame(0)
+            game.startup.mark("first frame")
+            close_game(game)
+            pygame.quit()
+        for name, seconds in game.startup.phases:
+            phases.setdefault(name, []).append(seconds * 1000)
+        totals.append(sum(seconds for name, seconds in game.startup.phases) * 1000)
+    imports = []
+    for i in range(runs): # Import in a new process each time, as the modules are cached after the first import
+        output = subprocess.run([sys.executable, "-c", "import time; t = time.perf_counter(); import game; print(time.perf_counter() - t)"],
+                                capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+        imports.append(float(output.split()[-1]) * 1000)
+    print(f"{'startup ms':<18}{'median':>10}")
+    for name, times in phases.items():
+        print(f"{name:<18}{np.median(times):>10.1f}")
+    print(f"{'total':<18}{np.median(totals):>10.1f}")
+    print(f"{'import game':<18}{np.median(imports):>10.1f}")
+    return {"startup.first_frame": metric(np.median(totals), "ms"),
+            "startup.import": metric(np.median(imports), "ms")}
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """
+    A function to compare measurements against a baseline.
+    Returns a list of (name, baseline value, value) for every measurement that is worse by more than the tolerance.
+    Measurements that are not in the baseline are not compared.
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        base = baseline[name]["value"]
+        if result["higher_is_better"]:
+            worse = result["value"] < base * (1 - tolerance)
+        else:
+            worse = result["value"] > base * (1 + tolerance)
+        if worse:
+            regressions.append((name, base, result["value"]))
+    return regressions
+
+def write_results(file_name, results):
+    """
+    A function to write measurements to a json file along with details of the machine they were taken on.
+    """
+    data = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "pygame": pygame.version.ver,
+        "platform": platform.platform(),
+        "results": results,
+    }
+    with open(file_name, "w") as file:
+        json.dump(data, file, indent=2)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the game physics and drawing.")
+    parser.add_argument("--json", help="write the measurements to this json file")
+    parser.add_argument("--baseline", nargs="?", const=BASELINE_FILE, help="compare against a baseline file (default: %(const)s)")
+    parser.add_argument("--save-baseline", nargs="?", const=BASELINE_FILE, help="store the measurements as the baseline (default: %(const)s)")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="how much worse than the baseline a measurement may be (default: %(default)s)")
+    args = parser.parse_args()
+
+    results = {}
+    for bench in (bench_integrators, bench_update_position, bench_collisions, bench_swept, bench_hud, bench_render, bench_volley, bench_aim, bench_levelpack, bench_environment, bench_telemetry, bench_startup):
+        results.update(bench())
+        print()
+
+    if args.json:
+        write_results(args.json, results)
+    if args.save_baseline:
+        write_results(args.save_baseline, results)
+        print(f"Saved baseline to {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        for name, base, value in regressions:
+            print(f"REGRESSION {name}: {value:.3f} (baseline {base:.3f}, {results[name]['unit']})")
+        print(f"{len(results)} measurements, {len(regressions)} worse than the baseline by more than {args.tolerance:.0%}")
+        sys.exit(1 if regressions else 0)
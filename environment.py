@@ -0,0 +1,404 @@
+"""
+Headless games for bots and automated playtesting.
+
+A ShotEnvironment runs many independent games at once without a window. Every game has its own level, wind and
+goal, made by the rules of levelManager and obstacleManager, and moves on to the next level when its goal is hit.
+step() fires one shot in every game and flies all of them together as one Volley, each projectile with the wind,
+obstacles and goal of its own game, so a step costs a few array operations per physics step however many games
+there are. Shots that have ended leave the volley, but a step still lasts as long as its longest shot, so the more
+games a process runs the more shots an hour it flies. A ShardedEnvironment splits the games between worker processes so every CPU is used, and has the same
+reset() and step().
+
+Run with: python environment.py [--games N] [--shots N] [--workers N] [--seed N] [--solvable]
+"""
+import multiprocessing # Import the multiprocessing module used to run shards of games in other processes
+import os # Import the os module
+import random # Import the random module
+import sys # Import the sys module
+import time # Import the time module
+import numpy as np # Import the numpy module
+from simulation import Volley, launch_velocity, DT, GRAVITY, MAX_VEL, VOLLEY_FLYING, VOLLEY_HIT, VOLLEY_OUT, VOLLEY_RESTING # Import the volley physics
+from levels import LevelGenerator, place_obstacles # Import the level generation
+from levelpack import LevelPack # Import the level packs
+from replay import SHOT_ABORTED, SHOT_HIT, SHOT_OUT, SHOT_REST, OUTCOME_NAMES # Import how a shot can end
+
+CANNON_X = 100 # The x-position of the cannon, which is half way down the screen as in the game
+CANNON_SIZE = (70, 70) # The size of the cannon image, which sets the centre shots are fired from and the area kept clear
+GOAL_SIZE = (20, 20) # The width and height of the goal
+GOAL_OFFSET = 100 # How far the goal is from the right of the screen
+
+# The columns of an observation, one row per game
+OBSERVATION = ("goal_x", "goal_y", "goal_width", "goal_height", "wind_speed", "wind_angle", "level", "obstacles")
+
+# How a shot ended for each state of the volley, a shot still flying after max_steps is aborted
+OUTCOMES = np.zeros(4, dtype=np.uint8)
+OUTCOMES[VOLLEY_FLYING] = SHOT_ABORTED
+OUTCOMES[VOLLEY_HIT] = SHOT_HIT
+OUTCOMES[VOLLEY_OUT] = SHOT_OUT
+OUTCOMES[VOLLEY_RESTING] = SHOT_REST
+
+def game_seeds(seed, count):
+    """
+    A function to make the seeds of count games. seed is None for random seeds, a number the seeds are made from
+    or a list with a seed for each game.
+    """
+    if seed is None or isinstance(seed, (int, np.integer)):
+        rng = random.Random(seed)
+        return [rng.getrandbits(63) for i in range(count)]
+    seeds = [int(s) for s in seed]
+    if len(seeds) != count:
+        raise ValueError(f"{len(seeds)} seeds given for {count} games")
+    return seeds
+
+class StepResult:
+    """
+    A class to hold what happened in every game in one step: the observations after the step, a reward of 1 for
+    each game whose goal was hit, how each shot ended (SHOT_HIT, SHOT_OUT, SHOT_REST or SHOT_ABORTED), how many
+    physics steps it lasted and how many times it bounced.
+    """
+    def __init__(self, observations, rewards, outcomes, steps, bounces, elapsed=0.0):
+        """
+        Initialize the result of a step.
+        """
+        self.observations = observations # An array with a row per game and the columns of OBSERVATION
+        self.rewards = rewards # 1 for the games that hit their goal, otherwise 0
+        self.outcomes = outcomes # How each shot ended
+        self.steps = steps # The number of physics steps each shot lasted
+        self.bounces = bounces # The number of times each shot bounced
+        self.elapsed = elapsed # How long the step took in seconds
+
+    def __len__(self):
+        """
+        A method to return the number of games.
+        """
+        return len(self.rewards)
+
+    def get_hits(self):
+        """
+        A method to return which games hit their goal, as an array of booleans.
+        """
+        return self.outcomes == SHOT_HIT
+
+    @staticmethod
+    def concatenate(results, elapsed=0.0):
+        """
+        A function to join the results of several groups of games into one result, in order.
+        """
+        return StepResult(*(np.concatenate([getattr(result, name) for result in results])
+                            for name in ("observations", "rewards", "outcomes", "steps", "bounces")), elapsed)
+
+class ShotEnvironment:
+    """
+    A class to run many headless games in lockstep. Each step every game fires one shot, given as a launch angle
+    (degrees above the horizontal) and a power like the cannon's. A game that hits its goal moves on to a new level
+    as levelManager does, a game that misses stays on its level.
+    """
+    def __init__(self, count, width=1000, height=800, mass=2, Cd=0.52, B2=0.00004, gravity=GRAVITY, dt=DT, size=5,
+                 max_steps=20000, solvable=False, max_attempts=30, level_pack=None):
+        """
+        Initialize count games on a width by height screen. A shot still flying after max_steps physics steps (over a
+        minute of the game) is aborted, as the wind can keep a projectile bouncing for ever. By default the obstacles
+        are placed at random and not checked, as the game did before the level generator: checking a level takes tens
+        of milliseconds, and with hundreds of goals hit every step that would take far longer than the shots. With
+        solvable the levels are made by the level generator like the game's, trying at most max_attempts layouts
+        rather than for a time, so the levels still only depend on the seeds. level_pack is the file name of a
+        level pack to play instead of making levels.
+        """
+        self.count = count # The number of games
+        self.width = width # The width of the screen in pixels
+        self.height = height # The height of the screen in pixels
+        self.physics = {"mass": mass, "Cd": Cd, "B2": B2, "size": size, "dt": dt} # The physics the level generator checks shots with
+        self.max_steps = max_steps # The most physics steps a shot may last
+        self.solvable = solvable # Whether levels are checked to be solvable
+        self.levelGenerator = LevelGenerator(workers=1, use_processes=False, max_attempts=max_attempts) # Shards give the parallelism, so no process pool here
+        self.levelPack = LevelPack(level_pack) if level_pack else None # The level pack the levels come from, if there is one
+        cannon_y = height / 2 # The cannon is half way down the screen
+        self.start = (CANNON_X + CANNON_SIZE[0] / 2, cannon_y + CANNON_SIZE[1] / 2) # Shots are fired from the centre of the cannon
+        self.cannonRect = (CANNON_X, cannon_y, CANNON_SIZE[0], CANNON_SIZE[1])
+        self.fixed = [(0, height - 5, width, 50), # The floor
+                      (0, -45, width, 50), # The ceiling
+                      (width - 5, 0, 50, height)] # The right wall
+        self.volley = Volley(count, mass, Cd, B2, gravity, dt, size) # One projectile per game
+        self.rngs = [] # The random number generator of each game
+        self.levelCounter = np.zeros(count, dtype=np.int64) # The level number of each game
+        self.packLevel = np.zeros(count, dtype=np.int64) # The level of the level pack each game is on
+        self.goals = np.zeros((count, 4)) # The goal of each game as an (x, y, width, height) rectangle
+        self.wind_speed = np.zeros(count) # The wind speed of each game
+        self.wind_angle = np.zeros(count) # The wind angle of each game
+        self.obstacleCounts = np.zeros(count, dtype=np.int64) # The number of obstacles of each game
+        self.rects = np.full((count, 0, 4), np.nan) # The obstacles of every game, padded with rows of NaN
+        self.binned = False # Whether the volley has binned the obstacles since they last changed
+
+    def reset(self, seed=None, level=0):
+        """
+        A method to start every game again from level, as a new game does, and return the observations.
+        seed is None for random games, a number the seeds of the games are made from or a list of one seed per game.
+        """
+        self.rngs = [random.Random(s) for s in game_seeds(seed, self.count)]
+        self.levelCounter[:] = level
+        self.packLevel[:] = 0
+        self.goals[:] = (self.width - GOAL_OFFSET, self.height - 100, *GOAL_SIZE) # Where a new game puts the goal
+        self.wind_speed[:] = 0 # A new game has no wind
+        self.wind_angle[:] = 0
+        self.rects = np.full((self.count, 0, 4), np.nan)
+        for game in range(self.count):
+            self.makeLevel(game)
+        return self.get_observations()
+
+    def makeLevel(self, game):
+        """
+        A method to make the obstacles of a game's level, as obstacleManager does.
+        """
+        if self.levelPack is not None: # The levels come from a level pack, as in loadPackLevel
+            level = self.levelPack.get_level(int(self.packLevel[game]) % len(self.levelPack))
+            self.goals[game] = level.goal
+            self.wind_speed[game] = level.wind_speed
+            self.wind_angle[game] = level.wind_angle
+            self.setObstacles(game, np.asarray(level.obstacles, dtype=float))
+            return
+        goal = tuple(float(v) for v in self.goals[game])
+        margin = 30 # The gap kept around the cannon and the goal
+        keep_clear = [(self.cannonRect[0] - margin, self.cannonRect[1] - margin, self.cannonRect[2] + margin * 2, self.cannonRect[3] + margin * 2),
+                      (goal[0] - margin, goal[1] - margin, goal[2] + margin * 2, goal[3] + margin * 2)]
+        count = int(self.levelCounter[game])
+        seed = self.rngs[game].getrandbits(32) # Drawn the same way in both cases so a game follows its seed either way
+        if count == 0: # Only the floor, ceiling and wall, so there is nothing to place or check
+            rects = []
+        elif self.solvable:
+            physics = dict(self.physics, wind_speed=float(self.wind_speed[game]), wind_angle=float(self.wind_angle[game]))
+            rects = self.levelGenerator.generate(self.width, self.height, count, self.fixed, keep_clear, self.start, goal, physics, seed=seed).rects
+        else:
+            rects = place_obstacles(random.Random(seed), self.width, self.height, count, keep_clear) # The first layout the generator would try
+        self.setObstacles(game, np.array(self.fixed + rects, dtype=float).reshape(-1, 4))
+
+    def setObstacles(self, game, rects):
+        """
+        A method to put a game's obstacles into the padded array every game is collided with.
+        """
+        if len(rects) > self.rects.shape[1]: # Make room for more obstacles
+            grown = np.full((self.count, len(rects), 4), np.nan)
+            grown[:, :self.rects.shape[1]] = self.rects
+            self.rects = grown
+        self.rects[game] = np.nan
+        self.rects[game, :len(rects)] = rects
+        self.obstacleCounts[game] = len(rects)
+        self.binned = False
+
+    def nextLevel(self, game):
+        """
+        A method to move a game on to its next level after its goal was hit, as levelManager does.
+        """
+        rng = self.rngs[game]
+        self.levelCounter[game] += 2 # Increase the level counter
+        self.packLevel[game] += 1 # Move on to the next level of the level pack, if there is one
+        self.goals[game] = (self.width - GOAL_OFFSET, rng.randint(50, self.height - 50), *GOAL_SIZE)
+        self.wind_speed[game] = rng.random() * self.levelCounter[game] / 4 # Choose the wind speed of the new level
+        self.wind_angle[game] = rng.randint(0, 360) # Choose the wind angle of the new level
+        self.makeLevel(game)
+        for i in range(3): # The game picks the colour of the projectile here, so draw it too to keep to the same seeds
+            rng.randint(100, 255)
+
+    def step(self, actions, max_vel=MAX_VEL):
+        """
+        A method to fire one shot in every game and fly them all until every shot has ended. actions is an array
+        with a row of (angle, power) per game. Returns a StepResult.
+        """
+        start = time.perf_counter()
+        actions = np.asarray(actions, dtype=float).reshape(self.count, 2)
+        vx, vy = launch_velocity(actions[:, 0], actions[:, 1])
+        self.volley.set_wind(self.wind_speed, self.wind_angle)
+        self.volley.fire(*self.start, vx, vy, max_vel)
+        if not self.binned: # Bin the obstacles once for every step until a game moves on to a new level
+            self.volley.set_obstacles(self.rects)
+            self.binned = True
+        outcomes = np.full(self.count, SHOT_ABORTED, dtype=np.uint8)
+        steps = np.full(self.count, self.max_steps, dtype=np.int64)
+        bounces = np.zeros(self.count, dtype=np.int32)
+        for i in range(self.max_steps):
+            if len(self.volley) == 0:
+                break
+            self.volley.step()
+            self.volley.collide(None, self.goals, self.width, self.height)
+            games, states, shot_bounces = self.volley.retire() # Finished shots leave the volley so they cost nothing more
+            outcomes[games] = OUTCOMES[states]
+            steps[games] = i + 1
+            bounces[games] = shot_bounces
+        bounces[self.volley.index[:len(self.volley)]] = self.volley.bounces[:len(self.volley)] # The aborted shots
+        hits = outcomes == SHOT_HIT
+        for game in np.flatnonzero(hits):
+            self.nextLevel(game)
+        return StepResult(self.get_observations(), hits.astype(float), outcomes, steps, bounces, time.perf_counter() - start)
+
+    def get_observations(self):
+        """
+        A method to return the observations of every game, an array with the columns of OBSERVATION.
+        """
+        return np.column_stack((self.goals, self.wind_speed, self.wind_angle, self.levelCounter, self.obstacleCounts)).astype(float)
+
+    def get_obstacles(self):
+        """
+        A method to return the obstacles of every game as a (games, obstacles, 4) array of (x, y, width, height)
+        rectangles, padded with rows of NaN. The floor, ceiling and wall come first.
+        """
+        return self.rects.copy()
+
+    def close(self):
+        """
+        A method to close the level pack, if there is one.
+        """
+        self.levelGenerator.close()
+        if self.levelPack is not None:
+            self.levelPack.close()
+            self.levelPack = None
+
+    def __enter__(self):
+        """
+        A method to use the environment in a with statement, which closes it at the end.
+        """
+        return self
+
+    def __exit__(self, *args):
+        """
+        A method to close the environment at the end of a with statement.
+        """
+        self.close()
+
+def run_shard(connection, count, options):
+    """
+    A function to run a shard of games in a worker process, doing what the parent asks through connection until
+    it is asked to close. This is a module level function so it can run in a worker process.
+    """
+    environment = ShotEnvironment(count, **options)
+    try:
+        while True:
+            command, argument = connection.recv()
+            if command == "reset":
+                connection.send(environment.reset(*argument))
+            elif command == "step":
+                connection.send(environment.step(argument))
+            elif command == "obstacles":
+                connection.send(environment.get_obstacles())
+            else:
+                break
+    except (EOFError, KeyboardInterrupt): # The parent has gone
+        pass
+    finally:
+        environment.close()
+        connection.close()
+
+class ShardedEnvironment:
+    """
+    A class to split many headless games between worker processes, each running a ShotEnvironment for its share of
+    the games. The shards step at the same time and their results are joined in order, so it is used like a
+    ShotEnvironment of all the games, and the same seeds give the same games however many workers there are.
+    """
+    def __init__(self, count, workers=None, **options):
+        """
+        Initialize count games split between workers processes (one per CPU by default). options are passed to
+        every ShotEnvironment.
+        """
+        self.count = count # The number of games
+        self.workers = max(1, min(workers or os.cpu_count() or 1, count)) # The number of worker processes
+        self.sizes = [len(shard) for shard in np.array_split(np.arange(count), self.workers)] # The number of games in each shard
+        self.splits = np.cumsum(self.sizes)[:-1] # Where the actions of each shard start
+        # Spawn fresh processes rather than forking, as the level generator does
+        context = multiprocessing.get_context("spawn")
+        self.connections = []
+        self.processes = []
+        for size in self.sizes:
+            parent, child = context.Pipe()
+            process = context.Process(target=run_shard, args=(child, size, options), daemon=True)
+            process.start()
+            child.close()
+            self.connections.append(parent)
+            self.processes.append(process)
+
+    def request(self, commands):
+        """
+        A method to send a command to every shard and return their answers, after all of them have started working.
+        """
+        for connection, command in zip(self.connections, commands):
+            connection.send(command)
+        return [connection.recv() for connection in self.connections]
+
+    def reset(self, seed=None, level=0):
+        """
+        A method to start every game again, as ShotEnvironment.reset does, and return the observations.
+        """
+        seeds = game_seeds(seed, self.count)
+        shards = np.split(np.array(seeds, dtype=object), self.splits)
+        return np.concatenate(self.request([("reset", (list(shard), level)) for shard in shards]))
+
+    def step(self, actions):
+        """
+        A method to fire one shot in every game, as ShotEnvironment.step does, with the shards working at the same time.
+        """
+        start = time.perf_counter()
+        actions = np.asarray(actions, dtype=float).reshape(self.count, 2)
+        results = self.request([("step", shard) for shard in np.split(actions, self.splits)])
+        return StepResult.concatenate(results, time.perf_counter() - start)
+
+    def get_obstacles(self):
+        """
+        A method to return the obstacles of every game, padded with rows of NaN as in ShotEnvironment.get_obstacles.
+        """
+        shards = self.request([("obstacles", None)] * self.workers)
+        rects = np.full((self.count, max(shard.shape[1] for shard in shards), 4), np.nan)
+        first = 0
+        for shard in shards:
+            rects[first:first + len(shard), :shard.shape[1]] = shard
+            first += len(shard)
+        return rects
+
+    def close(self):
+        """
+        A method to stop the worker processes.
+        """
+        for connection in self.connections:
+            try:
+                connection.send(("close", None))
+            except (BrokenPipeError, OSError): # The worker has already stopped
+                pass
+            connection.close()
+        for process in self.processes:
+            process.join(timeout=5)
+        self.connections = []
+        self.processes = []
+
+    def __enter__(self):
+        """
+        A method to use the environment in a with statement, which closes it at the end.
+        """
+        return self
+
+    def __exit__(self, *args):
+        """
+        A method to close the environment at the end of a with statement.
+        """
+        self.close()
+
+if __name__ == "__main__":
+    # Play random shots in many games and report how many shots an hour are simulated
+    def option(name, default):
+        return int(sys.argv[sys.argv.index(name) + 1]) if name in sys.argv else default
+    games = option("--games", 1000)
+    shots = option("--shots", 5)
+    workers = option("--workers", 1)
+    seed = option("--seed", 0)
+    settings = {"solvable": "--solvable" in sys.argv}
+    environment = ShardedEnvironment(games, workers, **settings) if workers > 1 else ShotEnvironment(games, **settings)
+    with environment:
+        start = time.perf_counter()
+        environment.reset(seed)
+        print(f"Made {games} levels in {time.perf_counter() - start:.2f}s")
+        rng = np.random.default_rng(seed)
+        outcomes = np.zeros(len(OUTCOME_NAMES), dtype=np.int64)
+        start = time.perf_counter()
+        for shot in range(shots):
+            actions = np.column_stack((rng.uniform(-30, 80, games), rng.uniform(20, 100, games)))
+            result = environment.step(actions)
+            outcomes += np.bincount(result.outcomes, minlength=len(outcomes))
+            print(f"Shot {shot + 1}: {int(result.rewards.sum())} hits, {result.steps.mean():.0f} steps on average, {result.elapsed:.2f}s")
+        elapsed = time.perf_counter() - start
+    print(", ".join(f"{count} {OUTCOME_NAMES[outcome]}" for outcome, count in enumerate(outcomes)))
+    print(f"{games * shots} shots in {elapsed:.2f}s, {games * shots / elapsed * 3600:,.0f} shots an hour")
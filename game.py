@@ -1,18 +1,205 @@
+import time # Import the time module
+IMPORT_START = time.perf_counter() # When this module started to be imported, for the startup report
 import math # Import the math module
 import pygame # Import the pygame module
 import random # Import the random module
 import os # Import the os module
 import json # Import the json module
+import csv # Import the csv module
 import datetime # Import the datetime module
+import threading # Import the threading module
+import queue # Import the queue module used by the logger
+import atexit # Import the atexit module used to flush the log when the program ends
+from collections import OrderedDict # Import the ordered dictionary used by the asset cache
+import numpy as np # Import the numpy module
+from simulation import TrajectoryPredictor, Volley, VOLLEY_FLYING # Import the predictor that works out the aim preview in a worker process and the volley of many projectiles
+from levels import LevelGenerator # Import the generator of solvable levels
+from levelpack import LevelPack # Import the level packs
+from replay import Replay, ReplayLevel, ReplayShot, SHOT_ABORTED, SHOT_HIT, SHOT_OUT, SHOT_REST # Import the replay recording
+from telemetry import Telemetry # Import the shot telemetry
+IMPORT_TIME = time.perf_counter() - IMPORT_START # The time the imports took
+
+# Default time step of each integrator. Euler keeps the original 0.01 s step, the
+# higher order integrators reach the same landing point with far fewer steps.
+INTEGRATOR_DT = {"euler": 0.01, "semi_implicit": 0.01, "rk4": 0.1, "rk45": 0.05}
+
+# Butcher tableau of the Dormand-Prince RK45 method used by the adaptive integrator
+DORMAND_PRINCE_A = (
+    (1/5,),
+    (3/40, 9/40),
+    (44/45, -56/15, 32/9),
+    (19372/6561, -25360/2187, 64448/6561, -212/729),
+    (9017/3168, -355/33, 46732/5247, 49/176, -5103/18656),
+    (35/384, 0, 500/1113, 125/192, -2187/6784, 11/84),
+)
+DORMAND_PRINCE_B5 = (35/384, 0, 500/1113, 125/192, -2187/6784, 11/84, 0) # Fifth order weights
+DORMAND_PRINCE_E = (71/57600, 0, -71/16695, 71/1920, -17253/339200, 22/525, -1/40) # Fifth minus fourth order weights
+
+# The assets the game uses during play. They are loaded once when the game starts so nothing is read from disk while playing.
+# The images are needed for the first frame, the sounds are decoded in the background while the game starts.
+IMAGE_ASSETS = ["cannonTube.png", "background.png"]
+SOUND_ASSETS = ["ball1.mp3", "ball2.mp3", "ball3.mp3", "ball4.mp3", "ball5.mp3", "ball6.mp3", "dingup.mp3", "error.mp3", "amb1.mp3"]
+GAME_ASSETS = SOUND_ASSETS + IMAGE_ASSETS
+SOUND_EXTENSIONS = (".mp3", ".ogg", ".wav") # File types loaded as sounds
+IMAGE_EXTENSIONS = (".png", ".jpg", ".bmp") # File types loaded as images
+
+class AssetManager:
+    """
+    A class to load sounds, images and fonts once and keep them in memory.
+    Assets are loaded the first time they are asked for (or all at once with preload) and the least recently
+    used asset is removed when the cache holds more than max_items.
+    """
+    def __init__(self, folder="assets", max_items=None):
+        """
+        Initialize an empty cache for the assets in a folder.
+        """
+        self.folder = folder # The folder the assets are loaded from
+        self.max_items = max_items # The largest number of assets kept in memory, None for no limit
+        self.cache = OrderedDict() # A dictionary from (kind, key) to the loaded asset, least recently used first
+        self.hits = 0 # The number of times an asset was already loaded
+        self.misses = 0 # The number of times an asset had to be loaded
+        self.evictions = 0 # The number of assets removed to keep under max_items
+        self.load_time = 0 # The total time in seconds spent loading assets
+        self.lock = threading.Lock() # Lets assets be loaded by a background thread while the game uses the cache
+
+    def get_path(self, name):
+        """
+        A method to return the path of an asset file.
+        """
+        return os.path.join(self.folder, name)
+
+    def get(self, kind, key, loader):
+        """
+        A method to return a cached asset, calling loader to load it if it is not in the cache.
+        """
+        with self.lock:
+            if (kind, key) in self.cache: # The asset is already loaded
+                self.hits += 1
+                self.cache.move_to_end((kind, key)) # Mark the asset as the most recently used
+                return self.cache[(kind, key)]
+            self.misses += 1
+        start = time.perf_counter()
+        asset = loader() # Load the asset outside the lock so a slow load does not hold up other threads
+        with self.lock:
+            self.load_time += time.perf_counter() - start
+            if (kind, key) in self.cache: # Another thread loaded it at the same time, so use the first one
+                return self.cache[(kind, key)]
+            self.cache[(kind, key)] = asset
+            if self.max_items is not None and len(self.cache) > self.max_items: # Remove the least recently used asset
+                self.cache.popitem(last=False)
+                self.evictions += 1
+        return asset
+
+    def get_sound(self, name):
+        """
+        A method to return a decoded sound from the assets folder.
+        """
+        return self.get("sound", name, lambda: pygame.mixer.Sound(self.get_path(name)))
+
+    def get_image(self, name):
+        """
+        A method to return an image from the assets folder, converted to the display format when a display exists.
+        """
+        def load_image():
+            image = pygame.image.load(self.get_path(name))
+            if pygame.display.get_surface() is not None: # Converting makes blitting much faster but needs a display
+                image = image.convert_alpha()
+            return image
+        return self.get("image", name, load_image)
+
+    def get_font(self, name, size):
+        """
+        A method to return a system font of the given size.
+        """
+        return self.get("font", (name, size), lambda: pygame.font.SysFont(name, size))
+
+    def preload(self, names=None):
+        """
+        A method to load a list of assets, or every sound and image in the folder if no list is given.
+        """
+        if names is None:
+            names = sorted(os.listdir(self.folder))
+        for name in names:
+            if name.lower().endswith(SOUND_EXTENSIONS):
+                self.get_sound(name)
+            elif name.lower().endswith(IMAGE_EXTENSIONS):
+                self.get_image(name)
+
+    def get_report(self):
+        """
+        A method to return a summary of the cache: items, hits, misses, hit rate, evictions and load time.
+        """
+        requests = self.hits + self.misses
+        return {
+            "items": len(self.cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / requests if requests else 0,
+            "evictions": self.evictions,
+            "load_time_ms": self.load_time * 1000,
+        }
+
+class TrajectoryBuffer:
+    """
+    A class to store the most recent points of a trajectory in a fixed size array.
+    Every point is written twice, capacity apart, so the newest points are always
+    one contiguous slice of the array and can be drawn without copying them.
+    """
+    def __init__(self, capacity=1000):
+        """
+        Initialize the buffer with the number of points it can hold.
+        """
+        self.capacity = capacity # The largest number of points kept
+        self.points = np.zeros((capacity * 2, 2)) # Two copies of the ring so the newest points are always contiguous
+        self.start = 0 # The index of the oldest point
+        self.length = 0 # The number of points stored
+
+    def append(self, point):
+        """
+        A method to add a point, overwriting the oldest point when the buffer is full.
+        """
+        index = (self.start + self.length) % self.capacity # The ring index to write the new point to
+        self.points[index] = point
+        self.points[index + self.capacity] = point
+        if self.length < self.capacity:
+            self.length += 1
+        else:
+            self.start = (self.start + 1) % self.capacity # The oldest point has been overwritten
+
+    def clear(self):
+        """
+        A method to remove every point from the buffer.
+        """
+        self.start = 0
+        self.length = 0
+
+    def view(self):
+        """
+        A method to return the stored points, oldest first, as a view of the array (no copy is made).
+        """
+        return self.points[self.start:self.start + self.length]
+
+    def __len__(self):
+        """
+        A method to return the number of points stored.
+        """
+        return self.length
+
+    def __getitem__(self, index):
+        """
+        A method to return a point or a slice of points, oldest first.
+        """
+        return self.view()[index]
 
 class Projectile: # Projectile class
     """
     A class to simulate the flight of a projectile.
     """
-    def __init__(self, x0, y0, vx0, vy0, mass, Cd, B2, gravity):
+    def __init__(self, x0, y0, vx0, vy0, mass, Cd, B2, gravity, trajectory_capacity=1000):
         """
         Initialize the projectile with its initial position, velocity, mass, drag
-        coefficient, and the constant for air resistance.
+        coefficient, and the constant for air resistance. trajectory_capacity is
+        the number of trajectory points kept for drawing.
         """
         self.x = x0 # Initial x-position
         self.y = y0 # Initial y-position
@@ -31,9 +218,11 @@ class Projectile: # Projectile class
         self.distance_traveled = 0 # The distance traveled by the 
         self.distance_traveled_x = 0 # The distance traveled by the projectile in the x-direction
         self.distance_traveled_y = 0 # The distance traveled by the projectile in the y-direction
+        self.last_x = x0 # The x-position at the start of the last step, used for swept collision tests
+        self.last_y = y0 # The y-position at the start of the last step, used for swept collision tests
 
-        # Initialize the list of points in the projectile's trajectory
-        self.trajectory = [] # A list of points that follow the projectile path
+        # Initialize the buffer of points in the projectile's trajectory
+        self.trajectory = TrajectoryBuffer(trajectory_capacity) # The most recent points that follow the projectile path
 
         # Set the time step
         self.dt = 0.01 # Time step is how often the position of the projectile is updated in the simulation (not the same as the frame rate)
@@ -46,9 +235,23 @@ class Projectile: # Projectile class
         self.ax = self.Fx / self.m # The x-component of the acceleration of the projectile
         self.ay = self.Fy / self.m # The y-component of the acceleration of the projectile
 
-        # Initialize the lists of positions
-        self.xs = [self.x] # A list of the x-positions of the projectile
-        self.ys = [self.y] # A list of the y-positions of the projectile
+        # Set up the integrators that update_position can use
+        self.integrators = {
+            "euler": self.step_euler, # Explicit Euler, the original integrator
+            "semi_implicit": self.step_semi_implicit, # Semi-implicit Euler, same cost as Euler but more stable
+            "rk4": self.step_rk4, # Fourth order Runge-Kutta with a fixed time step
+            "rk45": self.step_rk45, # Adaptive Dormand-Prince with error control
+        }
+        self.integrator_dt = INTEGRATOR_DT # The default time step of each integrator
+        self.integrator = "euler" # The integrator used by update_position
+        self.tolerance = 0.001 # The largest error allowed per step by the adaptive integrator
+        self.min_dt = 0.0001 # The smallest time step the adaptive integrator can use
+        self.max_dt = 0.2 # The largest time step the adaptive integrator can use
+        self.last_dt = self.dt # The size of the last step taken by the adaptive integrator
+        self.sleep_speed = 0.5 # Below this speed the projectile counts as still
+        self.sleep_time = 1.0 # The simulated time in seconds the projectile has to stay still before it is put to sleep
+        self.still_time = 0 # The simulated time the projectile has been still for
+        self.sleeping = False # True once the projectile has come to rest, after which it is not moved or collided any more
 
     def set_wind(self, wind_speed, wind_angle):
         """
@@ -65,6 +268,90 @@ class Projectile: # Projectile class
         """
         self.x = x # Set the x-position of the projectile to the value of the parameter x
         self.y = y # Set the y-position of the projectile to the value of the parameter y
+        self.last_x = x # The projectile was placed here rather than moved, so there is no path to sweep
+        self.last_y = y
+
+    def set_integrator(self, integrator, dt=None):
+        """
+        A method to choose the integrator used by update_position and optionally its time step.
+        """
+        if integrator not in self.integrators: # Check the integrator is one that exists
+            raise ValueError(f"Unknown integrator: {integrator}")
+        self.integrator = integrator # Set the name of the integrator
+        self.dt = dt if dt is not None else self.integrator_dt[integrator] # Use the default time step of the integrator if none is given
+
+    def get_acceleration(self, vx, vy):
+        """
+        A method to return the acceleration of the projectile for a given velocity.
+        """
+        # Calculate the air resistance force
+        Fx = -0.5 * self.Cd * self.B2 * vx * vx # A calculation of the x-component of the air resistance force
+        Fy = -0.5 * self.Cd * self.B2 * vy * vy + self.gravity  # Reverse the sign of the y-component of the velocity so that the y-axis points up and is displayed correctly on the screen
+
+        #Add wind speed to the air resistance force
+        Fx = Fx + self.wind_x
+        Fy = Fy - self.wind_y
+        return Fx / self.m, Fy / self.m # Return the x-component and y-component of the acceleration
+
+    def get_derivatives(self, x, y, vx, vy):
+        """
+        A method to return the rate of change of the position and velocity of the projectile.
+        The y-axis of the screen points down so y and vy change with the opposite sign.
+        """
+        ax, ay = self.get_acceleration(vx, vy)
+        return vx, -vy, ax, -ay
+
+    def step_euler(self):
+        """
+        A method to take one explicit Euler step (the original integrator).
+        """
+        self.x = self.x + self.vx * self.dt # A calculation of the new x-position of the projectile
+        self.y = self.y - self.vy * self.dt # Reverse the sign of the y-coordinate (same reason as above)
+        self.vx = self.vx + self.ax * self.dt # A calculation of the new x-velocity of the projectile
+        self.vy = self.vy - self.ay * self.dt  # Reverse the sign of the y-velocity (same reason as above)
+
+    def step_semi_implicit(self):
+        """
+        A method to take one semi-implicit (symplectic) Euler step. The velocity is updated first and the new velocity moves the projectile.
+        """
+        self.vx = self.vx + self.ax * self.dt
+        self.vy = self.vy - self.ay * self.dt
+        self.x = self.x + self.vx * self.dt
+        self.y = self.y - self.vy * self.dt
+
+    def step_rk4(self):
+        """
+        A method to take one classic fourth order Runge-Kutta step.
+        """
+        dt = self.dt
+        state = (self.x, self.y, self.vx, self.vy)
+        k1 = self.get_derivatives(*state)
+        k2 = self.get_derivatives(*[s + dt / 2 * k for s, k in zip(state, k1)])
+        k3 = self.get_derivatives(*[s + dt / 2 * k for s, k in zip(state, k2)])
+        k4 = self.get_derivatives(*[s + dt * k for s, k in zip(state, k3)])
+        self.x, self.y, self.vx, self.vy = [s + dt / 6 * (a + 2 * b + 2 * c + d) for s, a, b, c, d in zip(state, k1, k2, k3, k4)]
+
+    def step_rk45(self):
+        """
+        A method to take one adaptive Dormand-Prince RK45 step.
+        The step is retried with a smaller dt until the error estimate is within tolerance, then dt is grown or shrunk for the next step.
+        """
+        state = (self.x, self.y, self.vx, self.vy)
+        while True:
+            dt = self.dt
+            k = [self.get_derivatives(*state)]
+            for row in DORMAND_PRINCE_A: # Work out the stages of the step
+                k.append(self.get_derivatives(*[s + dt * sum(a * kj[i] for a, kj in zip(row, k)) for i, s in enumerate(state)]))
+            new_state = [s + dt * sum(b * kj[i] for b, kj in zip(DORMAND_PRINCE_B5, k)) for i, s in enumerate(state)] # Fifth order solution
+            error = max(abs(dt * sum(e * kj[i] for e, kj in zip(DORMAND_PRINCE_E, k))) for i in range(4)) # Difference between the fourth and fifth order solutions
+            # Scale the step size towards the largest one that keeps the error within tolerance
+            factor = 5.0 if error == 0 else min(5.0, max(0.2, 0.9 * (self.tolerance / error) ** 0.2))
+            if error <= self.tolerance or dt <= self.min_dt:
+                self.x, self.y, self.vx, self.vy = new_state
+                self.dt = min(self.max_dt, max(self.min_dt, dt * factor))
+                self.last_dt = dt # Remember the size of the step that was taken
+                return
+            self.dt = max(self.min_dt, dt * factor)
 
     def update_position(self):
         # Calculate the air resistance force
@@ -79,21 +366,41 @@ class Projectile: # Projectile class
         self.ax = self.Fx / self.m # A calculation of the x-component of the acceleration of the projectile
         self.ay = self.Fy / self.m # A calculation of the y-component of the acceleration of the projectile
 
-        # Update the position and velocity of the projectile
-        self.x = self.x + self.vx * self.dt # A calculation of the new x-position of the projectile
-        self.y = self.y - self.vy * self.dt # Reverse the sign of the y-coordinate (same reason as above)
-        self.vx = self.vx + self.ax * self.dt # A calculation of the new x-velocity of the projectile
-        self.vy = self.vy - self.ay * self.dt  # Reverse the sign of the y-velocity (same reason as above)
+        self.last_x, self.last_y = self.x, self.y # Remember the position before the step
+
+        # Update the position and velocity of the projectile with the chosen integrator
+        self.integrators[self.integrator]()
 
-        # Add the new position of the projectile to the list of positions
-        self.xs.append(self.x) # Add the new x-position of the projectile to the list of x-positions
-        self.ys.append(self.y) # Add the new y-position of the projectile to the list of y-positions
         # Add the current position of the projectile to the list of points in its trajectory
         self.trajectory.append((self.x, self.y)) # Add the current position of the projectile to the list of points in its trajectory
         # Update the distance traveled by the projectile
-        self.distance_traveled = self.distance_traveled + math.sqrt((self.xs[-1] - self.xs[-2])**2 + (self.ys[-1] - self.ys[-2])**2) # Update the distance traveled by the projectile
-        self.distance_traveled_x = self.distance_traveled_x + math.sqrt((self.xs[-1] - self.xs[-2])**2) # Update the distance traveled by the projectile in the x-direction
-        self.distance_traveled_y = self.distance_traveled_y + math.sqrt((self.ys[-1] - self.ys[-2])**2) # Update the distance traveled by the projectile in the y-direction
+        self.distance_traveled = self.distance_traveled + math.sqrt((self.x - self.last_x)**2 + (self.y - self.last_y)**2) # Update the distance traveled by the projectile
+        self.distance_traveled_x = self.distance_traveled_x + abs(self.x - self.last_x) # Update the distance traveled by the projectile in the x-direction
+        self.distance_traveled_y = self.distance_traveled_y + abs(self.y - self.last_y) # Update the distance traveled by the projectile in the y-direction
+
+    def update_sleep(self):
+        """
+        A method to put the projectile to sleep once it has been still for sleep_time seconds. Called after each step
+        and its collisions. Returns True if the projectile is asleep.
+        """
+        if self.sleeping:
+            return True
+        if self.vx * self.vx + self.vy * self.vy < self.sleep_speed * self.sleep_speed:
+            self.still_time += self.last_dt if self.integrator == "rk45" else self.dt # The adaptive integrator changes dt after each step
+            if self.still_time >= self.sleep_time:
+                self.sleeping = True
+                self.vx = 0
+                self.vy = 0
+        else:
+            self.still_time = 0 # Moving again, so start counting from the beginning
+        return self.sleeping
+
+    def wake(self):
+        """
+        A method to wake the projectile so it can be fired again.
+        """
+        self.sleeping = False
+        self.still_time = 0
 
     def set_vx_vy(self, vx, vy):
         """
@@ -118,6 +425,12 @@ class Projectile: # Projectile class
         """
         return self.x, self.y # Return the current position of the projectile as a tuple
 
+    def get_last_position(self):
+        """
+        A method to return the position of the projectile at the start of the last step.
+        """
+        return self.last_x, self.last_y
+
     def get_velocity(self):
         """
         A method to return the current velocity of the projectile.
@@ -144,13 +457,47 @@ class Goal:
         """
         pygame.draw.rect(screen, self.colour, (self.x, self.y, self.width, self.height)) # Draw the goal on the screen as a rectangle with the colour, position, and size specified by the attributes of the goal object
 
+    def get_time_of_impact(self, projectile, width=0, height=0):
+        """
+        A method to sweep a box of the given size along the last step of the projectile and find when it first touches the rectangle.
+        Returns a tuple of the fraction of the step (0 to 1) and the axis that was hit ("x" or "y"), or None if there is no hit.
+        Uses the slab method against the rectangle grown by half the size of the box.
+        """
+        x0, y0 = projectile.get_last_position() # Where the projectile started the step
+        x1, y1 = projectile.get_position() # Where the projectile ended the step
+        t_enter = -math.inf # The latest time the path enters a slab
+        t_exit = math.inf # The earliest time the path leaves a slab
+        axis = None # The axis of the side that was hit
+        for start, end, low, high, name in ((x0, x1, self.x - width / 2, self.x + self.width + width / 2, "x"),
+                                            (y0, y1, self.y - height / 2, self.y + self.height + height / 2, "y")):
+            delta = end - start
+            if delta == 0:
+                if start <= low or start >= high: # Moving parallel to this slab and outside it, so there can be no hit
+                    return None
+                continue
+            t1 = (low - start) / delta
+            t2 = (high - start) / delta
+            if t1 > t2:
+                t1, t2 = t2, t1
+            if t1 > t_enter:
+                t_enter = t1
+                axis = name
+            t_exit = min(t_exit, t2)
+        # No hit if the slabs do not overlap in time, the step started inside the rectangle, or the hit is after the step
+        if axis is None or t_enter >= t_exit or t_enter < 0 or t_enter > 1:
+            return None
+        return t_enter, axis
+
     def check_collision(self, projectile):
         """
         A method to check if the projectile has collided with the goal.
+        The path of the last step is also swept so a fast projectile cannot pass through the goal between two steps.
         """
         x, y = projectile.get_position() # Get the position of the projectile
         if x > self.x and x < self.x + self.width and y > self.y and y < self.y + self.height: # Check if the x-position of the projectile is between the left and right sides of the goal and if the y-position of the projectile is between the top and bottom of the goal
             return True # Return True if the projectile has collided with the goal
+        elif self.get_time_of_impact(projectile) is not None: # Check if the projectile passed through the goal during the last step
+            return True
         else:
             return False # Return False if the projectile has not collided with the goal
 
@@ -166,6 +513,7 @@ class Obstacle(Goal):
         super().__init__(x, y, width, height) # Call the constructor of the Goal class
         self.colour = (255, 100, 100) # Set the colour of the obstacle to a light red (pre defined colour and not a parameter)
         self.bounceAbsorption = 0.7 # Set the absorption multiplier of the obstacle
+        self.restSpeed = 1.0 # A projectile landing on top of the obstacle slower than this stops on it rather than bouncing
         self.friction = 0.05 # Set the friction multiplier of the obstacle
     def get_coordinates(self):
 
@@ -174,9 +522,26 @@ class Obstacle(Goal):
         """
         return self.x, self.y, self.x + self.width, self.y + self.height # Return the coordinates of the obstacle as a tuple
 
-    def check_collision(self, projectile, projectileImage):
+    def overlaps(self, x, y, width, height):
+        """
+        A method to check if a box centred on x, y overlaps the obstacle without changing anything.
+        """
+        return abs(x - (self.x + self.width / 2)) < (width + self.width) / 2 and abs(y - (self.y + self.height / 2)) < (height + self.height) / 2
+
+    def bounce_y(self, vy, p_y):
+        """
+        A method to return the y-velocity after a hit on the top or bottom of the obstacle. A slow landing on the top
+        is a resting contact: the projectile stops on the obstacle instead of bouncing a tiny amount every step.
+        """
+        if vy < 0 and -vy < self.restSpeed and p_y < self.y + self.height / 2: # Falling slowly onto the top (the y-velocity points up)
+            return 0
+        return -vy * self.bounceAbsorption
+
+    def resolve_collision(self, projectile, projectileImage):
         """
-        A method to check if the projectile has collided with the obstacle using Separating Axis Theorem.
+        A method to check if the projectile has collided with the obstacle using Separating Axis Theorem and bounce it off.
+        Returns the speed of the projectile before the bounce, or None if there was no collision.
+        Nothing else is changed, so shots can be simulated without a window or sound.
         """
         p_x, p_y = projectile.get_position()
         p_width, p_height = projectileImage.get_size()
@@ -186,69 +551,338 @@ class Obstacle(Goal):
         o_width = o_x2 - o_x1
         o_height = o_y2 - o_y1
         
-        # Calculate the overlapping distance along the X and Y axes
-        overlap_x = (p_width + o_width) / 2 - abs(p_x - o_x)
-        overlap_y = (p_height + o_height) / 2 - abs(p_y - o_y)
-
-        # If there is no overlap along either axis, then there is no collision
-        if overlap_x <= 0 or overlap_y <= 0:
-            return False
-
-        # Determine which axis has the smallest overlap and resolve the collision along that axis
-        if overlap_x < overlap_y:
-            if p_x < o_x:
-                p_x = o_x1 - p_width / 2
-            else:
-                p_x = o_x2 + p_width / 2
+        # Sweep the last step first so a fast projectile is stopped where it first touched the obstacle
+        impact = self.get_time_of_impact(projectile, p_width, p_height)
+        if impact is not None:
+            t, axis = impact
+            last_x, last_y = projectile.get_last_position()
+            p_x = last_x + (p_x - last_x) * t # Move the projectile back to the point of impact
+            p_y = last_y + (p_y - last_y) * t
             vx, vy = projectile.get_velocity()
-            vx = -vx * self.bounceAbsorption
-            vy = vy * (1 - self.friction)
+            if axis == "x":
+                vx = -vx * self.bounceAbsorption
+                vy = vy * (1 - self.friction)
+            else:
+                vy = self.bounce_y(vy, last_y)
+                vx = vx * (1 - self.friction)
         else:
-            if p_y < o_y:
-                p_y = o_y1 - p_height / 2
+            # Calculate the overlapping distance along the X and Y axes
+            overlap_x = (p_width + o_width) / 2 - abs(p_x - o_x)
+            overlap_y = (p_height + o_height) / 2 - abs(p_y - o_y)
+
+            # If there is no overlap along either axis, then there is no collision
+            if overlap_x <= 0 or overlap_y <= 0:
+                return None
+
+            # Determine which axis has the smallest overlap and resolve the collision along that axis
+            if overlap_x < overlap_y:
+                if p_x < o_x:
+                    p_x = o_x1 - p_width / 2
+                else:
+                    p_x = o_x2 + p_width / 2
+                vx, vy = projectile.get_velocity()
+                vx = -vx * self.bounceAbsorption
+                vy = vy * (1 - self.friction)
             else:
-                p_y = o_y2 + p_height / 2
-            vx, vy = projectile.get_velocity()
-            vy = -vy * self.bounceAbsorption
-            vx = vx * (1 - self.friction)
-       
-        #play ball sound with random volume
-        ballSound = pygame.mixer.Sound(f"assets\\ball{random.randint(1,6)}.mp3")
-        vol = (projectile.get_velocity()[0]**2 + projectile.get_velocity()[1]**2)**0.5/100 - 0.05
-        if vol < 0:
-            vol = 0
-        ballSound.set_volume((vol)) #set volume of sound
-        game.BallChannelCounter += 1 #play sound on different channel each time to avoid sound overlapping
-        if game.BallChannelCounter > 40: # reset channel counter to 5 to avoid channel overflow
-            game.BallChannelCounter = 5
-        channel = pygame.mixer.Channel(game.BallChannelCounter) #set channel
-        if vol != 0:
-            game.bounceCounter += 1 #count number of bounces
-            try:
-                if channel.get_busy(): #if channel is busy
-                    self.i += 1
+                if p_y < o_y:
+                    p_y = o_y1 - p_height / 2
                 else:
-                    channel.play(ballSound) #play sound
-            except:
-                pass
+                    p_y = o_y2 + p_height / 2
+                vx, vy = projectile.get_velocity()
+                vy = self.bounce_y(vy, projectile.get_position()[1])
+                vx = vx * (1 - self.friction)
+
+        speed = (projectile.get_velocity()[0]**2 + projectile.get_velocity()[1]**2)**0.5 # The speed the projectile hit the obstacle at
         # Update the position and velocity of the projectile after the collision
         projectile.set_vx_vy(vx, vy)
         projectile.set_position(p_x, p_y)
+        return speed
+
+    def check_collision(self, projectile, projectileImage, context=None):
+        """
+        A method to check if the projectile has collided with the obstacle, bounce it off and ask for a bounce sound.
+        context is the game, or anything else with a mixer and a bounceCounter. Without one the projectile is only bounced.
+        """
+        speed = self.resolve_collision(projectile, projectileImage)
+        if speed is None:
+            return False
+        if context is not None:
+            vol = bounce_volume(speed)
+            if vol != 0:
+                context.bounceCounter += 1 #count number of bounces
+            context.mixer.request("bounce", vol) # Ask for a bounce sound, the mixer decides once per frame if it is played
         return True
 
+def bounce_volume(speed):
+    """
+    A function to work out the volume of a bounce sound from the speed of the projectile. Bounces with no volume are not counted.
+    """
+    vol = speed/100 - 0.05
+    if vol < 0:
+        vol = 0
+    return vol
+
+def find_nearby(projectile, projectileImage, obstacleGrid):
+    """
+    A function to find the obstacles the projectile may have touched during its last step, in the order it reached them.
+    """
+    p_width, p_height = projectileImage.get_size() # Get the size of the projectile
+    last_x, last_y = projectile.get_last_position() # Get the start of the last step so obstacles along the whole path are found
+    nearby = obstacleGrid.query((last_x + projectile.x) / 2, (last_y + projectile.y) / 2, abs(projectile.x - last_x) + p_width, abs(projectile.y - last_y) + p_height)
+    if len(nearby) > 1 and (last_x, last_y) != projectile.get_position(): # Resolve the obstacle that was hit first along the path before the others
+        impacts = {id(obstacle): obstacle.get_time_of_impact(projectile, p_width, p_height) for obstacle in nearby}
+        nearby.sort(key=lambda obstacle: impacts[id(obstacle)][0] if impacts[id(obstacle)] else 2) # Obstacles that were not swept through go last
+    return nearby
+
+class Voice:
+    """
+    A class to hold a mixer channel and what is playing on it.
+    """
+    def __init__(self, channel):
+        """
+        Initialize the voice with its channel.
+        """
+        self.channel = channel # The pygame mixer channel
+        self.priority = 0 # The priority of the sound playing on the channel
+        self.started = 0 # When the sound started
+
+class SoundEvent:
+    """
+    A class to hold the settings of a kind of sound, such as a bounce.
+    """
+    def __init__(self, sounds, cooldown=0, priority=0, min_volume=0):
+        """
+        Initialize the event with the sounds it picks from and how often and how quietly it may play.
+        """
+        self.sounds = sounds # The names of the sounds, one is picked at random each time
+        self.cooldown = cooldown # The shortest time in seconds between two plays
+        self.priority = priority # Higher priority sounds take the voices of lower priority ones
+        self.min_volume = min_volume # Quieter requests are not played at all
+        self.last_played = -math.inf # When the event was last played
+        self.pending = None # The loudest volume asked for since the last update, or None
+
+class SoundMixer:
+    """
+    A class to play sound effects on a fixed pool of mixer channels (voices).
+    The physics only asks for sounds with request, which just remembers the loudest request of each event.
+    Once per frame update plays them: requests that are too quiet or too soon after the last play of the
+    same event are dropped, and when every voice is busy the lowest priority sound is stopped to make room.
+    """
+    def __init__(self, assets, voices=16, first_channel=5):
+        """
+        Initialize the mixer. The channels are only set up when start is called.
+        """
+        self.assets = assets # The asset manager the sounds are loaded from
+        self.voice_count = voices # The number of channels in the pool
+        self.first_channel = first_channel # The channels below this are left for other sounds, such as the ambient loop
+        self.voices = [] # The voices of the pool
+        self.events = {} # The settings of each event by name
+        self.random = random.Random() # The mixer has its own random generator so choosing sounds does not change the levels
+        self.enabled = False # False until the channels are set up, or if there is no audio device
+        self.stats = {"requests": 0, "played": 0, "culled": 0, "cooldown": 0, "coalesced": 0, "stolen": 0, "dropped": 0}
+
+    def start(self):
+        """
+        A method to set up the channels of the pool.
+        """
+        try:
+            pygame.mixer.set_num_channels(self.first_channel + self.voice_count)
+            self.voices = [Voice(pygame.mixer.Channel(self.first_channel + i)) for i in range(self.voice_count)]
+            self.enabled = True
+        except pygame.error: # No audio device, so the game runs without sound effects
+            self.enabled = False
+
+    def add_event(self, name, sounds, cooldown=0, priority=0, min_volume=0):
+        """
+        A method to add a kind of sound that can be requested by name.
+        """
+        self.events[name] = SoundEvent(sounds, cooldown, priority, min_volume)
+
+    def request(self, name, volume=1.0):
+        """
+        A method to ask for an event to be played at the next update. Only the loudest request of each event is kept.
+        """
+        event = self.events[name]
+        self.stats["requests"] += 1
+        if event.pending is not None:
+            self.stats["coalesced"] += 1
+            if volume <= event.pending:
+                return
+        event.pending = volume
+
+    def get_voice(self, priority):
+        """
+        A method to return a free voice, or the voice playing the lowest priority sound if it is not above the
+        given priority, or None.
+        """
+        steal = None
+        for voice in self.voices:
+            if not voice.channel.get_busy():
+                return voice
+            if voice.priority <= priority and (steal is None or (voice.priority, voice.started) < (steal.priority, steal.started)):
+                steal = voice # The lowest priority sound, the oldest one if there is more than one
+        if steal is not None:
+            self.stats["stolen"] += 1
+        return steal
+
+    def update(self, now=None):
+        """
+        A method to play the sounds requested since the last update. Called once per frame.
+        """
+        now = time.perf_counter() if now is None else now
+        for event in self.events.values():
+            volume, event.pending = event.pending, None
+            if volume is None:
+                continue
+            if volume < event.min_volume or volume <= 0: # Too quiet to be heard
+                self.stats["culled"] += 1
+                continue
+            if now - event.last_played < event.cooldown: # Played too recently
+                self.stats["cooldown"] += 1
+                continue
+            if not self.enabled:
+                continue
+            priority = event.priority + volume # Louder sounds of the same event win
+            voice = self.get_voice(priority)
+            if voice is None: # Every voice is playing something more important
+                self.stats["dropped"] += 1
+                continue
+            voice.channel.stop()
+            voice.channel.play(self.assets.get_sound(self.random.choice(event.sounds))) # The sound is shared so the volume is set on the channel
+            voice.channel.set_volume(min(volume, 1))
+            voice.priority = priority
+            voice.started = now
+            event.last_played = now
+            self.stats["played"] += 1
+
+    def get_report(self):
+        """
+        A method to return how many sounds were requested, played and dropped for each reason.
+        """
+        return dict(self.stats)
+
+class ObstacleGrid:
+    """
+    A class to find the obstacles near a point using a uniform grid (the broad-phase of collision detection).
+    Each obstacle is stored in every cell it covers so a query only has to look at the cells around the projectile.
+    """
+    def __init__(self, cell_size=100):
+        """
+        Initialize an empty grid with the size of its cells in pixels.
+        """
+        self.cell_size = cell_size # The width and height of a cell in pixels
+        self.cells = {} # A dictionary from (column, row) to a list of the indices of the obstacles in the cell
+        self.obstacles = [] # The obstacles the indices refer to
+
+    def get_cell(self, x, y):
+        """
+        A method to return the (column, row) of the cell containing a point.
+        """
+        return math.floor(x / self.cell_size), math.floor(y / self.cell_size)
+
+    def build(self, obstacles):
+        """
+        A method to rebuild the grid from a list of obstacles or an ObstacleSet.
+        The cells are worked out for every obstacle at once with array operations, so no Obstacle objects are needed
+        and a level with tens of thousands of obstacles is ready in milliseconds.
+        """
+        self.obstacles = obstacles
+        if isinstance(obstacles, ObstacleSet):
+            rects = np.asarray(obstacles.rects, dtype=float)
+        else:
+            rects = np.array([(o.x, o.y, o.width, o.height) for o in obstacles], dtype=float).reshape(-1, 4)
+        if len(rects) == 0: # No obstacles, so every cell is empty
+            self.cells = {}
+            return
+        col1 = np.floor(rects[:, 0] / self.cell_size).astype(np.int64) # The cells of the top left and bottom right corners, as get_cell
+        row1 = np.floor(rects[:, 1] / self.cell_size).astype(np.int64)
+        cols = np.floor((rects[:, 0] + rects[:, 2]) / self.cell_size).astype(np.int64) - col1 + 1 # The number of columns and rows each obstacle covers
+        rows = np.floor((rects[:, 1] + rects[:, 3]) / self.cell_size).astype(np.int64) - row1 + 1
+        counts = cols * rows
+        index = np.repeat(np.arange(len(rects)), counts) # One entry for every cell of every obstacle
+        offset = np.arange(index.size) - np.repeat(np.cumsum(counts) - counts, counts) # Which of its cells each entry is
+        col = col1[index] + offset // rows[index]
+        row = row1[index] + offset % rows[index]
+        order = np.lexsort((index, row, col)) # Group the entries by cell, keeping the obstacles of a cell in the order they were added
+        col, row, index = col[order], row[order], index[order]
+        starts = np.flatnonzero(np.r_[True, (col[1:] != col[:-1]) | (row[1:] != row[:-1])]) # Where each cell's entries begin
+        self.cells = {cell: indices for cell, indices in zip(zip(col[starts].tolist(), row[starts].tolist()), np.split(index, starts[1:]))}
+        for cell in self.cells:
+            self.cells[cell] = self.cells[cell].tolist()
+
+    def query(self, x, y, width, height):
+        """
+        A method to return the obstacles that might overlap a box centred on x, y, in the order they were added.
+        """
+        col1, row1 = self.get_cell(x - width / 2, y - height / 2)
+        col2, row2 = self.get_cell(x + width / 2, y + height / 2)
+        if col1 == col2 and row1 == row2: # Most of the time the box is inside one cell and there is nothing to merge
+            return list(map(self.obstacles.__getitem__, self.cells.get((col1, row1), ())))
+        found = set() # Obstacles that cover more than one cell are only returned once
+        for col in range(col1, col2 + 1):
+            for row in range(row1, row2 + 1):
+                found.update(self.cells.get((col, row), ()))
+        return list(map(self.obstacles.__getitem__, sorted(found)))
+
+class ObstacleSet:
+    """
+    A class to hold the obstacles of a level as an array of (x, y, width, height) rectangles.
+    An Obstacle object is only created the first time the obstacle is needed, for example when the projectile comes
+    near it, so a level can be built straight from the array of a level pack however many obstacles it has.
+    """
+    def __init__(self, rects=()):
+        """
+        Initialize the set with its rectangles. An array is used as it is, without being copied.
+        """
+        rects = np.asarray(rects)
+        self.rects = rects.reshape(-1, 4) if rects.dtype.kind == "f" else rects.reshape(-1, 4).astype(float) # The obstacles as rectangles
+        self.obstacles = {} # The Obstacle objects that have been created, by index
+
+    def __len__(self):
+        """
+        A method to return the number of obstacles.
+        """
+        return len(self.rects)
+
+    def __getitem__(self, index):
+        """
+        A method to return the Obstacle object of an obstacle, creating it the first time.
+        """
+        obstacle = self.obstacles.get(index)
+        if obstacle is None:
+            obstacle = self.obstacles[index] = Obstacle(*self.rects[index].tolist())
+        return obstacle
+
+    def __iter__(self):
+        """
+        A method to loop over every obstacle as an Obstacle object.
+        """
+        for index in range(len(self.rects)):
+            yield self[index]
+
+    def draw(self, screen, colour=(255, 100, 100)):
+        """
+        A method to draw every obstacle as Obstacle.draw does, straight from the rectangles.
+        """
+        for rect in self.rects.tolist():
+            pygame.draw.rect(screen, colour, rect)
+
 class Cannon:
-    def __init__(self, x, y):
+    def __init__(self, x, y, assets=None):
         """
-        Initialize the cannon with its position and size.
+        Initialize the cannon with its position and size. The image is taken from the asset manager if one is given.
         """
         self.x = x
         self.y = y
-        self.cannon_image = pygame.image.load("assets\cannonTube.png") # Load the cannon image from the assets folder
-        self.rot_cannon_image = pygame.image.load("assets\cannonTube.png") # Load the cannon image from the assets folder
+        if assets is None:
+            assets = AssetManager() # Load the image on its own if the game has not given its asset manager
+        self.cannon_image = assets.get_image("cannonTube.png") # Load the cannon image from the assets folder
         self.scale = 1.1
         self.cannon_image = pygame.transform.scale(self.cannon_image, (self.cannon_image.get_width() * self.scale, self.cannon_image.get_height() * self.scale))
-        self.rot_cannon_image = pygame.transform.scale(self.rot_cannon_image, (self.rot_cannon_image.get_width() * self.scale, self.rot_cannon_image.get_height() * self.scale))
+        self.rot_cannon_image = self.cannon_image # The scaled image is only read, never changed, so it can be shared until the cannon is rotated
         self.power = 0 # Create a variable to store the power of the cannon
+        self.angle_step = 1 # Angles are rounded to this many degrees so rotated images can be reused
+        self.rotations = {} # A dictionary from a rounded angle to the rotated cannon image, at most 360 / angle_step images
         
     def get_center(self):
         """
@@ -270,15 +904,34 @@ class Cannon:
 
     def draw(self, screen):
         """
-        A method to draw the cannon on the screen.
+        A method to draw the cannon on the screen and return the rectangle that was drawn on.
+        """
+        return screen.blit(self.rot_cannon_image, (self.x, self.y))
+
+    def get_rotation(self, angle):
+        """
+        A method to return the cannon image rotated to the angle rounded to the nearest angle_step.
+        Each rounded angle is only rotated once and then reused.
         """
-        screen.blit(self.rot_cannon_image, (self.x, self.y))
+        key = round(angle / self.angle_step) % round(360 / self.angle_step) # The rounded angle, so -10 and 350 share an image
+        image = self.rotations.get(key)
+        if image is None: # Rotate the image the first time this angle is used
+            image = pygame.transform.rotate(self.cannon_image, key * self.angle_step)
+            self.rotations[key] = image
+        return image
+
+    def prebuild_rotations(self):
+        """
+        A method to rotate the cannon image to every rounded angle up front.
+        """
+        for key in range(round(360 / self.angle_step)):
+            self.get_rotation(key * self.angle_step)
 
     def rot_center(self, angle):
         """
         A method to rotate the cannon image to the angle.
         """
-        self.rot_cannon_image = pygame.transform.rotate(self.cannon_image, angle)
+        self.rot_cannon_image = self.get_rotation(angle)
 
 
 class ProjectileImage:
@@ -294,7 +947,10 @@ class ProjectileImage:
         self.projectile_colour = (255, 255, 255)
 
     def draw(self, screen, x, y):
-        pygame.draw.circle(screen, (self.projectile_colour), (int(x), int(y)), self.size) # Draw the projectile on the screen
+        """
+        A method to draw the projectile at a position and return the rectangle that was drawn on.
+        """
+        return pygame.draw.circle(screen, (self.projectile_colour), (int(x), int(y)), self.size) # Draw the projectile on the screen
 
     def set_position(self, x, y):
         """
@@ -324,6 +980,8 @@ class WindArrow:
         self.y = y
         self.size = 5
         self.colour = (255, 255, 255) 
+        self.cached_key = None # The angle and position the cached points were worked out for
+        self.cached_points = None # The corners of the rotated triangle
     
     def draw(self, screen):
         #draw a triangle
@@ -336,30 +994,581 @@ class WindArrow:
         self.x = x
         self.y = y
         
-    def draw_rotate(self, angle, screen):
+    def get_rotated_points(self, angle):
         """
-        A method to rotate the triangle by a given angle
+        A method to return the corners of the triangle rotated by a given angle.
+        The wind angle stays the same for a whole level, so the points are only worked out again when the angle or position changes.
         """
+        if self.cached_key == (angle, self.x, self.y):
+            return self.cached_points
+        key = (angle, self.x, self.y)
         angle = -angle - 180
         center_x = self.x + 20
         center_y = self.y
+        cos_angle = math.cos(math.radians(angle))
+        sin_angle = math.sin(math.radians(angle))
         points = [(self.x, self.y), (self.x + 40, self.y + 10), (self.x + 40, self.y - 10)]
         rotated_points = []
         for point in points:
-            x = (point[0] - center_x) * math.cos(math.radians(angle)) - (point[1] - center_y) * math.sin(math.radians(angle)) + center_x
-            y = (point[0] - center_x) * math.sin(math.radians(angle)) + (point[1] - center_y) * math.cos(math.radians(angle)) + center_y
+            x = (point[0] - center_x) * cos_angle - (point[1] - center_y) * sin_angle + center_x
+            y = (point[0] - center_x) * sin_angle + (point[1] - center_y) * cos_angle + center_y
             rotated_points.append((x, y))
-        pygame.draw.polygon(screen, self.colour, rotated_points)
+        self.cached_key = key
+        self.cached_points = rotated_points
+        return rotated_points
+
+    def draw_rotate(self, angle, screen):
+        """
+        A method to rotate the triangle by a given angle
+        """
+        return pygame.draw.polygon(screen, self.colour, self.get_rotated_points(angle))
+
+class HUD:
+    """
+    A class to draw lines of text on the screen, only rendering a line again when its text changes.
+    """
+    def __init__(self, font, colour=(255, 255, 255)):
+        """
+        Initialize the HUD with the font and colour of the text.
+        """
+        self.font = font # The font used for every line
+        self.colour = colour # The colour of the text
+        self.lines = {} # A dictionary from the position of a line to its text and rendered surface
+        self.renders = 0 # The number of times a line had to be rendered
+        self.reuses = 0 # The number of times a rendered line was reused
+
+    def draw_line(self, screen, text, position):
+        """
+        A method to draw a line of text at a position, reusing the last surface drawn there if the text is the same.
+        Returns the rectangle of the screen that was drawn on.
+        """
+        cached = self.lines.get(position)
+        if cached is None or cached[0] != text: # The text has changed so it has to be rendered again
+            cached = (text, self.font.render(text, True, self.colour))
+            self.lines[position] = cached
+            self.renders += 1
+        else:
+            self.reuses += 1
+        return screen.blit(cached[1], position) # Draw the text on the screen and return the area that was drawn
+
+    def clear(self):
+        """
+        A method to forget every rendered line, for example after the font changes.
+        """
+        self.lines.clear()
+
+class Renderer:
+    """
+    A class to draw the game by only updating the parts of the screen that change.
+    The background, obstacles, goal and wind arrow do not move during a level, so they are drawn once onto an
+    off-screen level layer. Each frame the areas drawn on in the last frame are restored from the level layer,
+    the moving parts are drawn again, and only those areas are sent to the display.
+    """
+    def __init__(self, screen):
+        """
+        Initialize the renderer for a screen.
+        """
+        self.screen = screen # The display surface
+        self.layer = pygame.Surface(screen.get_size()).convert() # The pre-drawn level layer
+        self.last_rects = [] # The areas drawn on in the last frame
+        self.rects = [] # The areas drawn on in this frame
+        self.full_redraw = True # The whole screen has to be drawn, for example after the level changes
+
+    def build_level(self, bg_colour, obstacles, target, windArrow, wind_angle):
+        """
+        A method to draw the parts of the level that do not move onto the level layer.
+        """
+        self.layer.fill(bg_colour) # Fill the layer with the background colour
+        target.draw(self.layer) # Draw the target on the layer
+        obstacles.draw(self.layer) # Draw every obstacle on the layer
+        windArrow.draw_rotate(wind_angle, self.layer) # Draw the wind arrow on the layer
+        self.full_redraw = True # Show the new layer on the whole screen
+
+    def begin_frame(self):
+        """
+        A method to start a frame by restoring the level layer where the moving parts were drawn last frame.
+        """
+        self.rects = []
+        if self.full_redraw:
+            self.screen.blit(self.layer, (0, 0))
+        else:
+            for rect in self.last_rects:
+                self.screen.blit(self.layer, rect, rect) # Copy the same area from the layer to the screen
+
+    def add(self, rect):
+        """
+        A method to record an area that was drawn on this frame.
+        """
+        if rect is not None:
+            self.rects.append(rect)
+
+    def end_frame(self):
+        """
+        A method to send the changed areas to the display.
+        """
+        if self.full_redraw:
+            pygame.display.flip() # Update the whole screen
+            self.full_redraw = False
+        else:
+            pygame.display.update(self.last_rects + self.rects) # Update where things were and where they are now
+        self.last_rects = self.rects
+
+# The phases of a frame timed by the profiler, in the order they happen
+PROFILE_PHASES = ("UPDATE", "WAIT", "EVENT HANDLING", "DRAW", "DISPLAY")
+
+class FrameProfiler:
+    """
+    A class to time each phase of a frame.
+    The game loop calls begin_frame at the start of a frame, lap at the end of each phase and end_frame at the end.
+    The times of the last frames are kept for the overlay, and every frame can also be kept for a trace file.
+    While neither is switched on every call returns straight away, so the hooks cost next to nothing.
+    """
+    def __init__(self, phases=PROFILE_PHASES, history=300):
+        """
+        Initialize the profiler with the names of the phases and the number of frames kept for the percentiles.
+        """
+        self.phases = phases # The names of the phases
+        self.index = {name: i for i, name in enumerate(phases)} # The column of each phase
+        self.history = history # The number of frames kept
+        self.times = np.zeros((history, len(phases) + 1)) # The time of each phase and of the whole frame, in seconds, for the last frames
+        self.count = 0 # The number of frames timed
+        self.current = [0.0] * len(phases) # The time of each phase in this frame
+        self.frame_start = 0 # When this frame started
+        self.last = 0 # When the last phase ended
+        self.active = False # True if this frame is being timed
+        self.show_overlay = False # True if the overlay is drawn
+        self.trace = None # The rows of the trace file while a trace is being recorded
+        self.trace_file = None # The file the trace is written to
+        self.summary = [] # The lines of the overlay
+        self.summary_time = 0 # When the lines of the overlay were last worked out
+
+    def begin_frame(self):
+        """
+        A method to start timing a frame. Whether the frame is timed is only decided here, so switching the
+        overlay on half way through a frame does not give a wrong time.
+        """
+        self.active = self.show_overlay or self.trace is not None
+        if not self.active:
+            return
+        self.frame_start = self.last = time.perf_counter()
+        for i in range(len(self.current)):
+            self.current[i] = 0.0
+
+    def lap(self, phase):
+        """
+        A method to add the time since the last lap to a phase. A phase can be timed in more than one part.
+        """
+        if not self.active:
+            return
+        now = time.perf_counter()
+        self.current[self.index[phase]] += now - self.last
+        self.last = now
+
+    def end_frame(self):
+        """
+        A method to finish timing a frame.
+        """
+        if not self.active:
+            return
+        total = time.perf_counter() - self.frame_start
+        row = self.times[self.count % self.history]
+        row[:-1] = self.current
+        row[-1] = total
+        if self.trace is not None:
+            self.trace.append([self.count, round(self.frame_start, 6)] + [round(t * 1000, 4) for t in self.current] + [round(total * 1000, 4)])
+        self.count += 1
+
+    def get_times(self):
+        """
+        A method to return the times of the frames kept, in milliseconds, one row per frame and one column per phase and then the whole frame.
+        """
+        return self.times[:min(self.count, self.history)] * 1000
+
+    def get_percentiles(self, percentiles=(50, 95, 99)):
+        """
+        A method to return the given percentiles of the frame time in milliseconds.
+        """
+        times = self.get_times()
+        if len(times) == 0:
+            return {p: 0 for p in percentiles}
+        return dict(zip(percentiles, np.percentile(times[:, -1], percentiles)))
+
+    def get_summary(self, interval=0.5):
+        """
+        A method to return the lines of the overlay. They are only worked out again every interval seconds so they
+        can be read and the text does not have to be rendered every frame.
+        """
+        now = time.perf_counter()
+        if now - self.summary_time < interval and self.summary:
+            return self.summary
+        self.summary_time = now
+        times = self.get_times()
+        if len(times) == 0:
+            return self.summary
+        frame = self.get_percentiles()
+        mean = times[:, -1].mean()
+        self.summary = [f"Frame ms p50 {frame[50]:.2f} p95 {frame[95]:.2f} p99 {frame[99]:.2f} ({1000 / mean if mean > 0 else 0:.0f} fps)"]
+        for i, name in enumerate(self.phases):
+            self.summary.append(f"{name:<15}mean {times[:, i].mean():6.2f} p95 {np.percentile(times[:, i], 95):6.2f}")
+        if self.trace is not None:
+            self.summary.append(f"Tracing {len(self.trace)} frames")
+        return self.summary
+
+    def start_trace(self, file_name):
+        """
+        A method to start keeping every frame for a trace file. The file is written when the trace is stopped.
+        """
+        self.trace = []
+        self.trace_file = file_name
+
+    def stop_trace(self):
+        """
+        A method to stop the trace and write it to its file, as csv or json depending on the file extension.
+        Returns the name of the file, or None if there was no trace.
+        """
+        if self.trace is None:
+            return None
+        rows, file_name = self.trace, self.trace_file
+        self.trace = None
+        self.trace_file = None
+        columns = ["frame", "time"] + [f"{name.lower().replace(' ', '_')}_ms" for name in self.phases] + ["frame_ms"]
+        folder = os.path.dirname(file_name)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with open(file_name, "w", newline="") as file:
+            if file_name.endswith(".json"):
+                json.dump([dict(zip(columns, row)) for row in rows], file)
+            else:
+                csv.writer(file).writerows([columns] + rows)
+        return file_name
+
+# The values written to a new gamedata.json file
+DEFAULT_SETTINGS = {
+    "levelCounter": 0,
+    "B2": 0.00004,
+    "bg_colour": (30, 30, 30),
+    "projectile_colour": (255, 255, 255),
+    "projectile_Cd": 0.52,
+    "projectile_m": 2,
+    "win_width": 1000,
+    "win_height": 800,
+    "wind_speed": 0,
+    "wind_angle": 0,
+    "trace_format": "csv",
+    "level_pack": "",
+    "pack_level": 0,
+    "telemetry_file": "telemetry.db",
+}
+
+# The levels of log messages, lowest first
+LOG_LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40}
+
+class Logger:
+    """
+    A class to write log messages to a file from a background thread, so logging never makes a frame wait for the disk.
+    Messages are put on a queue and the thread writes them. The same message repeated within coalesce_time seconds
+    is only written once, followed by how many times it was repeated. When the file grows past max_bytes it is
+    renamed to game.log.1 (the older ones moving up to .2 and so on) and a new file is started.
+    """
+    def __init__(self, file_name="game.log", level="INFO", max_bytes=1000000, backups=3, coalesce_time=10, max_queue=10000, echo=True):
+        """
+        Initialize the logger and start its thread.
+        """
+        self.file_name = file_name # The file the messages are written to
+        self.level = LOG_LEVELS[level] # Messages below this level are ignored
+        self.max_bytes = max_bytes # The size the file may grow to before it is rotated
+        self.backups = backups # The number of old files kept
+        self.coalesce_time = coalesce_time # Repeats of a message within this many seconds are counted rather than written
+        self.echo = echo # Also print the messages to the console
+        self.queue = queue.Queue(maxsize=max_queue) # The messages waiting to be written
+        self.dropped = 0 # The number of messages dropped because the queue was full
+        self.recent = {} # The time each recent message was written and how many repeats have been counted since
+        self.file = None # The open log file
+        self.closed = False # True once the logger has been closed
+        self.thread = threading.Thread(target=self.worker, daemon=True)
+        self.thread.start()
+        atexit.register(self.close) # Write what is left even if the game does not close the logger
+
+    def log(self, message, level="INFO"):
+        """
+        A method to add a message to the queue. Never waits: if the queue is full the message is dropped and counted.
+        """
+        if LOG_LEVELS[level] < self.level or self.closed:
+            return
+        try:
+            self.queue.put_nowait((time.time(), level, str(message)))
+        except queue.Full:
+            self.dropped += 1
+
+    def write(self, timestamp, level, text):
+        """
+        A method to write one line to the file, rotating the file first if it is too big. Only called by the thread.
+        """
+        timeCode = datetime.datetime.fromtimestamp(timestamp).strftime("%H:%M:%S")
+        if level == "INFO" or text.upper().startswith(level): # Messages like "Error: ..." already say their level
+            line = f"[{timeCode}] {text} \n"
+        else:
+            line = f"[{timeCode}] {level}: {text} \n"
+        if self.file is None:
+            self.file = open(self.file_name, "a")
+        if self.file.tell() + len(line) > self.max_bytes:
+            self.rotate()
+        self.file.write(line)
+        if self.echo:
+            print(text)
+
+    def rotate(self):
+        """
+        A method to move the log file to a backup and start a new one.
+        """
+        self.file.close()
+        for i in range(self.backups - 1, 0, -1): # Move each backup up by one, the oldest is overwritten
+            if os.path.exists(f"{self.file_name}.{i}"):
+                os.replace(f"{self.file_name}.{i}", f"{self.file_name}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.file_name, f"{self.file_name}.1")
+        else:
+            os.remove(self.file_name)
+        self.file = open(self.file_name, "a")
+
+    def handle(self, timestamp, level, text):
+        """
+        A method to write a message unless the same message was written within coalesce_time seconds.
+        """
+        key = (level, text)
+        if key in self.recent and timestamp - self.recent[key][0] < self.coalesce_time:
+            self.recent[key][1] += 1 # Count the repeat instead of writing it
+            return
+        self.write_repeats(key, timestamp)
+        self.write(timestamp, level, text)
+        self.recent[key] = [timestamp, 0]
+
+    def write_repeats(self, key, timestamp):
+        """
+        A method to write how many times a message was repeated, if it was.
+        """
+        if key in self.recent and self.recent[key][1] > 0:
+            self.write(timestamp, key[0], f"(repeated {self.recent[key][1]} more times) {key[1]}")
+        self.recent.pop(key, None)
+
+    def expire(self, now, everything=False):
+        """
+        A method to forget messages older than coalesce_time seconds, writing how many times they were repeated.
+        """
+        for key in [key for key, (written, count) in self.recent.items() if everything or now - written >= self.coalesce_time]:
+            self.write_repeats(key, now)
+
+    def worker(self):
+        """
+        A method run by the thread: write messages as they arrive, in batches, until the logger is closed.
+        """
+        while True:
+            try:
+                item = self.queue.get(timeout=1)
+            except queue.Empty:
+                item = False
+            batch = [item] if item is not False else []
+            while True: # Take everything that is waiting so the file is flushed once per batch
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = False
+            try:
+                for item in batch:
+                    if item is None: # Closing
+                        stop = True
+                        break
+                    self.handle(*item)
+                self.expire(time.time(), everything=stop)
+                if self.dropped:
+                    dropped, self.dropped = self.dropped, 0
+                    self.write(time.time(), "WARNING", f"{dropped} log messages were dropped because the queue was full")
+                if self.file is not None:
+                    self.file.flush()
+            except Exception as e:
+                print(f"Error: Could not write to the log file. {e}")
+            if stop:
+                if self.file is not None:
+                    self.file.close()
+                    self.file = None
+                return
+
+    def close(self):
+        """
+        A method to write every message still in the queue and stop the thread.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(None) # Waits for room, so the stop is never dropped
+        self.thread.join()
+
+class Settings:
+    """
+    A class to keep the game settings in memory.
+    The file is read once with load, changes are only kept in memory until flush is called, and flush writes
+    every change at once to a temporary file that then replaces the real one, so the file is never half written.
+    Background writes are done by one writer thread that always writes the newest snapshot, and every snapshot is
+    numbered so an older one is never written over a newer one.
+    """
+    def __init__(self, file_name, defaults=None):
+        """
+        Initialize empty settings for a file. Call load to read the file.
+        """
+        self.file_name = file_name # The json file the settings are stored in
+        self.defaults = defaults if defaults is not None else {} # Values used for keys missing from the file
+        self.data = {} # The current settings
+        self.dirty = set() # The keys that have changed since the last flush
+        self.lock = threading.Lock() # Stops two flushes writing the file at the same time
+        self.condition = threading.Condition() # Guards the snapshot waiting for the writer and wakes it up
+        self.pending = None # The newest (number, text) snapshot waiting to be written in the background
+        self.sequence = 0 # The number of the newest snapshot taken
+        self.written = 0 # The number of the newest snapshot written to the file
+        self.stopping = False # True once the writer has been asked to stop
+        self.writer = None # The thread writing the file in the background, started by the first background flush
+
+    def load(self):
+        """
+        A method to read the settings from the file, discarding changes that have not been flushed.
+        """
+        with open(self.file_name, "r") as file:
+            self.data = json.load(file)
+        self.dirty.clear()
+
+    def get(self, key):
+        """
+        A method to return the value of a setting, using the default if the file does not have it.
+        """
+        if key in self.data:
+            return self.data[key]
+        return self.defaults[key] # Raises KeyError if the setting does not exist at all
+
+    def set(self, key, value):
+        """
+        A method to change a setting in memory. The key is only marked as changed if the value is different.
+        """
+        if self.data.get(key) != value or key not in self.data:
+            self.data[key] = value
+            self.dirty.add(key)
+
+    def is_dirty(self):
+        """
+        A method to return True if there are changes that have not been written to the file.
+        """
+        return len(self.dirty) > 0
+
+    def write(self, text, sequence):
+        """
+        A method to replace the file with snapshot number sequence in one step, unless a newer snapshot has already been written.
+        """
+        with self.lock:
+            if sequence <= self.written: # A newer snapshot is already in the file
+                return
+            temp_name = self.file_name + ".tmp" # Write to a temporary file first
+            with open(temp_name, "w") as file:
+                file.write(text)
+                file.flush()
+                os.fsync(file.fileno()) # Make sure the new file is on the disk before it replaces the old one
+            os.replace(temp_name, self.file_name) # Swap the new file in, which either fully happens or does not happen at all
+            self.written = sequence
+
+    def worker(self):
+        """
+        A method run by the writer thread: write the newest snapshot whenever there is one, until stop is called.
+        """
+        while True:
+            with self.condition:
+                while self.pending is None and not self.stopping:
+                    self.condition.wait()
+                if self.pending is None: # Stopping and nothing is left to write
+                    return
+                sequence, text = self.pending
+                self.pending = None
+            try:
+                self.write(text, sequence)
+            except Exception as e:
+                print(f"Error: Could not save the settings. {e}")
+
+    def flush(self, wait=True):
+        """
+        A method to write every change to the file in one atomic write.
+        If wait is False the file is written by a background thread so the game does not wait for the disk.
+        """
+        if not self.dirty:
+            return
+        text = json.dumps(self.data) # Take a copy of the settings now so later changes do not affect this write
+        self.dirty.clear()
+        self.sequence += 1
+        if wait:
+            self.write(text, self.sequence)
+        else:
+            with self.condition:
+                self.pending = (self.sequence, text) # Replaces an older snapshot the writer has not started on
+                self.condition.notify()
+            if self.writer is None:
+                self.writer = threading.Thread(target=self.worker, daemon=True)
+                self.writer.start()
+
+    def close(self):
+        """
+        A method to wait for the background writes to finish and write any remaining changes.
+        """
+        if self.writer is not None:
+            with self.condition:
+                self.stopping = True
+                self.condition.notify()
+            self.writer.join()
+            self.writer = None
+            self.stopping = False # A later background flush starts a new writer
+        self.flush(wait=True)
+
+class StartupTimer:
+    """
+    A class to time the phases of starting the game, up to the first frame being shown.
+    """
+    def __init__(self):
+        """
+        Initialize the timer, starting from now. The time the imports took is the first phase.
+        """
+        self.start = time.perf_counter() # When the game started to be created
+        self.last = self.start # When the last phase ended
+        self.phases = [("import", IMPORT_TIME)] # The name and time in seconds of each phase, in order
+        self.background = {} # The time from the start until each background task finished
+        self.done = False # True once the first frame has been shown
+
+    def mark(self, phase):
+        """
+        A method to end a phase.
+        """
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def mark_background(self, task):
+        """
+        A method to record that a task running in another thread has finished.
+        """
+        self.background[task] = time.perf_counter() - self.start
+
+    def get_report(self):
+        """
+        A method to return the startup times as one line.
+        """
+        phases = ", ".join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in self.phases)
+        total = sum(seconds for name, seconds in self.phases)
+        report = f"Startup: {phases}. First frame after {total * 1000:.0f}ms"
+        return report
 
 class Game: # A class to represent the game loop
-    def log(self, message):
+    def log(self, message, level=None):
         """
-        A method to log a message to the console.
+        A method to log a message to the console and the log file. The message is written by the logger's thread.
+        Exceptions and messages starting with "Error:" are logged as errors unless a level is given.
         """
-        timeCode = datetime.datetime.now().strftime("%H:%M:%S")
-        with open("game.log", "a") as file:
-            file.write(f"[{timeCode}] {message} \n")
-            print (message)
+        if level is None:
+            level = "ERROR" if isinstance(message, Exception) or str(message).startswith("Error:") else "INFO"
+        self.logger.log(message, level)
 
     def initTextFile(self):
         """
@@ -394,44 +1603,30 @@ class Game: # A class to represent the game loop
         """
         try:
             with open(self.file_name, "w") as file:
-                file.write(json.dumps({
-                    "levelCounter": 0,
-                    "B2": 0.00004,
-                    "bg_colour": (30, 30, 30),
-                    "projectile_colour": (255, 255, 255),
-                    "projectile_Cd": 0.52,
-                    "projectile_m": 2,
-                    "win_width": 1000,
-                    "win_height": 800,
-                    "wind_speed": 0,
-                    "wind_angle": 0,
-                }))
+                file.write(json.dumps(DEFAULT_SETTINGS))
         except Exception as e:
             self.log(e)
             self.log("Error: Could not create default values.")
 
     def read_file(self, key):
         """
-        Read the value of a key from the text file.
+        Read the value of a key from the settings, which were loaded from the text file once.
+        Values given to the game when it was created are used instead of the ones in the file.
         """
         try:
-            with open(self.file_name, "r") as file:
-                data = json.load(file)
-                return data[key]
+            if key in self.overrides:
+                return self.overrides[key]
+            return self.settings.get(key)
         except Exception as e:
             self.log(e)
             self.log("Error: Could not read from file.")
     
     def write_file(self, key, value):
         """
-        Write a value to a key in the text file.
+        Write a value to a key in the settings. The change is kept in memory until the settings are flushed.
         """
         try:
-            with open(self.file_name, "r") as file:
-                data = json.load(file)
-                data[key] = value
-            with open(self.file_name, "w") as file:
-                file.write(json.dumps(data))
+            self.settings.set(key, value)
         except Exception as e:
             self.log(e)
             self.log("Error: Could not write to file.")
@@ -442,6 +1637,7 @@ class Game: # A class to represent the game loop
         """
         try:
             self.write_file("levelCounter", self.levelCounter)
+            self.write_file("pack_level", self.packLevel)
             self.write_file("B2", self.B2)
             self.write_file("bg_colour", self.bg_colour)
             self.write_file("projectile_colour", self.projectile_colour)
@@ -449,30 +1645,84 @@ class Game: # A class to represent the game loop
             self.write_file("projectile_m", self.projectile_m)
             self.write_file("wind_speed", self.wind_speed)
             self.write_file("wind_angle", self.wind_angle)
+            self.settings.flush(wait=False) # Write every change at once without making the game wait for the disk
         except Exception as e:
             self.log(e)
             self.log("Error: Could not save game state.")
         
 
-    def __init__(self):
+    def __init__(self, seed=None, settings=None):
         """
-        Initialize the json file manager
+        Initialize the json file manager.
+        settings is a dictionary of values used instead of the ones in the file for this session only, for
+        example to run the benchmarks at other window sizes. They are never written to the file.
         """
+        self.startup = StartupTimer() # Time each phase of starting the game
+        self.overrides = settings if settings is not None else {} # Settings that replace the file values without being saved
+        self.logger = Logger("game.log") # Write log messages from a background thread
         self.initTextFile()
+        self.settings = Settings(self.file_name, DEFAULT_SETTINGS) # Keep the settings in memory
+        try:
+            self.settings.load() # Read the file once
+        except Exception as e:
+            self.log(e)
+            self.log("Error: Could not read settings, using the defaults.")
+        self.startup.mark("settings")
         """
-        Set up the game window variables and initialize pygame
+        Set up the game window variables and initialize pygame. Only the parts of pygame the game uses are started.
         """
-        pygame.init() # Initialize pygame
+        pygame.display.init() # Start the display
+        pygame.font.init() # Start the fonts
         self.clock = pygame.time.Clock() # Set frame rate
         self.SCREEN_WIDTH = self.read_file("win_width")# Set the width of the screen
         self.SCREEN_HEIGHT = self.read_file("win_height") # Set the height of the screen
         self.screen = pygame.display.set_mode((self.SCREEN_WIDTH, self.SCREEN_HEIGHT)) # Create a screen with the specified width and height
-        self.BallChannelCounter = 5 # Set the channel counter to 5
+        self.startup.mark("display")
+        """
+        Load the assets once so nothing is read from disk during play. The images are loaded now as the first
+        frame needs them, the sounds are decoded by a background thread once the first frame is shown.
+        """
+        self.assets = AssetManager("assets") # Create the asset manager
+        self.assets.preload(IMAGE_ASSETS) # Load the images the game uses
+        self.hud = HUD(self.assets.get_font("consolas", 20)) # Create the HUD that draws the text on the screen
+        self.startup.mark("images and fonts")
+        self.audioReady = threading.Event() # Set once the sounds have been decoded
+        self.soundsStarted = False # True once the ambient sounds are playing and the mixer has its channels
+        try:
+            pygame.mixer.init() # Start the mixer here, as the audio device is best opened from the main thread
+        except pygame.error as e: # No audio device, so the game runs without sound
+            self.log(e)
+            self.log("Error: Could not start the sound.")
+        self.audioThread = threading.Thread(target=self.loadSounds, daemon=True) # Decodes the sounds, started after the first frame as decoding holds up the level generation
+        self.startup.mark("mixer")
+        self.mixer = SoundMixer(self.assets) # Create the mixer that plays the sound effects on a pool of channels
+        self.mixer.add_event("bounce", [f"ball{i}.mp3" for i in range(1, 7)], cooldown=0.05, priority=1, min_volume=0.02) # Quiet rolling contacts are not played
+        self.mixer.add_event("target", ["dingup.mp3"], priority=10)
+        self.mixer.add_event("out", ["error.mp3"], priority=10)
+        self.renderer = Renderer(self.screen) # Create the renderer that only updates the parts of the screen that change
+        self.max_fps = 60 # The highest frame rate, 0 for no limit
+        self.physics_rate = 300 # The number of physics steps per second, independent of the frame rate
+        self.step_time = 1 / self.physics_rate # The real time between two physics steps
+        self.max_frame_time = 0.25 # The longest frame time that is simulated, so a pause does not cause a burst of steps
+        self.accumulator = 0 # The real time that has passed but has not been simulated yet
+        """
+        Set up the random generators and the replay
+        """
+        self.seed = seed if seed is not None else random.getrandbits(63) # The seed of the session, stored in the replay
+        self.rng = random.Random(self.seed) # Everything random about the levels comes from this generator
+        self.replay = None # The replay of the session, created when the game starts running
+        self.replayFolder = "replays" # The folder replays are saved to
+        self.telemetry = None # Records every shot to a database, started with the replay
+        self.shotVelocity = None # The launch velocity of the shot in flight, None once the shot has been recorded
+        self.shotSteps = 0 # The number of physics steps of the shot in flight
+        self.shotTime = 0 # The simulated time of the shot in flight, in seconds
         """
         Set up environment variables
         """
         self.bg_colour = self.read_file("bg_colour") # Set the background colour of the environment
         self.B2 = self.read_file("B2") # Set the B2 coefficient of the environment
+        self.wind_speed = self.read_file("wind_speed") # Set the wind speed of the environment
+        self.wind_angle = self.read_file("wind_angle") # Set the wind angle of the environment
         """
         Set up target variables
         """
@@ -495,30 +1745,95 @@ class Game: # A class to represent the game loop
         Set up level variables
         """
         self.levelCounter = self.read_file("levelCounter") # Set the level counter
-        self.obstacleList = [] # Create an empty list to store the obstacles
+        self.obstacleList = ObstacleSet() # The obstacles of the level
+        self.levelPack = None # The level pack the levels are loaded from, None if they are generated
+        self.packLevel = self.read_file("pack_level") # The position in the level pack of the level being played
+        if self.read_file("level_pack"):
+            try:
+                self.levelPack = LevelPack(self.read_file("level_pack"))
+                if (self.levelPack.width, self.levelPack.height) != (self.SCREEN_WIDTH, self.SCREEN_HEIGHT):
+                    self.log(f"The level pack is for a {self.levelPack.width}x{self.levelPack.height} window, not {self.SCREEN_WIDTH}x{self.SCREEN_HEIGHT}", "WARNING")
+            except Exception as e:
+                self.log(e)
+                self.log("Error: Could not open the level pack, generating the levels instead.")
+        self.obstacleGrid = ObstacleGrid() # Create a grid to find the obstacles near the projectile
+        self.levelChanged = True # A boolean variable to indicate if the level layer has to be drawn again
+        self.levelVersion = 0 # The number of obstacle layouts created so far
+        self.predictor = TrajectoryPredictor() # Create the predictor that works out the aim preview off the main thread
+        self.levelGenerator = LevelGenerator() # Create the generator that only gives solvable levels
+        self.levelGenerator.start() # Start its workers now so their start-up is not counted against the first level
+        self.showPreview = True # A boolean variable to indicate if the aim preview is drawn
+        self.volleyMode = False # A boolean variable to indicate if a click fires a volley of many projectiles
+        self.volleySize = 300 # The number of projectiles in a volley
+        self.volleySpread = 4 # The largest change in degrees to the aim of each projectile of a volley
+        self.volley = Volley(self.volleySize, self.projectile_m, self.projectile_Cd, self.B2) # The projectiles of a volley, stored as arrays
+        self.obstacleRects = np.zeros((0, 4)) # The obstacles as an array of rectangles, used by the volley
+        self.profiler = FrameProfiler() # Time each phase of a frame, only while the overlay or a trace is on
+        self.traceFolder = "traces" # The folder frame traces are saved to
+        self.traceFormat = self.read_file("trace_format") # The format of frame traces, csv or json
         self.running = True # A boolean variable to indicate if the game is running
         self.game_over = False # A boolean variable to indicate if the game is over
         self.launched = False # A boolean variable to indicate if the projectile has been launched
         self.in_flight = False # A boolean variable to indicate if the projectile is in flight
-        self.background = pygame.image.load("assets\\background.png") # Load the background image
+        self.background = self.assets.get_image("background.png") # Load the background image
         """
         Create a cannon object
         """
-        self.cannon = Cannon(100, self.SCREEN_HEIGHT/2) # Create a cannon object with the specified position
+        self.cannon = Cannon(100, self.SCREEN_HEIGHT/2, self.assets) # Create a cannon object with the specified position
+        self.cannon.prebuild_rotations() # Rotate the cannon image to every angle now so aiming only looks images up
+        self.startup.mark("cannon")
         self.target = Goal(self.target_x, self.target_y, self.target_width, self.target_height) # Create a target object with the specified position and size
 
     def obstacleManager(self):
         """
         A function to manage obstacles
         """
-        self.obstacleList.clear() # Clear the list of obstacles
-
-        self.obstacleList.append(Obstacle(0, self.SCREEN_HEIGHT-5, self.SCREEN_WIDTH, 50)) # Create a floor object with the specified position and size
-        self.obstacleList.append(Obstacle(0, -45, self.SCREEN_WIDTH, 50)) # Create a ceiling object with the specified position and size
-        self.obstacleList.append(Obstacle(self.SCREEN_WIDTH-5, 0, 50, self.SCREEN_HEIGHT)) # Create a right wall object with the specified position and size
-
-        for i in range(self.levelCounter): # Loop through the number of obstacles for the current level
-            self.obstacleList.append(Obstacle(random.randint(0,self.SCREEN_WIDTH), random.randint(0,self.SCREEN_HEIGHT), random.randint(20,100), random.randint(20,100))) # Add an obstacle to the list of obstacles
+        if self.levelPack is not None: # The levels come from a level pack rather than being generated
+            self.loadPackLevel()
+            return
+        fixed = [(0, self.SCREEN_HEIGHT-5, self.SCREEN_WIDTH, 50), # The floor
+                 (0, -45, self.SCREEN_WIDTH, 50), # The ceiling
+                 (self.SCREEN_WIDTH-5, 0, 50, self.SCREEN_HEIGHT)] # The right wall
+
+        # Generate a layout that keeps the cannon and target clear and can still be solved
+        cannon_x, cannon_y = self.cannon.get_center() # Shots are fired from the centre of the cannon
+        cannon_width, cannon_height = self.cannon.cannon_image.get_size()
+        margin = 30 # The gap kept around the cannon and the target
+        keep_clear = [(self.cannon.x - margin, self.cannon.y - margin, cannon_width + margin * 2, cannon_height + margin * 2),
+                      (self.target.x - margin, self.target.y - margin, self.target.width + margin * 2, self.target.height + margin * 2)]
+        physics = {"mass": self.projectile_m, "Cd": self.projectile_Cd, "B2": self.B2, "wind_speed": self.wind_speed,
+                   "wind_angle": self.wind_angle, "size": self.projectileImage.get_size()[0], "dt": self.projectile.dt}
+        level = self.levelGenerator.generate(self.SCREEN_WIDTH, self.SCREEN_HEIGHT, self.levelCounter, fixed, keep_clear,
+                                             (cannon_x, cannon_y), (self.target.x, self.target.y, self.target.width, self.target.height),
+                                             physics, seed=self.rng.getrandbits(32))
+        if not level.solvable or len(level.rects) < self.levelCounter:
+            self.log(f"Level generated with {len(level.rects)} of {self.levelCounter} obstacles after {level.attempts} layouts in {level.elapsed:.2f}s, solvable: {level.solvable}")
+        self.setObstacles(ObstacleSet(fixed + level.rects)) # The floor, ceiling and wall are always there
+
+    def loadPackLevel(self):
+        """
+        A function to load the next level of the level pack: its goal, its wind and its obstacles.
+        """
+        level = self.levelPack.get_level(self.packLevel % len(self.levelPack))
+        self.target = Goal(*level.goal) # Create a target object with the position and size of the level
+        self.wind_speed = level.wind_speed
+        self.wind_angle = level.wind_angle
+        self.setObstacles(ObstacleSet(level.obstacles)) # The obstacles are used straight from the pack
+
+    def setObstacles(self, obstacles):
+        """
+        A function to make an ObstacleSet the obstacles of the level.
+        """
+        self.obstacleList = obstacles
+        self.obstacleGrid.build(self.obstacleList) # Rebuild the grid for the new obstacles
+        self.obstacleRects = np.asarray(self.obstacleList.rects, dtype=float) # The volley collides with all the obstacles at once
+        self.volley.set_obstacles(self.obstacleRects) # Bin them for the volley once per level
+        self.levelChanged = True # Draw the new obstacles onto the level layer before the next frame
+        self.levelVersion += 1 # Count the layouts so old aim previews are not reused for a new one
+        if self.replay is not None: # Record the whole layout, as the generator may place fewer obstacles on a slower computer
+            self.replay.add_level(ReplayLevel(self.levelCounter, self.levelVersion, self.wind_speed, self.wind_angle,
+                                              (self.target.x, self.target.y, self.target.width, self.target.height),
+                                              self.obstacleList.rects)) # The array is packed straight into the replay
 
     def levelManager(self, state):
         """
@@ -526,53 +1841,261 @@ class Game: # A class to represent the game loop
         """
         if state == True:
             self.levelCounter += 2 # Increase the level counter 
-            self.target = Goal(self.target_x, random.randint(50, self.SCREEN_HEIGHT-50), self.target_width, self.target_height) # Create a target object with the specified position and size
-            self.obstacleManager() # Call the function to manage the obstacles
-            self.write_file("wind_speed", (random.random() * self.levelCounter/4)) # Write the wind to the json file")
-            self.write_file("wind_angle", (random.randint(0,360))) # Write the wind angle to the json file")
-            self.projectile.set_wind(self.read_file("wind_speed"), self.read_file("wind_angle")) # Set the wind of the projectile
-            self.projectileImage.set_colour((random.randint(100,255), random.randint(100,255), random.randint(100,255))) # Set the colour of the projectile to a random colour
+            self.packLevel += 1 # Move on to the next level of the level pack, if there is one
+            self.target = Goal(self.target_x, self.rng.randint(50, self.SCREEN_HEIGHT-50), self.target_width, self.target_height) # Create a target object with the specified position and size
+            self.wind_speed = self.rng.random() * self.levelCounter/4 # Choose the wind speed of the new level
+            self.wind_angle = self.rng.randint(0,360) # Choose the wind angle of the new level
+            self.obstacleManager() # Call the function to manage the obstacles, after the wind is chosen so the level is checked with it
+            self.projectile.set_wind(self.wind_speed, self.wind_angle) # Set the wind of the projectile
+            self.volley.set_wind(self.wind_speed, self.wind_angle)
+            self.projectileImage.set_colour((self.rng.randint(100,255), self.rng.randint(100,255), self.rng.randint(100,255))) # Set the colour of the projectile to a random colour
             self.game_over = True # Set the boolean variable to True to indicate that the game is over
             self.saveState() # Call the function to save the game state
         else:
             self.game_over = True # Set the boolean variable to True to indicate that the game is over
 
 
-    def run(self):
+    def endShot(self, outcome):
         """
-        A function to run the game loop
+        A function to record the shot in flight in the replay and the telemetry, once, with how it ended.
         """
+        if self.shotVelocity is None: # No shot in flight, or it has already been recorded
+            return
+        vx, vy = self.shotVelocity
+        if self.replay is not None:
+            self.replay.add_shot(ReplayShot(vx, vy, self.shotSteps, outcome, self.bounceCounter))
+        if self.telemetry is not None: # Called before levelManager, so the shot is recorded with the level it was fired at
+            self.telemetry.record_shot(self.levelCounter, self.levelVersion, vx, vy, self.wind_speed, self.wind_angle, len(self.obstacleList),
+                                       self.shotSteps, self.shotTime, self.projectile.distance_traveled,
+                                       self.projectile.distance_traveled_x, self.projectile.distance_traveled_y, self.bounceCounter, outcome)
+        self.shotVelocity = None
 
-        """Set Level Start Conditions"""
-        self.projectile = Projectile(self.cannon.get_center()[0], self.cannon.get_center()[1], self.projectile_vx, self.projectile_vy, self.projectile_m, self.projectile_Cd, self.B2, 9.81) # Create a projectile object with the specified position, velocity, mass, drag coefficient, and acceleration due to gravity
-        self.projectileImage = ProjectileImage(self.cannon.get_center()[0], self.cannon.get_center()[1], 5) # Create a projectile image object with the specified position and size
-        self.windArrow = WindArrow(30, 70)
-        self.obstacleManager()
-        self.projectile.set_wind(self.read_file("wind_speed"), self.read_file("wind_angle")) # Set the wind of the projectile
-        pygame.mixer.set_num_channels(41)
+    def saveReplay(self):
+        """
+        A function to save the replay of the session to the replays folder.
+        """
+        if self.replay is None or not self.replay.get_shots(): # Nothing was fired so there is nothing to replay
+            return
+        try:
+            file_name = os.path.join(self.replayFolder, datetime.datetime.now().strftime("replay-%Y%m%d-%H%M%S.bin"))
+            self.replay.save(file_name)
+            self.log(f"Saved replay of {len(self.replay.get_shots())} shots to {file_name}")
+        except Exception as e:
+            self.log(e)
+            self.log("Error: Could not save replay.")
+
+    def toggleTrace(self):
+        """
+        A function to start recording a frame trace, or to stop and save the one being recorded.
+        """
+        try:
+            if self.profiler.trace is None:
+                self.profiler.start_trace(os.path.join(self.traceFolder, datetime.datetime.now().strftime(f"trace-%Y%m%d-%H%M%S.{self.traceFormat}")))
+                self.log("Recording frame trace")
+            else:
+                frames = len(self.profiler.trace)
+                self.log(f"Saved frame trace of {frames} frames to {self.profiler.stop_trace()}")
+        except Exception as e:
+            self.log(e)
+            self.log("Error: Could not save frame trace.")
+
+    def requestPreview(self):
+        """
+        A function to ask the predictor for the path of a shot with the current aim.
+        """
+        x, y = self.projectile.get_position()
+        vx, vy = self.projectile.get_velocity()
+        key = (x, y, vx, vy, self.projectile.wind_speed, self.projectile.wind_angle, self.levelVersion) # Everything that changes the path
+        if key == self.predictor.latest_key: # The aim has not changed
+            return
+        obstacles = self.obstacleRects # An array of rectangles is sent to the worker process far faster than obstacle objects
+        goal = (self.target.x, self.target.y, self.target.width, self.target.height)
+        p_width, p_height = self.projectileImage.get_size()
+        self.predictor.request(key, (x, y, vx, vy, self.projectile.m, self.projectile.Cd, self.projectile.B2,
+                                     self.projectile.wind_speed, self.projectile.wind_angle, obstacles, goal,
+                                     p_width, self.SCREEN_WIDTH, self.SCREEN_HEIGHT, self.projectile.dt))
 
+    def fireVolley(self):
+        """
+        A function to fire a volley of projectiles from the cannon, spread around the current aim.
+        """
+        vx, vy = self.projectile.get_velocity()
+        rng = np.random.default_rng(self.rng.getrandbits(32)) # Take the spread from the game's generator so it follows the seed
+        angle = math.atan2(vy, vx) + np.radians(rng.uniform(-self.volleySpread, self.volleySpread, self.volleySize))
+        power = math.hypot(vx, vy) * rng.uniform(0.9, 1.05, self.volleySize)
+        self.volley.fire(*self.cannon.get_center(), np.cos(angle) * power, np.sin(angle) * power)
+
+    def volleyStep(self):
+        """
+        A function to advance a volley by one fixed time step. The shot ends when a projectile reaches the target
+        or when none of them are flying any more.
+        """
+        self.volley.step()
+        hits, impact = self.volley.collide(None, (self.target.x, self.target.y, self.target.width, self.target.height),
+                                           self.SCREEN_WIDTH, self.SCREEN_HEIGHT)
+        if impact > 0:
+            self.mixer.request("bounce", bounce_volume(impact)) # One request for the loudest bounce of the step
+        if hits:
+            self.mixer.request("target")
+            self.levelManager(True) # Call the function to manage the levels
+        elif self.volley.count(VOLLEY_FLYING) == 0: # Every projectile has left the screen or come to rest
+            self.game_over = True
+
+    def physicsStep(self):
+        """
+        A function to advance the physics by one fixed time step and handle collisions.
+        Returns True if the projectile has left the screen.
+        """
+        if self.volleyMode and self.in_flight: # A volley is flying instead of the projectile
+            self.volleyStep()
+            return False
+        if self.projectile.sleeping: # The projectile has come to rest, so there is nothing to move or collide
+            return False
+        if self.in_flight: # If the projectile is in flight
+            self.projectile.update_position() # Call the method to update the position of the projectile
+            self.shotSteps += 1 # Count the steps so the replay can stop the shot at the same point
+            self.shotTime += self.projectile.last_dt if self.projectile.integrator == "rk45" else self.projectile.dt # The adaptive integrator changes dt after each step
+
+        if self.target.check_collision(self.projectile): # Call the method to check if the projectile has hit the target
+            self.endShot(SHOT_HIT) # Record the shot before the next level is made
+            self.projectile.hit_target = True # Set the boolean variable to True to indicate that the projectile has hit the target
+            self.levelManager(self.projectile.hit_target) # Call the function to manage the levels
+            self.mixer.request("target")
+        nearby = find_nearby(self.projectile, self.projectileImage, self.obstacleGrid) # Find the obstacles along the last step
+        for obstacle in nearby: # Run through the obstacles near the projectile
+            #check collision with projectile or target
+            if obstacle.check_collision(self.projectile, self.projectileImage, self) and not self.in_flight and self.levelPack is None: # Call the method to check if the projectile or target has hit the obstacle
+                self.obstacleManager() # Call the function to manage the obstacles. A pack level would only be loaded again, so it is kept
+                break # The obstacles have been replaced so stop checking the old ones
+        if self.in_flight and self.projectile.update_sleep(): # The projectile has come to rest, so the shot is over
+            self.endShot(SHOT_REST)
+            self.game_over = True
+
+        # Return True if the projectile has left the screen
+        return self.projectile.x < 0 or self.projectile.x > self.SCREEN_WIDTH or self.projectile.y > self.SCREEN_HEIGHT or self.projectile.x < 0
+
+    def loadSounds(self):
+        """
+        A function run by a background thread to decode the sounds, so the first frame does not wait for them.
+        """
+        try:
+            if pygame.mixer.get_init(): # There is nothing to decode them for without a mixer
+                self.assets.preload(SOUND_ASSETS)
+        except Exception as e:
+            self.log(e)
+            self.log("Error: Could not load the sounds.")
+        self.startup.mark_background("sounds")
+        self.log(f"Sounds ready {self.startup.background['sounds'] + IMPORT_TIME:.2f}s after the game started")
+        report = self.assets.get_report()
+        self.log(f"Loaded {report['items']} assets in {report['load_time_ms']:.1f}ms")
+        self.audioReady.set()
+
+    def startSounds(self):
+        """
+        A function to give the mixer its channels and start the ambient sounds, once the sounds have been decoded.
+        """
+        self.soundsStarted = True
+        if not pygame.mixer.get_init():
+            return
+        self.mixer.start() # Set up the channels of the sound effects
         #play amb1 sound on loop on channel 4
-        sound = pygame.mixer.Sound("assets\\amb1.mp3")
+        sound = self.assets.get_sound("amb1.mp3")
         channel = pygame.mixer.Channel(4)
         channel.play(sound, -1)
-        pygame.mixer.music.load("assets\\wind.mp3")
+        pygame.mixer.music.load(self.assets.get_path("wind.mp3")) # The wind is streamed as music rather than decoded
         pygame.mixer.music.play(-1)
+        pygame.mixer.music.set_volume(self.projectile.wind_speed/10)
+
+    def setupLevel(self):
+        """
+        A function to set the level start conditions: create the projectile, the wind arrow and the first level.
+        """
+        self.projectile = Projectile(self.cannon.get_center()[0], self.cannon.get_center()[1], self.projectile_vx, self.projectile_vy, self.projectile_m, self.projectile_Cd, self.B2, 9.81) # Create a projectile object with the specified position, velocity, mass, drag coefficient, and acceleration due to gravity
+        self.projectileImage = ProjectileImage(self.cannon.get_center()[0], self.cannon.get_center()[1], 5) # Create a projectile image object with the specified position and size
+        self.windArrow = WindArrow(30, 70)
+        self.replay = Replay(self.seed, self.SCREEN_WIDTH, self.SCREEN_HEIGHT, self.projectile_m, self.projectile_Cd, self.B2,
+                             self.projectile.gravity, self.projectile.dt, self.projectile.integrator, self.cannon.get_center(),
+                             self.physics_rate, self.projectileImage.get_size()[0]) # Record the session so it can be played again
+        if self.read_file("telemetry_file") and self.telemetry is None: # An empty file name turns the telemetry off
+            try:
+                self.telemetry = Telemetry(self.read_file("telemetry_file"), {"seed": self.seed, "width": self.SCREEN_WIDTH, "height": self.SCREEN_HEIGHT,
+                                                                              "mass": self.projectile_m, "Cd": self.projectile_Cd, "B2": self.B2,
+                                                                              "physics_rate": self.physics_rate})
+            except Exception as e:
+                self.log(e)
+                self.log("Error: Could not start the telemetry.")
+        self.obstacleManager()
+        self.projectile.set_wind(self.wind_speed, self.wind_angle) # Set the wind of the projectile
+        self.volley.set_wind(self.wind_speed, self.wind_angle) # Set the wind of the volley
+        self.startup.mark("level")
+
+    def drawFrame(self, alpha):
+        """
+        A function to draw one frame. alpha is how far the display is between the last two physics steps.
+        """
+        if self.levelChanged: # Draw the obstacles, target and wind arrow of a new level onto the level layer
+            #draw background image
+            #self.renderer.layer.blit(self.background, (0,0))
+            self.renderer.build_level(self.bg_colour, self.obstacleList, self.target, self.windArrow, self.projectile.wind_angle)
+            self.levelChanged = False
+        self.renderer.begin_frame() # Restore the level layer where things moved
+        if self.in_flight and not self.volleyMode:
+            last_x, last_y = self.projectile.get_last_position() # Draw the projectile between the last two physics steps so the motion is smooth
+            self.renderer.add(self.projectileImage.draw(self.screen, last_x + (self.projectile.x - last_x) * alpha, last_y + (self.projectile.y - last_y) * alpha)) # Draw the projectile on the screen
+        if len(self.volley): # Draw every projectile of the volley that is still on the screen
+            size = self.volley.size
+            for x, y in self.volley.get_positions(alpha).tolist():
+                self.renderer.add(self.screen.fill(self.projectileImage.projectile_colour, (x - size / 2, y - size / 2, size, size)))
+        self.renderer.add(self.cannon.draw(self.screen)) # Draw the cannon on the screen
+
+        preview = self.predictor.poll() # Get the newest aim preview without waiting for the worker
+        if preview is not None and not self.in_flight and self.showPreview and len(preview.points) > 1:
+            colour = (155, 255, 155) if preview.hit_goal else (120, 120, 120) # Show the preview in green when it reaches the target
+            self.renderer.add(pygame.draw.lines(self.screen, colour, False, preview.points, 1)) # Draw the predicted path
+
+        if len(self.projectile.trajectory) > 1: # If the projectile has a trajectory
+            self.renderer.add(pygame.draw.lines(self.screen, self.projectileImage.projectile_colour, False, self.projectile.trajectory.view(), 1)) # Draw the trajectory of the projectile on the screen (a view of the buffer, no copy)
+
+        self.renderer.add(self.hud.draw_line(self.screen, f"Cannon Velocity: {round(self.projectile.vx, 2)}, {round(self.projectile.vy, 2)} Wind Speed: {round(self.projectile.wind_speed,4)}m/s", (10, 10))) # Write the x-velocity and y-velocity of the cannon on the screen and round the values to 2 decimal places. Text is white
+        self.renderer.add(self.hud.draw_line(self.screen, f"Drag Coefficient: " + str(self.projectile_Cd) + ", Mass: " + str(self.projectile_m) + "Kg, Air Resistance: " + str(self.B2), (10, 30))) # Write the drag coefficient, mass, and air resistance of the projectile on the screen. Text is white
+        #self.renderer.add(self.hud.draw_line(self.screen, f"Bounces: {self.bounceCounter}", (10, 50))) # Write the number of bounces on the screen
+        if self.volleyMode: # Write how many projectiles of the volley are still flying
+            self.renderer.add(self.hud.draw_line(self.screen, f"Volley: {self.volleySize} projectiles, {self.volley.count(VOLLEY_FLYING)} flying", (10, 50)))
+        if self.profiler.show_overlay: # Write the frame times on the left of the screen
+            for i, line in enumerate(self.profiler.get_summary()):
+                self.renderer.add(self.hud.draw_line(self.screen, line, (10, 110 + i * 20))) # Below the wind arrow
+        self.profiler.lap("DRAW")
+
+        self.renderer.end_frame() # Update the parts of the screen that changed
+        self.profiler.lap("DISPLAY")
+
+    def run(self):
+        """
+        A function to run the game loop
+        """
+        self.setupLevel() # Create the projectile and the first level
 
         while self.running: # A loop to run the game while th boolean variable is True
-            pygame.mixer.music.set_volume(self.projectile.wind_speed/10)
+            if self.soundsStarted and pygame.mixer.get_init():
+                pygame.mixer.music.set_volume(self.projectile.wind_speed/10)
             self.projectile.set_position(self.cannon.get_center()[0], self.cannon.get_center()[1]) # Set the position of the projectile to the position of the cannon
             self.projectile.distance_traveled = 0 # Set the distance traveled to 0
             self.projectile.distance_traveled_x = 0 # Set the distance traveled in the x-direction to 0
             self.projectile.distance_traveled_y = 0 # Set the distance traveled in the y-direction to 0
             self.projectileImage.set_position(self.cannon.get_center()[0], self.cannon.get_center()[1]) # Set the position of the projectile image to the position of the cannon
             self.projectile.hit_target = False # A boolean variable to indicate if the projectile has hit the target
+            self.projectile.wake() # The projectile may have come to rest at the end of the last shot
             self.game_over = False # A boolean variable to indicate if the game is over
             self.launched = False # A boolean variable to indicate if the projectile has been launched
             self.in_flight = False # A boolean variable to indicate if the projectile is in flight
+            self.volley.clear() # Remove the projectiles of the last volley
             self.projectile.trajectory.clear() # Clear the trajectory list            
             self.bounceCounter = 0 # Set the bounce counter to 0
+            self.accumulator = 0 # Start the shot with no physics time waiting to be simulated
+            self.clock.tick() # Start timing from now so the time spent between shots is not simulated
 
             while not self.game_over: # A loop to run the game while the boolean variable is False
+                self.profiler.begin_frame() # Start timing the phases of this frame
 
                 """
                 This section of the code is executed once per frame and will handle any events that occur
@@ -593,67 +2116,108 @@ class Game: # A class to represent the game loop
                     self.projectile.set_vx_vy(math.cos(-angle_projectile)*self.cannon.get_power(), math.sin(-angle_projectile)*self.cannon.get_power()) # Set the x-velocity and y-velocity of the projectile based on the power and angle between the cannon and the mouse
                     self.launched = False # Set the boolean variable to False to indicate that the projectile has been launched
                     self.in_flight = True # Set the boolean variable to True to indicate that the projectile is in flight
-
-                if self.in_flight: # If the projectile is in flight
-                    self.projectile.update_position() # Call the method to update the position of the projectile
-
-                if self.target.check_collision(self.projectile): # Call the method to check if the projectile has hit the target
-                    self.projectile.hit_target = True # Set the boolean variable to True to indicate that the projectile has hit the target
-                    self.levelManager(self.projectile.hit_target) # Call the function to manage the levels
-                    pygame.mixer.Channel(0).play(pygame.mixer.Sound('assets\\dingup.mp3'))
-                for i in range(len(self.obstacleList)): # Run through the list of obstacles
-                    #check collision with projectile or target
-                    if self.obstacleList[i].check_collision(self.projectile, self.projectileImage) and not self.in_flight : # Call the method to check if the projectile or target has hit the obstacle
-                        self.obstacleManager() # Call the function to manage the obstacles
-
-                if self.projectile.x < 0 or self.projectile.x > self.SCREEN_WIDTH or self.projectile.y > self.SCREEN_HEIGHT or self.projectile.x < 0:
-                    pygame.mixer.Channel(0).play(pygame.mixer.Sound('assets\\error.mp3'))
+                    if self.volleyMode: # Fire a volley instead of the projectile. Volleys are not recorded in the replay
+                        self.fireVolley()
+                    else:
+                        self.shotVelocity = self.projectile.get_velocity() # Remember the launch velocity for the replay
+                        self.shotSteps = 0
+                        self.shotTime = 0
+
+                if not self.in_flight and self.showPreview: # Ask for a new aim preview if the aim has changed
+                    self.requestPreview()
+                self.profiler.lap("UPDATE")
+
+                # Run as many fixed physics steps as fit in the time since the last frame
+                self.accumulator += min(self.clock.tick(self.max_fps) / 1000, self.max_frame_time) # Limit the frame rate and add the frame time, capped so a long pause cannot cause a burst of steps
+                self.profiler.lap("WAIT") # The time spent waiting for the next frame is not part of the update
+                out_of_bounds = False # A boolean variable to indicate if the projectile has left the screen
+                while self.accumulator >= self.step_time and not self.game_over and not out_of_bounds:
+                    out_of_bounds = self.physicsStep() # Call the method to advance the physics by one step
+                    self.accumulator -= self.step_time
+                if out_of_bounds:
+                    self.endShot(SHOT_OUT)
+                    self.mixer.request("out")
+                    self.mixer.update() # Play it now, as the shot ends before the next frame
                     break
+                self.mixer.update() # Play the sounds the physics steps asked for, once per frame however many steps ran
+                alpha = self.accumulator / self.step_time # How far the display is between the last two physics steps
+                self.profiler.lap("UPDATE")
 
                 """EVENT HANDLING"""
                 for event in pygame.event.get(): # Get all the events that occur
+                    if event.type == pygame.VIDEOEXPOSE: # If the window has to be drawn again, for example after being uncovered
+                        self.renderer.full_redraw = True
                     if event.type == pygame.QUIT: # If the user clicks the close button, end the game
+                        self.endShot(SHOT_ABORTED)
                         self.running = False # Set the boolean variable to False to indicate that the game is over
                         self.game_over = True # Set the boolean variable to True to indicate that the game is over
                         break
                     if event.type == pygame.KEYDOWN: # If the user presses a key
                         if event.key == pygame.K_l:
+                            self.endShot(SHOT_ABORTED)
                             self.game_over = True
                             self.levelManager(True)
+                        elif event.key == pygame.K_v and not self.in_flight: # Switch between firing one projectile and firing volleys
+                            self.volleyMode = not self.volleyMode
+                            self.renderer.full_redraw = True # Clear the volley line from the screen
+                        elif event.key == pygame.K_p: # Turn the aim preview on or off
+                            self.showPreview = not self.showPreview
+                        elif event.key == pygame.K_F3: # Turn the frame time overlay on or off
+                            self.profiler.show_overlay = not self.profiler.show_overlay
+                            self.renderer.full_redraw = True # Clear the overlay from the screen when it is turned off
+                        elif event.key == pygame.K_F4: # Start or stop recording a frame trace
+                            self.toggleTrace()
                     elif event.type == pygame.MOUSEBUTTONDOWN: # If the user clicks the mouse
                         if event.button == 1: # If the user clicks the left mouse button
                             if not self.launched and not self.in_flight: # If the projectile has not been launched and is not in flight
                                 self.launched = True # Set the boolean variable to True to indicate that the projectile has been launched
+                                self.predictor.clear() # Hide the preview while the shot is in flight
                             else: # If the projectile has been launched or is in flight
+                                self.endShot(SHOT_ABORTED)
                                 self.game_over = True # Set the boolean variable to True to indicate that the game is over 
                                 
-                """DRAW THE GAME STATE"""
-                self.screen.fill(self.bg_colour) # Fill the screen with the background colour
-                #draw background image
-                #self.screen.blit(self.background, (0,0))
-                if self.in_flight:
-                    self.projectileImage.draw(self.screen, self.projectile.x, self.projectile.y) # Draw the projectile on the screen
-                self.cannon.draw(self.screen) # Draw the cannon on the screen
-                self.target.draw(self.screen) # Draw the target on the screen
-                for i in range(len(self.obstacleList)): # Loop through the list of obstacles
-                    self.obstacleList[i].draw(self.screen) # Draw the obstacle on the screen
-
-                self.windArrow.draw_rotate(self.projectile.wind_angle, self.screen) # Draw the wind arrow on the screen
-
-                if len(self.projectile.trajectory) > 1: # If the projectile has a trajectory
-                    pygame.draw.lines(self.screen, self.projectileImage.projectile_colour, False, self.projectile.trajectory[-1000:], 1) # Draw the trajectory of the projectile on the screen
-
-                font = pygame.font.SysFont("consolas", 20) # Set the font and size of the text that will be displayed on the screen
-                text = font.render(f"Cannon Velocity: {round(self.projectile.vx, 2)}, {round(self.projectile.vy, 2)} Wind Speed: {round(self.projectile.wind_speed,4)}m/s", True, (255, 255, 255)) # Write the x-velocity and y-velocity of the cannon on the screen and round the values to 2 decimal places. Text is white
-                self.screen.blit(text, (10, 10)) # Draw the text on the screen
-                text = font.render(f"Drag Coefficient: " + str(self.projectile_Cd) + ", Mass: " + str(self.projectile_m) + "Kg, Air Resistance: " + str(self.B2), True, (255, 255, 255)) # Write the drag coefficient, mass, and air resistance of the projectile on the screen. Text is white
-                self.screen.blit(text, (10, 30)) # Draw the text on the screen
-                #text = font.render(f"Bounces: {self.bounceCounter}", True, (255, 255, 255)) # Write the wind angle on the screen and round the value to 4 decimal places. Text is white
-                #self.screen.blit(text, (10, 50)) # Draw the text on the screen
-
-                pygame.display.flip() # Update the screen
+                self.profiler.lap("EVENT HANDLING")
 
+                """DRAW THE GAME STATE"""
+                self.drawFrame(alpha) # Draw the frame
+                if not self.startup.done: # Report how long it took to get the first frame on the screen
+                    self.startup.mark("first frame")
+                    self.startup.done = True
+                    self.log(self.startup.get_report())
+                    self.audioThread.start() # Decode the sounds now the player can see the game
+                if not self.soundsStarted and self.audioReady.is_set(): # Start the sounds as soon as they have been decoded
+                    self.startSounds()
+                self.profiler.end_frame() # Finish timing this frame
+
+        self.predictor.close() # Stop the aim preview worker
+        self.levelGenerator.close() # Stop the level generator workers
+        self.saveState() # Save the game state before quitting
+        self.saveReplay() # Save the replay of the session
+        if self.levelPack is not None: # Close the pack after the replay, as the replay uses the obstacles of its levels
+            self.levelPack.close()
+        if self.telemetry is not None: # Write the shots that are still waiting
+            self.telemetry.close()
+            if self.telemetry.written:
+                self.log(f"Recorded {self.telemetry.written} shots to {self.telemetry.file_name}")
+            if self.telemetry.dropped:
+                self.log(f"{self.telemetry.dropped} shots were not recorded because the telemetry queue was full", "WARNING")
+        if self.profiler.trace is not None: # Write a trace that was still being recorded
+            self.toggleTrace()
+        self.settings.close() # Write any remaining changes and wait for the file to be written
+        report = self.assets.get_report()
+        self.log(f"Asset cache: {report['hits']} hits, {report['misses']} misses ({report['hit_rate']:.1%} hit rate)")
+        self.log(f"HUD: {self.hud.renders} lines rendered, {self.hud.reuses} reused")
+        report = self.mixer.get_report()
+        self.log(f"Sound: {report['played']} of {report['requests']} requests played, {report['culled']} too quiet, {report['cooldown']} in cooldown, {report['coalesced']} merged, {report['stolen']} voices stolen")
+        self.logger.close() # Write the remaining messages and stop the logger
         pygame.quit() # Quit the game
 
-game = Game() # Create an instance of the Game class
-game.run()
\ No newline at end of file
+def main():
+    """
+    A function to start the game. Importing this module does not start anything, so the classes can be used by other scripts.
+    """
+    game = Game() # Create an instance of the Game class
+    game.run()
+
+if __name__ == "__main__": # Only start the game when the file is run
+    main()
\ No newline at end of file
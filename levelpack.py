@@ -0,0 +1,219 @@
+"""
+Level packs.
+
+A level pack is a file of levels. Each level stores the seed it was made with, its wind, its goal and its obstacles,
+with the obstacles as one packed array of (x, y, width, height) rectangles. After the header comes an index with
+the position of every level, so a pack is opened by memory mapping the file and level N is found by reading one
+index entry: nothing else in the file is read or parsed. The obstacles of a level are returned as a NumPy array
+that points straight into the mapped file, so a level with tens of thousands of obstacles takes no longer to load
+than one with a few.
+
+Run with: python levelpack.py info <pack> [level]
+          python levelpack.py from-replay <replay> <pack>
+          python levelpack.py random <pack> [--levels N] [--obstacles N] [--seed N]
+"""
+import mmap # Import the mmap module used to open packs without reading them
+import os # Import the os module
+import random # Import the random module
+import struct # Import the struct module used to pack the levels into bytes
+import sys # Import the sys module
+import time # Import the time module
+import numpy as np # Import the numpy module
+
+MAGIC = b"NEAP" # The first bytes of every level pack
+VERSION = 1 # The version of the level pack format
+
+# Record layouts, all little-endian. Every record is a multiple of 8 bytes long so the obstacle arrays are aligned.
+HEADER = struct.Struct("<4sHHIII4x") # magic, version, unused, level count, screen width, screen height, padding
+INDEX = struct.Struct("<QQ") # where the level starts, the number of obstacles
+LEVEL = struct.Struct("<QIIdd4f") # seed, level number, unused, wind speed, wind angle, goal rectangle
+RECT_DTYPE = np.dtype("<f4") # The obstacles are stored as 4 of these per rectangle, like the rectangles of a replay
+
+class PackLevel:
+    """
+    A class to hold a level of a level pack.
+    """
+    def __init__(self, seed, levelCounter, wind_speed, wind_angle, goal, obstacles):
+        """
+        Initialize the level. obstacles is an array of (x, y, width, height) rectangles with shape (count, 4),
+        including the floor, ceiling and wall.
+        """
+        self.seed = seed # The seed the level was made with
+        self.levelCounter = levelCounter # The level number
+        self.wind_speed = wind_speed # The wind speed in m/s
+        self.wind_angle = wind_angle # The wind direction in degrees
+        self.goal = goal # The goal as an (x, y, width, height) rectangle
+        self.obstacles = obstacles # The obstacles, a view of the file when the level was loaded from a pack
+
+    def __len__(self):
+        """
+        A method to return the number of obstacles.
+        """
+        return len(self.obstacles)
+
+def save_pack(file_name, levels, width=1000, height=800):
+    """
+    A function to write a list of levels to a level pack. The levels are written one at a time after the index,
+    so only one level is ever held as bytes.
+    """
+    folder = os.path.dirname(file_name)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    rects = [np.ascontiguousarray(level.obstacles, dtype=RECT_DTYPE).reshape(-1, 4) for level in levels]
+    offset = HEADER.size + INDEX.size * len(levels) # The first level starts after the index
+    index = bytearray()
+    for level_rects in rects:
+        index += INDEX.pack(offset, len(level_rects))
+        offset += LEVEL.size + level_rects.nbytes + (-level_rects.nbytes % 8) # Pad so the next level starts aligned
+    with open(file_name, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, 0, len(levels), width, height))
+        file.write(index)
+        for level, level_rects in zip(levels, rects):
+            file.write(LEVEL.pack(level.seed, level.levelCounter, 0, level.wind_speed, level.wind_angle, *level.goal))
+            file.write(level_rects.tobytes())
+            file.write(bytes(-level_rects.nbytes % 8))
+
+class LevelPack:
+    """
+    A class to read levels from a level pack through a memory map. Loading a level only reads its index entry
+    and its own record, and its obstacles are not copied out of the map.
+    """
+    def __init__(self, file_name):
+        """
+        Open the pack. Raises ValueError if the file is not a level pack.
+        """
+        self.file_name = file_name # The name of the pack file
+        self.file = open(file_name, "rb")
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) # The operating system reads the pages that are used
+        except ValueError: # An empty file cannot be mapped
+            self.file.close()
+            raise ValueError("Level pack is empty")
+        if len(self.map) < HEADER.size:
+            self.close()
+            raise ValueError("Level pack is too short")
+        magic, version, unused, count, self.width, self.height = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError("Not a level pack")
+        if version != VERSION:
+            self.close()
+            raise ValueError(f"Unsupported level pack version: {version}")
+        if len(self.map) < HEADER.size + count * INDEX.size:
+            self.close()
+            raise ValueError("Level pack is cut short")
+        self.count = count # The number of levels in the pack
+
+    def __len__(self):
+        """
+        A method to return the number of levels in the pack.
+        """
+        return self.count
+
+    def __getitem__(self, number):
+        """
+        A method to return a level by its position in the pack.
+        """
+        return self.get_level(number)
+
+    def get_level(self, number):
+        """
+        A method to load level number (counting from 0). The obstacles are a read-only array backed by the file.
+        Raises IndexError if there is no such level and ValueError if the level runs past the end of the file.
+        """
+        if number < 0:
+            number += self.count
+        if not 0 <= number < self.count:
+            raise IndexError(f"Level {number} is not in a pack of {self.count} levels")
+        offset, count = INDEX.unpack_from(self.map, HEADER.size + number * INDEX.size)
+        if offset + LEVEL.size + count * 4 * RECT_DTYPE.itemsize > len(self.map):
+            raise ValueError(f"Level {number} is cut short")
+        seed, levelCounter, unused, wind_speed, wind_angle, gx, gy, gw, gh = LEVEL.unpack_from(self.map, offset)
+        obstacles = np.frombuffer(self.map, dtype=RECT_DTYPE, count=count * 4, offset=offset + LEVEL.size).reshape(count, 4)
+        return PackLevel(seed, levelCounter, wind_speed, wind_angle, (gx, gy, gw, gh), obstacles)
+
+    def close(self):
+        """
+        A method to close the pack. Obstacle arrays of its levels must not be used afterwards.
+        """
+        try:
+            if getattr(self, "map", None) is not None:
+                self.map.close()
+        except BufferError: # An obstacle array still points into the map, so leave closing it to the garbage collector
+            pass
+        self.map = None
+        self.file.close()
+
+    def __enter__(self):
+        """
+        A method to use the pack in a with statement, which closes it at the end.
+        """
+        return self
+
+    def __exit__(self, *args):
+        """
+        A method to close the pack at the end of a with statement.
+        """
+        self.close()
+
+def levels_from_replay(replay):
+    """
+    A function to turn the levels of a replay into pack levels, without repeating a layout that was played twice.
+    """
+    from replay import ReplayLevel # Only needed here, so opening packs does not import the replays
+    levels = []
+    seen = set()
+    for event in replay.events:
+        if isinstance(event, ReplayLevel) and event.version not in seen:
+            seen.add(event.version)
+            levels.append(PackLevel(replay.seed, event.levelCounter, event.wind_speed, event.wind_angle, event.target,
+                                    np.array(event.obstacles, dtype=RECT_DTYPE).reshape(-1, 4)))
+    return levels
+
+def random_levels(count, obstacles, width=1000, height=800, seed=0):
+    """
+    A function to make levels of random obstacles with the floor, ceiling and wall of the game. The levels are not
+    checked to be solvable, so they are for testing how the game copes with large levels.
+    """
+    rng = random.Random(seed)
+    levels = []
+    for number in range(count):
+        level_seed = rng.getrandbits(32)
+        generator = np.random.default_rng(level_seed)
+        rects = np.empty((obstacles + 3, 4), dtype=RECT_DTYPE)
+        rects[:3] = [(0, height - 5, width, 50), (0, -45, width, 50), (width - 5, 0, 50, height)] # Floor, ceiling and wall
+        rects[3:, 0] = generator.integers(200, width, obstacles) # Leave the cannon clear
+        rects[3:, 1] = generator.integers(0, height, obstacles)
+        rects[3:, 2:] = generator.integers(2, 12, (obstacles, 2))
+        goal = (width - 100, rng.randint(50, height - 50), 20, 20)
+        levels.append(PackLevel(level_seed, number * 2 + 1, rng.random() * 3, rng.randint(0, 360), goal, rects))
+    return levels
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] not in ("info", "from-replay", "random"):
+        print(__doc__.strip().split("\n\n")[-1])
+        sys.exit(2)
+    command = sys.argv[1]
+    if command == "info":
+        start = time.perf_counter()
+        with LevelPack(sys.argv[2]) as pack:
+            opened = time.perf_counter() - start
+            print(f"{sys.argv[2]}: {len(pack)} levels for a {pack.width}x{pack.height} screen, opened in {opened * 1000:.3f}ms")
+            numbers = [int(sys.argv[3])] if len(sys.argv) > 3 else range(len(pack))
+            for number in numbers:
+                start = time.perf_counter()
+                level = pack.get_level(number)
+                elapsed = time.perf_counter() - start
+                print(f"Level {number}: number {level.levelCounter}, seed {level.seed}, wind {level.wind_speed:.2f} at {level.wind_angle:.0f} degrees, "
+                      f"goal {level.goal}, {len(level)} obstacles, loaded in {elapsed * 1000:.3f}ms")
+    elif command == "from-replay":
+        from replay import Replay
+        replay = Replay.load(sys.argv[2])
+        levels = levels_from_replay(replay)
+        save_pack(sys.argv[3], levels, replay.width, replay.height)
+        print(f"Saved {len(levels)} levels to {sys.argv[3]}")
+    else:
+        options = dict(zip(sys.argv[3::2], sys.argv[4::2]))
+        levels = random_levels(int(options.get("--levels", 10)), int(options.get("--obstacles", 10000)), seed=int(options.get("--seed", 0)))
+        save_pack(sys.argv[2], levels)
+        print(f"Saved {len(levels)} levels to {sys.argv[2]}")
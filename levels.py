@@ -0,0 +1,235 @@
+"""
+Level generation.
+
+A layout of random obstacles is only used if it does not cover the cannon or the goal and the goal can still be hit.
+Whether the goal can be hit is found by simulating shots headlessly: for each launch angle the power that passes
+through the goal is found once per level, then every candidate layout is checked by flying those shots through
+its obstacles. Candidate layouts are checked in parallel in a process pool. If no layout is found within the time
+budget fewer obstacles are tried, down to half of them, and when the time is up the last layout is kept without the
+obstacles in the way of one of the shots, so a level is always produced in bounded time and is never left empty.
+The budget can also be a number of layouts instead of a time, for headless games that must only depend on their seed.
+"""
+import math # Import the math module
+import multiprocessing # Import the multiprocessing module
+import os # Import the os module
+import random # Import the random module
+import time # Import the time module
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError # Import the process pool used to check layouts in parallel
+import numpy as np # Import the numpy module
+from simulation import solve_power, launch_velocity, simulate_batch, simulate_hits, HIT_GOAL # Import the headless simulation
+
+AIM_ANGLES = np.arange(-80, 86, 5.0) # The launch angles (degrees above the horizontal) searched for solutions
+
+def rects_overlap(a, b, margin=0):
+    """
+    A function to check if two (x, y, width, height) rectangles overlap, with an optional gap that must be kept between them.
+    """
+    return (a[0] < b[0] + b[2] + margin and b[0] < a[0] + a[2] + margin and
+            a[1] < b[1] + b[3] + margin and b[1] < a[1] + a[3] + margin)
+
+def place_obstacles(rng, width, height, count, keep_clear, min_size=20, max_size=100, tries=20):
+    """
+    A function to place up to count random obstacles the same way obstacleManager did, skipping any that would
+    overlap a keep_clear rectangle or another obstacle. Each obstacle gets a number of tries before it is left out.
+    """
+    rects = []
+    for i in range(count):
+        for attempt in range(tries):
+            rect = (rng.randint(0, width), rng.randint(0, height), rng.randint(min_size, max_size), rng.randint(min_size, max_size))
+            if not any(rects_overlap(rect, other) for other in keep_clear) and not any(rects_overlap(rect, other) for other in rects):
+                rects.append(rect)
+                break
+    return rects
+
+def find_aims(start, goal, physics, width, height, angles=AIM_ANGLES):
+    """
+    A function to find launch angles and powers whose path passes through the centre of the goal, ignoring obstacles.
+    The powers are solved with the game's own time step, so they are exact for the shots check_layout flies.
+    Returns two arrays: angles and powers.
+    """
+    x0, y0 = start
+    powers, simulations = solve_power(x0, y0, goal[0] + goal[2] / 2, goal[1] + goal[3] / 2, angles, mass=physics["mass"],
+                                      Cd=physics["Cd"], B2=physics["B2"], wind_speed=physics["wind_speed"],
+                                      wind_angle=physics["wind_angle"], dt=physics["dt"], height=height)
+    found = ~np.isnan(powers)
+    return angles[found], powers[found]
+
+def check_layout(obstacles, start, goal, aims, physics, width, height):
+    """
+    A function to fly every candidate aim through a layout of obstacles.
+    Returns the index of the first aim that reaches the goal without touching an obstacle, or -1.
+    This is a module level function so it can run in a worker process.
+    """
+    angles, powers = aims
+    if len(angles) == 0:
+        return -1
+    vx0, vy0 = launch_velocity(angles, powers)
+    outcome = simulate_hits(start[0], start[1], vx0, vy0, obstacles, goal, size=physics["size"], mass=physics["mass"],
+                            Cd=physics["Cd"], B2=physics["B2"], wind_speed=physics["wind_speed"],
+                            wind_angle=physics["wind_angle"], dt=physics["dt"], width=width, height=height)
+    hits = np.flatnonzero(outcome == HIT_GOAL)
+    return int(hits[0]) if hits.size else -1
+
+def path_touches(x, y, rects, size):
+    """
+    A function to return which (x, y, width, height) rectangles a box of the given size touches anywhere along a path.
+    """
+    if len(rects) == 0:
+        return np.zeros(0, dtype=bool)
+    reach_x = (rects[:, 2] + size) / 2 # How close the centres have to be to touch
+    reach_y = (rects[:, 3] + size) / 2
+    return ((np.abs(x[:, None] - (rects[:, 0] + rects[:, 2] / 2)) < reach_x) &
+            (np.abs(y[:, None] - (rects[:, 1] + rects[:, 3] / 2)) < reach_y)).any(axis=0)
+
+def clear_path(layout, fixed, start, goal, aims, physics, width, height, margin=0.5):
+    """
+    A function to remove the obstacles of a layout that are in the way of one of the aims, choosing the aim that
+    removes the fewest. The path of each aim is flown with the same steps as check_layout, up to the goal.
+    Returns the obstacles that are kept and the index of the aim, or the layout and -1 if no aim can be cleared.
+    """
+    angles, powers = aims
+    if len(angles) == 0:
+        return layout, -1
+    vx0, vy0 = launch_velocity(angles, powers)
+    paths = simulate_batch(start[0], start[1], vx0, vy0, physics["mass"], physics["Cd"], physics["B2"], physics["wind_speed"],
+                           physics["wind_angle"], dt=physics["dt"], floor_y=height, x_min=0, x_max=width, max_steps=3000,
+                           sample_every=1).trajectories # The position at every step, as simulate_hits flies them
+    rects = np.asarray(layout, dtype=float).reshape(-1, 4)
+    walls = np.asarray(fixed, dtype=float).reshape(-1, 4)
+    best, best_blocked = -1, None
+    for aim, path in enumerate(paths):
+        x, y = path[1:, 0], path[1:, 1] # The launch point itself is not checked
+        in_goal = np.flatnonzero((x > goal[0]) & (x < goal[0] + goal[2]) & (y > goal[1]) & (y < goal[1] + goal[3]))
+        if in_goal.size == 0: # This aim does not reach the goal within the steps
+            continue
+        x, y = x[:in_goal[0]], y[:in_goal[0]] # The path before the goal
+        if path_touches(x, y, walls, physics["size"] + margin * 2).any(): # The floor, ceiling and wall cannot be removed
+            continue
+        blocked = path_touches(x, y, rects, physics["size"] + margin * 2) # A little extra so rounding cannot let a shot graze one
+        if best < 0 or blocked.sum() < best_blocked.sum():
+            best, best_blocked = aim, blocked
+    if best < 0:
+        return layout, -1
+    return [rect for rect, remove in zip(layout, best_blocked) if not remove], best
+
+class GeneratedLevel:
+    """
+    A class to hold a generated layout and how it was found.
+    """
+    def __init__(self, rects, solvable, solution, attempts, elapsed):
+        """
+        Initialize the level with its obstacles and the search results.
+        """
+        self.rects = rects # The random obstacles as (x, y, width, height) rectangles
+        self.solvable = solvable # True if a shot that reaches the goal was found
+        self.solution = solution # An (angle, power) pair that reaches the goal, or None
+        self.attempts = attempts # The number of layouts that were checked
+        self.elapsed = elapsed # The time in seconds the search took
+
+class LevelGenerator:
+    """
+    A class to generate solvable levels, checking candidate layouts in a process pool.
+    """
+    def __init__(self, workers=None, time_budget=1.0, use_processes=None, min_fraction=0.5, max_attempts=None):
+        """
+        Initialize the generator. The process pool is started by start, or the first time it is needed.
+        With max_attempts the search is limited to that many layouts instead of time_budget seconds, so the level
+        only depends on the seed and not on how fast the computer is.
+        """
+        self.workers = workers or os.cpu_count() or 1 # The number of layouts checked at the same time
+        self.time_budget = time_budget # The time in seconds the search may take, half way through fewer obstacles are tried
+        self.use_processes = use_processes if use_processes is not None else self.workers > 1 # A pool is only worth it with more than one CPU
+        self.min_fraction = min_fraction # The smallest part of the obstacles that easing tries
+        self.max_attempts = max_attempts # The number of layouts the search may try, None to use the time budget
+        self.executor = None # The process pool
+        self.warmup = [] # Tasks that make the pool start its workers, done once the workers are running
+
+    def start(self):
+        """
+        A method to start the process pool in the background, so its start-up is not part of the first level's time budget.
+        """
+        if self.use_processes and self.executor is None:
+            # Spawn fresh processes rather than forking, so the workers do not inherit the game's window and threads
+            self.executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+            self.warmup = [self.executor.submit(os.getpid) for i in range(self.workers)]
+
+    def is_ready(self):
+        """
+        A method to return True once the workers of the process pool are running.
+        """
+        return self.executor is not None and all(future.done() for future in self.warmup)
+
+    def check_layouts(self, layouts, start, goal, aims, physics, width, height, deadline=None):
+        """
+        A method to check a batch of layouts, in parallel once the process pool is running. Results that are not
+        ready by the deadline (a time.perf_counter time) count as unsolvable and their tasks are cancelled.
+        """
+        self.start()
+        if self.use_processes and self.is_ready():
+            futures = [self.executor.submit(check_layout, layout, start, goal, aims, physics, width, height) for layout in layouts]
+            results = []
+            try:
+                for future in futures:
+                    results.append(future.result(timeout=None if deadline is None else max(deadline - time.perf_counter(), 0)))
+            except FutureTimeoutError: # Out of time, so stop waiting and drop the checks that have not started
+                for future in futures:
+                    future.cancel()
+            return results + [-1] * (len(layouts) - len(results))
+        # Checked here while the pool is still starting, so the first levels do not wait for it
+        return [check_layout(layout, start, goal, aims, physics, width, height) for layout in layouts]
+
+    def generate(self, width, height, count, fixed, keep_clear, start, goal, physics, seed=None):
+        """
+        A method to generate a solvable layout of up to count random obstacles.
+
+        fixed is a list of rectangles that are always in the level (floor, ceiling and walls), keep_clear is a list of
+        rectangles no obstacle may overlap (the cannon and the goal), start is where shots are fired from, goal is the
+        goal rectangle and physics is a dictionary with mass, Cd, B2, wind_speed, wind_angle, size and dt.
+        The same seed tries the same layouts in the same order; with a time budget how soon fewer obstacles are tried
+        depends on timing, with max_attempts it does not.
+        """
+        rng = random.Random(seed) # Use a generator of our own so the level only depends on the seed
+        start_time = time.perf_counter()
+        if self.max_attempts is None: # The budget is time
+            limit = start_time + self.time_budget * 0.85 # After this no more layouts are tried, the rest of the budget is for clearing a path
+            ease_at = start_time + self.time_budget / 2 # After this fewer obstacles are tried
+        else: # The budget is a number of layouts
+            limit = self.max_attempts
+            ease_at = self.max_attempts / 2
+        aims = find_aims(start, goal, physics, width, height) # The shots that reach the goal without obstacles
+        attempts = 0
+        min_count = max(1, math.ceil(count * self.min_fraction)) # Easing stops here so the level keeps its difficulty
+        layout = [] # The last layout that was tried
+        while count > 0 and len(aims[0]) > 0:
+            layouts = [place_obstacles(rng, width, height, count, keep_clear) for i in range(self.workers)]
+            results = self.check_layouts([fixed + layout for layout in layouts], start, goal, aims, physics, width, height,
+                                         limit if self.max_attempts is None else None)
+            attempts += len(layouts)
+            for layout, result in zip(layouts, results): # Take the first solvable layout so the result does not depend on timing
+                if result >= 0:
+                    return GeneratedLevel(layout, True, (float(aims[0][result]), float(aims[1][result])), attempts, time.perf_counter() - start_time)
+            layout = layouts[0]
+            spent = time.perf_counter() if self.max_attempts is None else attempts
+            if spent >= limit: # Out of time or layouts
+                break
+            if spent >= ease_at: # Running out, so try a quarter fewer obstacles and halve what is left until the next cut
+                count = max(min(count - 1, math.floor(count * 0.75)), min_count)
+                ease_at = spent + (limit - spent) / 2
+        if layout: # Out of time or layouts, so keep the last layout without the obstacles in the way of one of the shots
+            kept, aim = clear_path(layout, fixed, start, goal, aims, physics, width, height)
+            if aim >= 0:
+                cleared = (aims[0][aim:aim + 1], aims[1][aim:aim + 1])
+                if check_layout(fixed + kept, start, goal, cleared, physics, width, height) == 0:
+                    return GeneratedLevel(kept, True, (float(cleared[0][0]), float(cleared[1][0])), attempts, time.perf_counter() - start_time)
+        # The goal cannot be reached at all, so only use the fixed obstacles
+        result = check_layout(fixed, start, goal, aims, physics, width, height)
+        solution = (float(aims[0][result]), float(aims[1][result])) if result >= 0 else None
+        return GeneratedLevel([], result >= 0, solution, attempts, time.perf_counter() - start_time)
+
+    def close(self):
+        """
+        A method to stop the process pool.
+        """
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
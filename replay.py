@@ -0,0 +1,312 @@
+"""
+Replays of game sessions.
+
+A replay stores the seed of the session, the physics of the projectile, every level that was played (the target,
+the wind and the obstacles) and every shot that was fired (the launch velocity and how many physics steps it lasted).
+The layouts are stored rather than generated again from the seed because how many obstacles the level generator
+manages to place depends on how fast the computer is.
+
+The game physics runs with a fixed time step, so flying the recorded shots through the recorded levels gives exactly
+the same result as the session. This is done without a window and as fast as possible, so a replay can be used to
+check a change to the physics did not change any shot, or to reproduce a bug report.
+
+Run with: python replay.py <file> [--show] [--speed N]
+"""
+import math # Import the math module
+import os # Import the os module
+import struct # Import the struct module used to pack the replay into bytes
+import sys # Import the sys module
+import time # Import the time module
+
+MAGIC = b"NEAR" # The first bytes of every replay file
+VERSION = 1 # The version of the replay format
+
+INTEGRATORS = ("euler", "semi_implicit", "rk4", "rk45") # The integrators, stored by their position in this tuple
+
+# How a shot ended
+SHOT_ABORTED = 0 # The player clicked again, skipped the level or quit while the projectile was in flight
+SHOT_HIT = 1 # The projectile hit the target
+SHOT_OUT = 2 # The projectile left the screen
+SHOT_REST = 3 # The projectile came to rest
+OUTCOME_NAMES = {SHOT_ABORTED: "aborted", SHOT_HIT: "hit", SHOT_OUT: "out", SHOT_REST: "rest"}
+
+# Record layouts, all little-endian
+HEADER = struct.Struct("<4sHQHHdddddBdddH") # magic, version, seed, width, height, mass, Cd, B2, gravity, dt, integrator, cannon x, cannon y, physics rate, projectile size
+LEVEL = struct.Struct("<IIdd4fI") # level number, the number of the layout, wind speed, wind angle, target rectangle, obstacle count
+RECT = struct.Struct("<4f") # An obstacle rectangle
+SHOT = struct.Struct("<ddIBI") # vx, vy, physics steps, outcome, bounces
+LEVEL_TAG = b"L" # The byte before a level record
+SHOT_TAG = b"S" # The byte before a shot record
+
+class ReplayLevel:
+    """
+    A class to hold a level of a replay.
+    """
+    def __init__(self, levelCounter, version, wind_speed, wind_angle, target, obstacles):
+        """
+        Initialize the level with its target, wind and obstacles.
+        """
+        self.levelCounter = levelCounter # The level number
+        self.version = version # The number of the obstacle layout in the session
+        self.wind_speed = wind_speed # The wind speed in m/s
+        self.wind_angle = wind_angle # The wind direction in degrees
+        self.target = target # The target as an (x, y, width, height) rectangle
+        self.obstacles = obstacles # The obstacles as (x, y, width, height) rectangles, including the floor, ceiling and wall
+
+class ReplayShot:
+    """
+    A class to hold a shot of a replay.
+    """
+    def __init__(self, vx, vy, steps, outcome, bounces=0):
+        """
+        Initialize the shot with its launch velocity and how it ended.
+        """
+        self.vx = vx # The x-velocity at launch
+        self.vy = vy # The y-velocity at launch
+        self.steps = steps # The number of physics steps the shot lasted
+        self.outcome = outcome # How the shot ended, one of SHOT_ABORTED, SHOT_HIT, SHOT_OUT or SHOT_REST
+        self.bounces = bounces # The number of bounces loud enough to be heard
+
+class Replay:
+    """
+    A class to hold a replay: the session settings and a list of levels and shots in the order they happened.
+    """
+    def __init__(self, seed, width, height, mass, Cd, B2, gravity, dt, integrator, cannon, physics_rate, size):
+        """
+        Initialize an empty replay with the settings of the session.
+        """
+        self.seed = seed # The seed of the random generator of the session
+        self.width = width # The width of the screen
+        self.height = height # The height of the screen
+        self.mass = mass # The mass of the projectile
+        self.Cd = Cd # The drag coefficient of the projectile
+        self.B2 = B2 # The constant for air resistance
+        self.gravity = gravity # The acceleration due to gravity
+        self.dt = dt # The time step of the integrator
+        self.integrator = integrator # The name of the integrator
+        self.cannon = cannon # The (x, y) position shots are fired from
+        self.physics_rate = physics_rate # The number of physics steps per second during play
+        self.size = size # The size of the projectile in pixels
+        self.events = [] # ReplayLevel and ReplayShot objects in the order they happened
+
+    def add_level(self, level):
+        """
+        A method to add a level to the replay. Shots that follow are fired in this level.
+        """
+        self.events.append(level)
+
+    def add_shot(self, shot):
+        """
+        A method to add a shot to the replay.
+        """
+        self.events.append(shot)
+
+    def get_shots(self):
+        """
+        A method to return each shot with the level it was fired in.
+        """
+        level = None
+        shots = []
+        for event in self.events:
+            if isinstance(event, ReplayLevel):
+                level = event
+            elif level is not None:
+                shots.append((level, event))
+        return shots
+
+    def to_bytes(self):
+        """
+        A method to pack the replay into bytes.
+        """
+        data = bytearray(HEADER.pack(MAGIC, VERSION, self.seed, self.width, self.height, self.mass, self.Cd, self.B2,
+                                     self.gravity, self.dt, INTEGRATORS.index(self.integrator), self.cannon[0],
+                                     self.cannon[1], self.physics_rate, self.size))
+        for event in self.events:
+            if isinstance(event, ReplayLevel):
+                data += LEVEL_TAG
+                data += LEVEL.pack(event.levelCounter, event.version, event.wind_speed, event.wind_angle, *event.target, len(event.obstacles))
+                for rect in event.obstacles:
+                    data += RECT.pack(*rect)
+            else:
+                data += SHOT_TAG
+                data += SHOT.pack(event.vx, event.vy, event.steps, event.outcome, event.bounces)
+        return bytes(data)
+
+    @staticmethod
+    def from_bytes(data):
+        """
+        A method to unpack a replay from bytes. Raises ValueError if the bytes are not a replay.
+        """
+        if len(data) < HEADER.size:
+            raise ValueError("Replay is too short")
+        magic, version, seed, width, height, mass, Cd, B2, gravity, dt, integrator, cannon_x, cannon_y, physics_rate, size = HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise ValueError("Not a replay file")
+        if version != VERSION:
+            raise ValueError(f"Unsupported replay version: {version}")
+        replay = Replay(seed, width, height, mass, Cd, B2, gravity, dt, INTEGRATORS[integrator], (cannon_x, cannon_y), physics_rate, size)
+        offset = HEADER.size
+        try:
+            while offset < len(data):
+                tag = data[offset:offset + 1]
+                offset += 1
+                if tag == LEVEL_TAG:
+                    levelCounter, layout, wind_speed, wind_angle, tx, ty, tw, th, count = LEVEL.unpack_from(data, offset)
+                    offset += LEVEL.size
+                    obstacles = [RECT.unpack_from(data, offset + i * RECT.size) for i in range(count)]
+                    offset += count * RECT.size
+                    replay.add_level(ReplayLevel(levelCounter, layout, wind_speed, wind_angle, (tx, ty, tw, th), obstacles))
+                elif tag == SHOT_TAG:
+                    replay.add_shot(ReplayShot(*SHOT.unpack_from(data, offset)))
+                    offset += SHOT.size
+                else:
+                    raise ValueError(f"Unknown replay record at byte {offset - 1}")
+        except struct.error:
+            raise ValueError("Replay is cut short")
+        return replay
+
+    def save(self, file_name):
+        """
+        A method to write the replay to a file.
+        """
+        folder = os.path.dirname(file_name)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with open(file_name, "wb") as file:
+            file.write(self.to_bytes())
+
+    @staticmethod
+    def load(file_name):
+        """
+        A method to read a replay from a file.
+        """
+        with open(file_name, "rb") as file:
+            return Replay.from_bytes(file.read())
+
+class ShotResult:
+    """
+    A class to hold the result of flying a recorded shot again.
+    """
+    def __init__(self, level, shot, steps, outcome, bounces, points):
+        """
+        Initialize the result with the recorded shot and what happened when it was flown again.
+        """
+        self.level = level # The ReplayLevel the shot was fired in
+        self.shot = shot # The recorded ReplayShot
+        self.steps = steps # The number of physics steps the shot lasted
+        self.outcome = outcome # How the shot ended
+        self.bounces = bounces # The number of bounces loud enough to be heard
+        self.points = points # The position after every step
+
+    def matches(self):
+        """
+        A method to check the shot ended the same way, after the same number of steps, as when it was recorded.
+        """
+        return self.steps == self.shot.steps and self.outcome == self.shot.outcome and self.bounces == self.shot.bounces
+
+def play_shot(replay, level, shot, max_steps=100000):
+    """
+    A function to fly a recorded shot through its level without a window, the same way Game.physicsStep does.
+    """
+    from game import Projectile, ProjectileImage, Goal, Obstacle, ObstacleGrid, find_nearby, bounce_volume # Imported here because the game imports this module
+    x0, y0 = replay.cannon
+    projectile = Projectile(x0, y0, 0, 0, replay.mass, replay.Cd, replay.B2, replay.gravity)
+    projectile.set_integrator(replay.integrator, replay.dt)
+    projectile.set_wind(level.wind_speed, level.wind_angle)
+    projectile.set_vx_vy(shot.vx, shot.vy)
+    projectileImage = ProjectileImage(x0, y0, replay.size) # Only the size is used
+    target = Goal(*level.target)
+    grid = ObstacleGrid()
+    grid.build([Obstacle(*rect) for rect in level.obstacles])
+    # A shot that was stopped by the player only lasts as long as it did in the session
+    limit = shot.steps if shot.outcome == SHOT_ABORTED else max_steps
+    points = []
+    bounces = 0
+    outcome = SHOT_ABORTED
+    steps = 0
+    while steps < limit:
+        projectile.update_position()
+        steps += 1
+        if target.check_collision(projectile): # The shot is recorded as soon as the target is hit, before the obstacles are checked
+            points.append(projectile.get_position())
+            outcome = SHOT_HIT
+            break
+        for obstacle in find_nearby(projectile, projectileImage, grid):
+            speed = obstacle.resolve_collision(projectile, projectileImage)
+            if speed is not None and bounce_volume(speed) != 0:
+                bounces += 1
+        points.append(projectile.get_position())
+        if projectile.update_sleep():
+            outcome = SHOT_REST
+            break
+        if projectile.x < 0 or projectile.x > replay.width or projectile.y > replay.height:
+            outcome = SHOT_OUT
+            break
+    return ShotResult(level, shot, steps, outcome, bounces, points)
+
+def play(replay, on_shot=None):
+    """
+    A function to fly every shot of a replay again. on_shot is called with each ShotResult as it is made.
+    Returns the list of results.
+    """
+    results = []
+    for level, shot in replay.get_shots():
+        result = play_shot(replay, level, shot)
+        results.append(result)
+        if on_shot is not None:
+            on_shot(result)
+    return results
+
+def show(replay, speed=10, fps=60):
+    """
+    A function to draw every shot of a replay in a window, speed times faster than it was played.
+    """
+    import pygame # Imported here so checking a replay does not need a window
+    from game import Obstacle, Goal
+    pygame.init()
+    screen = pygame.display.set_mode((replay.width, replay.height))
+    clock = pygame.time.Clock()
+    steps_per_frame = max(1, round(replay.physics_rate * speed / fps)) # The physics steps drawn each frame
+    for result in play(replay):
+        obstacles = [Obstacle(*rect) for rect in result.level.obstacles]
+        target = Goal(*result.level.target)
+        for end in range(steps_per_frame, len(result.points) + steps_per_frame, steps_per_frame):
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    pygame.quit()
+                    return
+            screen.fill((0, 0, 0))
+            for obstacle in obstacles:
+                obstacle.draw(screen)
+            target.draw(screen)
+            points = [replay.cannon] + result.points[:end]
+            if len(points) > 1:
+                pygame.draw.lines(screen, (255, 255, 255), False, points, 1)
+            pygame.display.flip()
+            clock.tick(fps)
+    pygame.quit()
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python replay.py <file> [--show] [--speed N]")
+        sys.exit(2)
+    replay = Replay.load(sys.argv[1])
+    if "--show" in sys.argv:
+        speed = float(sys.argv[sys.argv.index("--speed") + 1]) if "--speed" in sys.argv else 10
+        show(replay, speed)
+        sys.exit(0)
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy") # The game module imports pygame, but no window is opened
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    start = time.perf_counter()
+    results = play(replay)
+    elapsed = time.perf_counter() - start
+    mismatches = [result for result in results if not result.matches()]
+    for result in mismatches:
+        print(f"Level {result.level.levelCounter}: shot ({result.shot.vx:.2f}, {result.shot.vy:.2f}) recorded "
+              f"{OUTCOME_NAMES[result.shot.outcome]} after {result.shot.steps} steps and {result.shot.bounces} bounces, "
+              f"replayed {OUTCOME_NAMES[result.outcome]} after {result.steps} steps and {result.bounces} bounces")
+    steps = sum(result.steps for result in results)
+    played = steps / replay.physics_rate # The time the shots took in the session
+    print(f"Seed {replay.seed}: {len(results)} shots, {len(results) - len(mismatches)} reproduced, {len(mismatches)} differ")
+    print(f"Replayed {played:.1f}s of flight in {elapsed:.2f}s ({played / elapsed if elapsed > 0 else math.inf:.0f}x real time)")
+    sys.exit(1 if mismatches else 0)
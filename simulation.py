@@ -0,0 +1,896 @@
+"""
+Headless batch simulation of projectile flights.
+
+The physics here is the same drag model as Projectile.update_position in game.py
+(explicit Euler with the same sign conventions) but every quantity is a NumPy
+array, so thousands of shots are advanced with one set of array operations per
+time step. Nothing in this module needs pygame or a display.
+"""
+import time # Import the time module
+import multiprocessing # Import the multiprocessing module
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor # Import the worker pools used for predictions
+import numpy as np # Import the numpy module
+
+GRAVITY = 9.81 # Acceleration due to gravity used by the game
+DT = 0.01 # Time step used by Projectile.update_position
+MAX_VEL = 100 # Maximum launch velocity component (Projectile.max_vel)
+
+class BatchResult:
+    """
+    A class to hold the results of a batch of simulated shots.
+    """
+    def __init__(self, landing_x, landing_y, flight_time, landed, steps, trajectories=None):
+        """
+        Initialize the result arrays. Each array has one entry per shot.
+        """
+        self.landing_x = landing_x # The x-position where each shot ended
+        self.landing_y = landing_y # The y-position where each shot ended
+        self.flight_time = flight_time # The time in seconds until each shot ended
+        self.landed = landed # True where the shot reached the floor, False where it left the screen or ran out of steps
+        self.steps = steps # The number of integration steps that were run for the whole batch
+        self.trajectories = trajectories # Sampled positions with shape (shots, samples, 2) or None
+
+    def __len__(self):
+        """
+        A method to return the number of shots in the batch.
+        """
+        return self.landing_x.size
+
+    def get_landing_points(self):
+        """
+        A method to return the landing points as an array with a last axis of (x, y).
+        """
+        return np.stack((self.landing_x, self.landing_y), axis=-1)
+
+def wind_components(wind_speed, wind_angle):
+    """
+    A function to split wind speed and direction (degrees) into x and y components, as Projectile.set_wind does.
+    """
+    wind_speed = np.asarray(wind_speed, dtype=float)
+    wind_angle = np.radians(np.asarray(wind_angle, dtype=float))
+    return wind_speed * np.cos(wind_angle), wind_speed * np.sin(wind_angle)
+
+def launch_velocity(angle, power):
+    """
+    A function to turn launch angles (degrees above the horizontal) and powers into vx, vy arrays.
+    """
+    angle = np.radians(np.asarray(angle, dtype=float))
+    power = np.asarray(power, dtype=float)
+    return np.cos(angle) * power, np.sin(angle) * power
+
+def simulate_batch(x0, y0, vx0, vy0, mass=2, Cd=0.52, B2=0.00004, wind_speed=0, wind_angle=0,
+                   gravity=GRAVITY, dt=DT, floor_y=800, x_min=0, x_max=1000, max_steps=20000,
+                   sample_every=0, max_vel=MAX_VEL):
+    """
+    A function to simulate many shots at once.
+
+    Every launch parameter may be a scalar or an array; they are broadcast
+    against each other so the batch size is the size of the broadcast result.
+    A shot ends when it crosses floor_y, leaves the range x_min..x_max, or
+    when max_steps is reached. The end point and time are interpolated inside
+    the final step. If sample_every is above zero the position of every shot
+    is recorded every sample_every steps; a finished shot keeps its end point.
+    """
+    x0, y0, vx0, vy0, mass, Cd, B2, wind_speed, wind_angle = np.broadcast_arrays(
+        *[np.asarray(value, dtype=float) for value in (x0, y0, vx0, vy0, mass, Cd, B2, wind_speed, wind_angle)])
+    shape = x0.shape # Remember the broadcast shape so results can be returned in it
+    x = x0.ravel().copy() # The x-positions of all shots
+    y = y0.ravel().copy() # The y-positions of all shots
+    vx = np.clip(vx0.ravel(), -max_vel, max_vel) # Clamp the launch velocity like Projectile.set_vx_vy
+    vy = np.clip(vy0.ravel(), -max_vel, max_vel)
+    wind_x, wind_y = wind_components(wind_speed.ravel(), wind_angle.ravel()) # The wind components of all shots
+    drag = 0.5 * Cd.ravel() * B2.ravel() # The constant part of the air resistance force
+    inv_m = 1.0 / mass.ravel() # Multiply by this instead of dividing by the mass every step
+
+    n = x.size # The number of shots in the batch
+    landing_x = np.full(n, np.nan) # The x-position where each shot ended
+    landing_y = np.full(n, np.nan) # The y-position where each shot ended
+    flight_time = np.full(n, np.nan) # The flight time of each shot
+    landed = np.zeros(n, dtype=bool) # Which shots reached the floor
+    sample_x = [x.copy()] if sample_every > 0 else None # The first sample is the launch point
+    sample_y = [y.copy()] if sample_every > 0 else None
+    out_x = x.copy() # The positions of every shot, finished shots are held at their end point
+    out_y = y.copy()
+
+    # The loop only works on the shots that are still in flight, packed together so no time is spent on finished ones
+    active = np.arange(n) # The indices of the shots that are still in flight
+
+    step = 0
+    while active.size and step < max_steps: # Loop until every shot has finished
+        step += 1
+        ax = (wind_x - drag * vx * vx) * inv_m # Acceleration as in Projectile.update_position
+        ay = (gravity - wind_y - drag * vy * vy) * inv_m
+        new_x = x + vx * dt # Screen y-axis points down so y and vy change with the opposite sign
+        new_y = y - vy * dt
+        vx = vx + ax * dt
+        vy = vy - ay * dt
+
+        hit_floor = new_y >= floor_y # Shots that crossed the floor this step
+        left_screen = (new_x < x_min) | (new_x > x_max) # Shots that left the screen this step
+        done = hit_floor | left_screen
+        if done.any():
+            # Work out how far through the step each shot crossed the floor or the screen edge
+            dx = new_x[done] - x[done]
+            dy = new_y[done] - y[done]
+            edge = np.where(new_x[done] < x_min, x_min, x_max)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                frac_floor = np.where(hit_floor[done], (floor_y - y[done]) / dy, np.inf)
+                frac_edge = np.where(left_screen[done], (edge - x[done]) / dx, np.inf)
+            frac = np.clip(np.nan_to_num(np.minimum(frac_floor, frac_edge), nan=1.0), 0.0, 1.0)
+            finished = active[done]
+            landing_x[finished] = x[done] + dx * frac
+            landing_y[finished] = y[done] + dy * frac
+            flight_time[finished] = (step - 1 + frac) * dt
+            landed[finished] = frac_floor <= frac_edge # The floor was reached before the screen edge
+            out_x[finished] = landing_x[finished]
+            out_y[finished] = landing_y[finished]
+
+            # Drop the finished shots from the packed arrays
+            keep = ~done
+            active = active[keep]
+            new_x, new_y, vx, vy = new_x[keep], new_y[keep], vx[keep], vy[keep]
+            wind_x, wind_y, drag, inv_m = wind_x[keep], wind_y[keep], drag[keep], inv_m[keep]
+        x = new_x
+        y = new_y
+
+        if sample_every > 0 and step % sample_every == 0: # Record a sample of every shot
+            out_x[active] = x
+            out_y[active] = y
+            sample_x.append(out_x.copy())
+            sample_y.append(out_y.copy())
+
+    if active.size: # Shots that ran out of steps end where they are
+        landing_x[active] = x
+        landing_y[active] = y
+        flight_time[active] = step * dt
+        out_x[active] = x
+        out_y[active] = y
+
+    trajectories = None
+    if sample_every > 0:
+        if step % sample_every != 0: # Always include the final positions
+            sample_x.append(out_x.copy())
+            sample_y.append(out_y.copy())
+        trajectories = np.stack((np.stack(sample_x, axis=1), np.stack(sample_y, axis=1)), axis=2).reshape(shape + (len(sample_x), 2))
+
+    return BatchResult(landing_x.reshape(shape), landing_y.reshape(shape), flight_time.reshape(shape), landed.reshape(shape), step, trajectories)
+
+def sweep_aim(x0, y0, angles, powers, **kwargs):
+    """
+    A function to simulate every combination of launch angle (degrees) and power.
+    The results have shape (len(angles), len(powers)).
+    """
+    angle_grid, power_grid = np.meshgrid(np.asarray(angles, dtype=float), np.asarray(powers, dtype=float), indexing="ij")
+    vx0, vy0 = launch_velocity(angle_grid, power_grid)
+    return simulate_batch(x0, y0, vx0, vy0, **kwargs)
+
+HIT_GOAL = 1 # Outcome of a shot that reached the goal
+HIT_OBSTACLE = -1 # Outcome of a shot that touched an obstacle first
+MISSED = 0 # Outcome of a shot that left the screen or ran out of steps
+
+def simulate_hits(x0, y0, vx0, vy0, obstacles, goal, size=5, mass=2, Cd=0.52, B2=0.00004, wind_speed=0, wind_angle=0,
+                  gravity=GRAVITY, dt=DT, width=1000, height=800, max_steps=3000, max_vel=MAX_VEL):
+    """
+    A function to find out what many shots run into first: the goal, an obstacle, or nothing.
+
+    obstacles is a sequence of (x, y, width, height) rectangles and goal is one rectangle. A shot reaches the
+    goal when its centre is inside it (as in Goal.check_collision) and touches an obstacle when a box of the
+    given size overlaps it. Shots are not bounced, so the result is whether the goal can be hit directly.
+    Returns an array of HIT_GOAL, HIT_OBSTACLE or MISSED with the broadcast shape of the launch parameters.
+    """
+    x0, y0, vx0, vy0, mass, Cd, B2, wind_speed, wind_angle = np.broadcast_arrays(
+        *[np.asarray(value, dtype=float) for value in (x0, y0, vx0, vy0, mass, Cd, B2, wind_speed, wind_angle)])
+    shape = x0.shape
+    x = x0.ravel().copy()
+    y = y0.ravel().copy()
+    vx = np.clip(vx0.ravel(), -max_vel, max_vel)
+    vy = np.clip(vy0.ravel(), -max_vel, max_vel)
+    wind_x, wind_y = wind_components(wind_speed.ravel(), wind_angle.ravel())
+    drag = 0.5 * Cd.ravel() * B2.ravel()
+    inv_m = 1.0 / mass.ravel()
+    outcome = np.full(x.size, MISSED)
+    active = np.arange(x.size)
+
+    rects = np.asarray(obstacles, dtype=float).reshape(-1, 4)
+    centre_x = rects[:, 0] + rects[:, 2] / 2 # Obstacle centres and how close a shot has to be to touch them
+    centre_y = rects[:, 1] + rects[:, 3] / 2
+    reach_x = (rects[:, 2] + size) / 2
+    reach_y = (rects[:, 3] + size) / 2
+    goal_x, goal_y, goal_width, goal_height = goal
+
+    step = 0
+    while active.size and step < max_steps:
+        step += 1
+        ax = (wind_x - drag * vx * vx) * inv_m
+        ay = (gravity - wind_y - drag * vy * vy) * inv_m
+        x = x + vx * dt
+        y = y - vy * dt
+        vx = vx + ax * dt
+        vy = vy - ay * dt
+
+        in_goal = (x > goal_x) & (x < goal_x + goal_width) & (y > goal_y) & (y < goal_y + goal_height) # The goal is checked first, as in the game
+        on_obstacle = ((np.abs(x[:, None] - centre_x) < reach_x) & (np.abs(y[:, None] - centre_y) < reach_y)).any(axis=1) & ~in_goal
+        off_screen = (x < 0) | (x > width) | (y > height)
+        outcome[active[in_goal]] = HIT_GOAL
+        outcome[active[on_obstacle]] = HIT_OBSTACLE
+        keep = ~(in_goal | on_obstacle | off_screen)
+        if not keep.all(): # Drop the shots that have finished
+            active = active[keep]
+            x, y, vx, vy = x[keep], y[keep], vx[keep], vy[keep]
+            wind_x, wind_y, drag, inv_m = wind_x[keep], wind_y[keep], drag[keep], inv_m[keep]
+
+    return outcome.reshape(shape)
+
+def power_limit(angles, max_vel=MAX_VEL):
+    """
+    A function to return the largest power at each launch angle (degrees) whose velocity components are both
+    within max_vel, so Projectile.set_vx_vy does not clamp the shot and change its direction.
+    """
+    angles = np.radians(np.asarray(angles, dtype=float))
+    with np.errstate(divide="ignore"):
+        return np.minimum(max_vel / np.abs(np.cos(angles)), max_vel / np.abs(np.sin(angles)))
+
+def drag_free_power(x0, y0, target_x, target_y, angles, mass=2, gravity=GRAVITY, wind_speed=0, wind_angle=0):
+    """
+    A function to return the power at each launch angle (degrees) that passes through (target_x, target_y) when
+    there is no air resistance. With the constant accelerations of gravity and the wind, ax sideways and g
+    downwards as in Projectile.update_position, the shot reaches the target at the time t where
+    t² = 2 (dx tan angle - dy) / (ax tan angle + g), and the power is then (dx - ax t² / 2) / (t cos angle).
+    Returns the powers and the times, NaN where there is no such time.
+    """
+    angles = np.radians(np.asarray(angles, dtype=float))
+    wind_x, wind_y = wind_components(wind_speed, wind_angle)
+    ax = wind_x / mass # The sideways acceleration
+    g = (gravity - wind_y) / mass # The downward acceleration
+    dx = target_x - x0
+    dy = y0 - target_y # The screen y-axis points down, so the height above the start is y0 - target_y
+    tan = np.tan(angles)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        squared = 2 * (dx * tan - dy) / (ax * tan + g)
+        t = np.sqrt(np.where(squared > 0, squared, np.nan))
+        power = (dx - ax * t * t / 2) / (t * np.cos(angles))
+    return np.where(power > 0, power, np.nan), np.where(power > 0, t, np.nan)
+
+def crossing_heights(x0, y0, vx0, vy0, target_x, mass=2, Cd=0.52, B2=0.00004, wind_speed=0, wind_angle=0,
+                     gravity=GRAVITY, dt=DT, height=800, max_steps=2000, max_vel=MAX_VEL, chunk=32):
+    """
+    A function to find the height at which many shots cross the line x = target_x, interpolated inside the step.
+
+    The steps are the same as simulate_batch, but they are run chunk steps at a time into a buffer and the
+    crossings are found for the whole chunk at once, so each step is only a few array operations.
+    Returns an array with infinity where a shot reaches the floor, is blown back or runs out of steps first.
+    """
+    vx0, vy0 = np.broadcast_arrays(np.asarray(vx0, dtype=float), np.asarray(vy0, dtype=float))
+    shape = vx0.shape
+    velocity = np.stack((vx0.ravel(), vy0.ravel())).clip(-max_vel, max_vel) # Row 0 is vx and row 1 is vy
+    wind_x, wind_y = wind_components(wind_speed, wind_angle)
+    drag = 0.5 * Cd * B2 / mass * dt # The air resistance, the wind and gravity as a change in velocity per step
+    push = np.array([[wind_x / mass * dt], [(wind_y - gravity) / mass * dt]]) # Upwards is positive for vy
+    move = np.array([[dt], [-dt]]) # Screen y-axis points down so y changes with the opposite sign to vy
+    sign = np.array([[1.0], [-1.0]]) # Drag slows vx but pushes vy down, as in Projectile.update_position
+    crossing = np.full(shape, np.inf).ravel()
+    active = np.arange(crossing.size) # The indices of the shots that are still in flight
+    positions = np.empty((chunk + 1, 2, crossing.size)) # The positions of a chunk of steps, row 0 is where the chunk starts
+    positions[0, 0] = x0
+    positions[0, 1] = y0
+
+    step = 0
+    while active.size and step < max_steps:
+        count = active.size
+        position = positions[:, :, :count]
+        for i in range(chunk): # The same order as Projectile.update_position: move, then change the velocity
+            np.multiply(velocity, move, out=position[i + 1])
+            position[i + 1] += position[i]
+            velocity += push - sign * drag * velocity * velocity
+        step += chunk
+        x = position[1:, 0]
+        y = position[:, 1]
+
+        crossed = x >= target_x
+        first = np.argmax(crossed, axis=0) # The step in the chunk where each shot first crossed
+        columns = np.flatnonzero(crossed[first, np.arange(count)])
+        rows = first[columns]
+        before = position[rows, :, columns] # Where each shot was at the start of the step it crossed in
+        after = position[rows + 1, :, columns]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            frac = np.nan_to_num((target_x - before[:, 0]) / (after[:, 0] - before[:, 0]), nan=1.0)
+        heights = before[:, 1] + (after[:, 1] - before[:, 1]) * np.clip(frac, 0.0, 1.0)
+        landed = np.maximum.accumulate(y[1:] >= height, axis=0)[rows, columns] # Reached the floor before crossing
+        crossing[active[columns]] = np.where(landed, np.inf, heights)
+
+        done = np.zeros(count, dtype=bool)
+        done[columns] = True
+        done |= (y[chunk] >= height) | ((position[chunk, 0] < x0) & (velocity[0] <= 0) & (push[0, 0] <= 0)) # Landed or blown back
+        keep = ~done
+        active = active[keep]
+        velocity = velocity[:, keep]
+        positions[0, :, :active.size] = position[chunk][:, keep] # The next chunk starts where this one ended
+    return crossing.reshape(shape)
+
+def solve_power(x0, y0, target_x, target_y, angles, mass=2, Cd=0.52, B2=0.00004, wind_speed=0, wind_angle=0,
+                gravity=GRAVITY, dt=DT, height=800, min_power=1, max_vel=MAX_VEL, tolerance=0.1, iterations=8,
+                max_time=20):
+    """
+    A function to find, for each launch angle (degrees), the power that makes the shot pass through (target_x, target_y),
+    like a bisection of the power but in far fewer simulations. Angles whose drag-free shot takes longer than max_time are left out.
+
+    The first batch flies the drag-free power, a power just above it and the strongest power within max_vel.
+    The drag-free power is only a few pixels out, so the secant of the first two is nearly exact; after that
+    secant steps are taken on how far above or below the target the shot crosses target_x, falling back to
+    bisection whenever a step would leave the bracket of powers known to be too weak and too strong.
+    target_y may be an array, in which case it is broadcast against the angles.
+    Returns the powers, NaN where no power within max_vel reaches the target, and the number of simulations run.
+    """
+    angles, target_y = np.broadcast_arrays(np.asarray(angles, dtype=float), np.asarray(target_y, dtype=float))
+    shape = angles.shape
+    angles = angles.ravel()
+    target_y = target_y.ravel()
+    count = angles.size
+    low = np.full(count, float(min_power)) # Powers known to be too weak
+    high = power_limit(angles, max_vel) # Powers known to be too strong, or the strongest shot there is
+
+    def miss(powers, index):
+        """
+        Return how far below the target each shot crosses target_x, infinite for shots that do not get there.
+        """
+        vx0, vy0 = launch_velocity(angles[index], powers)
+        return crossing_heights(x0, y0, vx0, vy0, target_x, mass, Cd, B2, wind_speed, wind_angle,
+                                gravity, dt, height, int(max_time / dt), max_vel) - target_y[index]
+
+    guess, arrival = drag_free_power(x0, y0, target_x, target_y, angles, mass, gravity, wind_speed, wind_angle)
+    slow = arrival > max_time # Lobs that would arrive after max_time
+    guess = np.where(np.isfinite(guess) & (guess > low) & (guess < high), guess, (low + high) / 2)
+    nudged = np.minimum(guess * 1.001, (guess + high) / 2)
+    everything = np.arange(count)
+    misses = miss(np.concatenate((high, guess, nudged)), np.tile(everything, 3)) # One batch for all three
+    high_miss, previous_miss, current_miss = misses[:count], misses[count:count * 2], misses[count * 2:]
+    simulations = 1
+    reachable = (high_miss <= 0) & ~slow # The strongest shot has to pass above the target
+    previous, current = guess, nudged.copy()
+    powers = np.full(count, np.nan)
+    for power, power_miss in ((guess, previous_miss), (nudged, current_miss)): # Either first try may already be close enough
+        solved = reachable & np.isnan(powers) & (np.abs(power_miss) <= tolerance)
+        powers[solved] = power[solved]
+        low = np.where(reachable & (power_miss > 0), np.maximum(low, power), low) # A positive miss is below the target
+        high = np.where(reachable & (power_miss <= 0), np.minimum(high, power), high)
+    active = np.flatnonzero(reachable & np.isnan(powers)) # The angles that are still being solved
+
+    for i in range(iterations):
+        if active.size == 0:
+            break
+        with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            secant = current[active] - current_miss[active] * (current[active] - previous[active]) / (current_miss[active] - previous_miss[active])
+        inside = np.isfinite(secant) & (secant > low[active]) & (secant < high[active])
+        previous[active] = current[active]
+        previous_miss[active] = current_miss[active]
+        current[active] = np.where(inside, secant, (low[active] + high[active]) / 2)
+        current_miss[active] = miss(current[active], active)
+        simulations += 1
+        solved = np.abs(current_miss[active]) <= tolerance
+        powers[active[solved]] = current[active[solved]]
+        too_low = current_miss[active] > 0
+        low[active] = np.where(too_low, current[active], low[active])
+        high[active] = np.where(too_low, high[active], current[active])
+        # A bracket that has shrunk to almost nothing without solving the shot means the target is only reached after max_time
+        active = active[~solved & (high[active] - low[active] > 1e-4 * high[active])]
+    return powers.reshape(shape), simulations
+
+class AimSolution:
+    """
+    A class to hold the launch angles and powers that reach a goal.
+    """
+    def __init__(self, angles, powers, low, high, samples, feasible, simulations, elapsed):
+        """
+        Initialize the solution. Each array has one entry per launch angle, apart from samples and feasible which
+        have one row per angle and one column per power tried between low and high.
+        """
+        self.angles = angles # The launch angles in degrees
+        self.powers = powers # The power that passes through the centre of the goal at each angle, NaN if none does
+        self.low = low # The weakest power that still passes through the goal
+        self.high = high # The strongest power that still passes through the goal
+        self.samples = samples # Powers between low and high that were flown through the obstacles
+        self.feasible = feasible # True where a sampled power reaches the goal without touching an obstacle first
+        self.simulations = simulations # The number of batched simulations the search ran
+        self.elapsed = elapsed # The time in seconds the search took
+
+    def __len__(self):
+        """
+        A method to return the number of feasible shots.
+        """
+        return int(np.count_nonzero(self.feasible))
+
+    def get_feasible(self):
+        """
+        A method to return every feasible shot as a list of (angle, power) pairs.
+        """
+        rows, columns = np.nonzero(self.feasible)
+        return [(float(self.angles[row]), float(self.samples[row, column])) for row, column in zip(rows, columns)]
+
+    def best(self):
+        """
+        A method to return the most forgiving feasible shot as an (angle, power) pair, or None if there is none.
+        This is the angle with the most feasible powers, at the feasible power nearest the centre of its range.
+        """
+        counts = np.count_nonzero(self.feasible, axis=1)
+        if not counts.any():
+            return None
+        row = int(np.argmax(counts))
+        columns = np.flatnonzero(self.feasible[row])
+        column = columns[np.argmin(np.abs(columns - (self.feasible.shape[1] - 1) / 2))]
+        return float(self.angles[row]), float(self.samples[row, column])
+
+def solve_aim(x0, y0, goal, obstacles=(), angles=None, size=5, mass=2, Cd=0.52, B2=0.00004, wind_speed=0, wind_angle=0,
+              gravity=GRAVITY, dt=DT, width=1000, height=800, max_vel=MAX_VEL, samples=5, margin=1):
+    """
+    A function to find the launch angles and powers that hit a goal rectangle (x, y, width, height) from (x0, y0).
+
+    For each angle the powers that pass through the goal's centre line at its centre, top and bottom are found
+    with solve_power, all in the same batches. The band between the top and bottom powers passes through the goal,
+    so samples powers across it are flown through the obstacles with simulate_hits to find the feasible shots.
+    Powers are kept within max_vel in both components. Returns an AimSolution.
+    """
+    start = time.perf_counter()
+    if angles is None:
+        angles = np.arange(-80, 86, 2.5) # Every 2.5 degrees, as the band of powers is narrow at some angles
+    angles = np.asarray(angles, dtype=float)
+    goal_x, goal_y, goal_width, goal_height = goal
+    target_x = goal_x + goal_width / 2
+    heights = np.array([goal_y + goal_height / 2, goal_y + margin, goal_y + goal_height - margin])[:, None] # Centre, top and bottom
+    powers, simulations = solve_power(x0, y0, target_x, heights, angles[None, :], mass, Cd, B2, wind_speed, wind_angle,
+                                      gravity, dt, height, max_vel=max_vel)
+    centre, high, low = powers # Passing higher up takes more power
+    found = np.isfinite(centre)
+    # Where the top of the goal is out of reach the strongest shot still passes through it
+    high = np.where(found & np.isnan(high), power_limit(angles, max_vel), high)
+    low = np.where(found & np.isnan(low), centre, low)
+    band = np.linspace(low, high, samples, axis=1) # Powers across the band of each angle
+    feasible = np.zeros(band.shape, dtype=bool)
+    if found.any(): # Only the angles that reach the goal are flown through the obstacles
+        vx0, vy0 = launch_velocity(angles[found, None], band[found])
+        outcome = simulate_hits(x0, y0, vx0, vy0, obstacles, goal, size, mass, Cd, B2, wind_speed, wind_angle, gravity, dt,
+                                width, height, max_vel=max_vel)
+        feasible[found] = outcome == HIT_GOAL
+    return AimSolution(angles, centre, low, high, band, feasible, simulations + 1, time.perf_counter() - start)
+
+class PathPrediction:
+    """
+    A class to hold a predicted flight path.
+    """
+    def __init__(self, points, hit_goal, hit_obstacle):
+        """
+        Initialize the prediction with its points and what it ran into.
+        """
+        self.points = points # The predicted positions with shape (points, 2)
+        self.hit_goal = hit_goal # True if the path ends in the goal
+        self.hit_obstacle = hit_obstacle # True if the path ends on an obstacle
+
+def first_overlap(points, rects, size, chunk=256):
+    """
+    A function to return the index of the first point where a box of the given size overlaps any of the
+    rectangles (x, y, width, height), or None. Points are checked in chunks to limit memory use.
+    """
+    if len(rects) == 0:
+        return None
+    rects = np.asarray(rects, dtype=float)
+    centre_x = rects[:, 0] + rects[:, 2] / 2
+    centre_y = rects[:, 1] + rects[:, 3] / 2
+    reach_x = (rects[:, 2] + size) / 2 # How close the centres have to be to overlap
+    reach_y = (rects[:, 3] + size) / 2
+    for start in range(0, len(points), chunk):
+        block = points[start:start + chunk]
+        hit = ((np.abs(block[:, 0:1] - centre_x) < reach_x) & (np.abs(block[:, 1:2] - centre_y) < reach_y)).any(axis=1)
+        if hit.any():
+            return start + int(np.argmax(hit))
+    return None
+
+def predict_path(x0, y0, vx0, vy0, mass, Cd, B2, wind_speed, wind_angle, obstacles, goal, size, width, height,
+                 dt=DT, max_steps=2000):
+    """
+    A function to predict the path of one shot up to where it first touches an obstacle or the goal.
+    obstacles is a sequence of (x, y, width, height) rectangles and goal is one rectangle. The path after a
+    bounce is not predicted. This only uses NumPy so it can run in a worker process.
+    """
+    result = simulate_batch(x0, y0, vx0, vy0, mass, Cd, B2, wind_speed, wind_angle, dt=dt, floor_y=height,
+                            x_min=0, x_max=width, max_steps=max_steps, sample_every=1)
+    points = result.trajectories # Every step of the single shot
+    hit_obstacle = first_overlap(points, obstacles, size)
+    hit_goal = first_overlap(points, [goal], 0)
+    ends = [index for index in (hit_obstacle, hit_goal) if index is not None]
+    if ends: # Cut the path where it first touches something
+        end = min(ends)
+        return PathPrediction(points[:end + 1], hit_goal == end, hit_obstacle == end)
+    return PathPrediction(points, False, False)
+
+class TrajectoryPredictor:
+    """
+    A class to run path predictions in a worker so the game loop never waits for them.
+    Only the newest request matters: a request that has not started is cancelled when a newer one arrives,
+    and the result of a request that was already running when a newer one arrived is thrown away.
+    """
+    def __init__(self, use_processes=True):
+        """
+        Initialize the predictor. The worker is only started when the first request is made.
+        """
+        self.use_processes = use_processes # Use a worker process so predictions do not compete with the game for the GIL
+        self.executor = None # The worker pool
+        self.future = None # The prediction that is running
+        self.future_key = None # The key of the prediction that is running
+        self.pending = None # The newest request, waiting for the running prediction to finish
+        self.latest_key = None # The key of the newest request
+        self.result = None # The newest finished prediction
+        self.result_key = None # The key of the newest finished prediction
+        self.stale = 0 # The number of predictions that were cancelled or thrown away
+
+    def start(self):
+        """
+        A method to start the worker pool.
+        """
+        if self.use_processes:
+            # Spawn a fresh process rather than forking, so the worker does not inherit the game's window and threads
+            self.executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def request(self, key, args):
+        """
+        A method to ask for a prediction of predict_path(*args). key identifies the request, so asking for the same key again does nothing.
+        """
+        if key == self.latest_key:
+            return
+        self.latest_key = key
+        self.pending = (key, args)
+        self.submit()
+
+    def submit(self):
+        """
+        A method to send the newest request to the worker if the worker is free.
+        """
+        if self.pending is None:
+            return
+        if self.future is not None:
+            if not self.future.cancel(): # The running prediction cannot be stopped, so wait for it to finish
+                return
+            self.stale += 1
+        if self.executor is None:
+            self.start()
+        key, args = self.pending
+        self.pending = None
+        try:
+            self.future = self.executor.submit(predict_path, *args)
+        except Exception: # The worker process could not start, so carry on with a worker thread instead
+            self.executor.shutdown(wait=False)
+            self.use_processes = False
+            self.start()
+            self.future = self.executor.submit(predict_path, *args)
+        self.future_key = key
+
+    def poll(self):
+        """
+        A method to collect a finished prediction, send the next request and return the newest finished prediction.
+        This never waits for the worker.
+        """
+        if self.future is not None and self.future.done():
+            if self.future_key == self.latest_key and self.future.exception() is None:
+                self.result = self.future.result()
+                self.result_key = self.future_key
+            else:
+                self.stale += 1 # A newer request arrived while this one was running
+            self.future = None
+        self.submit()
+        return self.result
+
+    def clear(self):
+        """
+        A method to forget the last prediction, for example when a shot is fired.
+        """
+        self.result = None
+        self.result_key = None
+        self.latest_key = None
+        self.pending = None
+
+    def close(self):
+        """
+        A method to stop the worker pool without waiting for predictions that are running.
+        """
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+# States of the projectiles of a volley
+VOLLEY_FLYING = 0 # Still moving
+VOLLEY_HIT = 1 # Reached the goal
+VOLLEY_OUT = 2 # Left the screen
+VOLLEY_RESTING = 3 # Came to rest on an obstacle
+
+class VolleyGrid:
+    """
+    A class to find the obstacles near many projectiles at once using a uniform grid (the broad-phase of a volley's
+    collisions), like ObstacleGrid in game.py but as arrays. The obstacles are binned once per level; after that
+    each step only looks up one cell per projectile and tests the few obstacles in it instead of every obstacle.
+    """
+    def __init__(self, rects, size=5, cell_size=50):
+        """
+        Initialize the grid of an (obstacles, 4) array of (x, y, width, height) rectangles shared by every projectile,
+        or of a (projectiles, obstacles, 4) array with each projectile's own obstacles, padded with rows of NaN.
+        Every obstacle is grown by half the size of a projectile, so a projectile only has to look in the cell of its centre.
+        """
+        rects = np.asarray(rects, dtype=float)
+        self.shared = rects.ndim != 3 # True if every projectile collides with the same obstacles
+        rects = rects.reshape(1 if self.shared else len(rects), -1, 4)
+        self.count = rects.shape[1] # The number of obstacles of each projectile, including padding
+        self.cell_size = cell_size # The width and height of a cell in pixels
+        self.rects = np.vstack((rects.reshape(-1, 4), np.full((1, 4), np.nan))) # Every obstacle, then a row of NaN that index -1 looks up
+        self.centre_x = self.rects[:, 0] + self.rects[:, 2] / 2 # The centre of every obstacle
+        self.centre_y = self.rects[:, 1] + self.rects[:, 3] / 2
+        self.half_width = (size + self.rects[:, 2]) / 2 # How far a projectile's centre can be from an obstacle's centre and still touch it
+        self.half_height = (size + self.rects[:, 3]) / 2
+        obstacles = np.flatnonzero(~np.isnan(self.rects[:-1]).any(axis=1)) # The obstacles that are not padding
+        self.origin_x = self.origin_y = 0.0 # The top left corner of the grid
+        self.cols = self.rows = 1 # The number of columns and rows of the grid
+        self.table = np.full((1, 0), -1, dtype=np.intp) # A row of obstacle indices per cell of each projectile, padded with -1
+        if obstacles.size == 0:
+            return
+        r = self.rects[obstacles]
+        left, top = r[:, 0] - size / 2, r[:, 1] - size / 2
+        self.origin_x, self.origin_y = float(left.min()) - cell_size, float(top.min()) - cell_size # A border of empty cells goes around the obstacles
+        col1 = np.floor((left - self.origin_x) / cell_size).astype(np.intp) # The cells of the top left and bottom right corners
+        row1 = np.floor((top - self.origin_y) / cell_size).astype(np.intp)
+        col2 = np.floor((r[:, 0] + r[:, 2] + size / 2 - self.origin_x) / cell_size).astype(np.intp)
+        row2 = np.floor((r[:, 1] + r[:, 3] + size / 2 - self.origin_y) / cell_size).astype(np.intp)
+        self.cols, self.rows = int(col2.max()) + 2, int(row2.max()) + 2
+        cols, rows = col2 - col1 + 1, row2 - row1 + 1 # The number of columns and rows each obstacle covers
+        counts = cols * rows
+        index = np.repeat(np.arange(obstacles.size), counts) # One entry for every cell of every obstacle, as ObstacleGrid.build
+        offset = np.arange(index.size) - np.repeat(np.cumsum(counts) - counts, counts) # Which of its cells each entry is
+        cell = (obstacles[index] // self.count) * self.cols * self.rows + (row1[index] + offset % rows[index]) * self.cols + col1[index] + offset // rows[index]
+        order = np.lexsort((obstacles[index], cell)) # Group the entries by cell, keeping the obstacles of a cell in order
+        cell, obstacle = cell[order], obstacles[index][order]
+        starts = np.flatnonzero(np.r_[True, cell[1:] != cell[:-1]]) # Where each cell's entries begin
+        position = np.arange(cell.size) - np.repeat(starts, np.diff(np.r_[starts, cell.size])) # The place of each entry in its cell
+        self.table = np.full((len(rects) * self.cols * self.rows, int(position.max()) + 1), -1, dtype=np.intp)
+        self.table[cell, position] = obstacle
+
+    def query(self, x, y, projectiles):
+        """
+        A method to return the obstacles that might touch projectiles centred on the x and y arrays, as a
+        (projectiles, candidates) array of indices into rects padded with -1. projectiles are the indices of the
+        projectiles, which pick their own obstacles when they are not shared.
+        """
+        if self.table.shape[1] == 0: # No obstacles
+            return np.zeros((len(x), 0), dtype=np.intp)
+        col = np.clip(np.floor((x - self.origin_x) / self.cell_size), 0, self.cols - 1) # Projectiles outside the grid look in its empty border
+        row = np.clip(np.floor((y - self.origin_y) / self.cell_size), 0, self.rows - 1)
+        cell = (row * self.cols + col).astype(np.intp)
+        if not self.shared:
+            cell += projectiles * (self.cols * self.rows)
+        return self.table[cell]
+
+class Volley:
+    """
+    A class to fly many projectiles at once, stored as one NumPy array per quantity (a struct of arrays) rather
+    than one Projectile object each. Every step moves and collides all the flying projectiles with a few array
+    operations. The physics is the Euler step of Projectile.update_position and the bounce of
+    Obstacle.resolve_collision, including resting contact and sleep.
+    The wind, the obstacles and the goal can be shared by every projectile or given per projectile, so one volley
+    can also fly the shots of many separate games at once.
+    """
+    def __init__(self, capacity=1000, mass=2, Cd=0.52, B2=0.00004, gravity=GRAVITY, dt=DT, size=5):
+        """
+        Initialize an empty volley with room for capacity projectiles.
+        """
+        self.mass = mass # The mass of every projectile
+        self.Cd = Cd # The drag coefficient
+        self.B2 = B2 # The constant for air resistance
+        self.gravity = gravity # The acceleration due to gravity
+        self.dt = dt # The time step
+        self.size = size # The size of every projectile in pixels
+        self.wind_x = 0 # The wind speed in m/s (x-component)
+        self.wind_y = 0 # The wind speed in m/s (y-component)
+        self.n = 0 # The number of projectiles in the volley
+        self.grid = VolleyGrid(np.zeros((0, 4)), size) # The obstacles binned by set_obstacles
+        self.allocate(capacity)
+
+    def allocate(self, capacity):
+        """
+        A method to make the arrays, with room for capacity projectiles.
+        """
+        self.capacity = capacity
+        self.x = np.zeros(capacity) # The x-positions
+        self.y = np.zeros(capacity) # The y-positions
+        self.vx = np.zeros(capacity) # The x-velocities
+        self.vy = np.zeros(capacity) # The y-velocities
+        self.last_x = np.zeros(capacity) # The x-positions before the last step
+        self.last_y = np.zeros(capacity) # The y-positions before the last step
+        self.still_time = np.zeros(capacity) # How long each projectile has been still for
+        self.state = np.full(capacity, VOLLEY_OUT, dtype=np.int8) # The state of each projectile
+        self.bounces = np.zeros(capacity, dtype=np.int32) # How many times each projectile has bounced
+        self.index = np.arange(capacity) # The number each projectile was fired as, which retire moves
+
+    def set_wind(self, wind_speed, wind_angle):
+        """
+        A method to set the wind speed and direction, as Projectile.set_wind does. Arrays with one entry per
+        projectile give each projectile its own wind.
+        """
+        wind_x, wind_y = wind_components(wind_speed, wind_angle)
+        if wind_x.ndim == 0:
+            self.wind_x, self.wind_y = float(wind_x), float(wind_y)
+        else:
+            self.wind_x, self.wind_y = wind_x, wind_y
+
+    def set_obstacles(self, rects):
+        """
+        A method to bin the obstacles into a grid once, so collide only tests each projectile against the obstacles
+        near it. rects is shared or per projectile as in collide. Call it again whenever the obstacles change.
+        """
+        self.grid = VolleyGrid(rects, self.size)
+
+    def fire(self, x0, y0, vx, vy, max_vel=MAX_VEL):
+        """
+        A method to replace the volley with new projectiles fired from (x0, y0) with the given velocity arrays.
+        """
+        vx = np.asarray(vx, dtype=float)
+        vy = np.asarray(vy, dtype=float)
+        self.n = vx.size
+        if self.n > self.capacity:
+            self.allocate(self.n)
+        n = self.n
+        self.x[:n] = x0
+        self.y[:n] = y0
+        self.last_x[:n] = x0
+        self.last_y[:n] = y0
+        self.vx[:n] = np.clip(vx, -max_vel, max_vel) # Clamp the launch velocity like Projectile.set_vx_vy
+        self.vy[:n] = np.clip(vy, -max_vel, max_vel)
+        self.still_time[:n] = 0
+        self.state[:n] = VOLLEY_FLYING
+        self.bounces[:n] = 0
+        self.index[:n] = np.arange(n)
+
+    def retire(self):
+        """
+        A method to remove the projectiles that are no longer flying, moving the flying ones to the front so the
+        next steps work on whole arrays instead of picking them out. Per projectile wind, obstacles and goals keep
+        the order the projectiles were fired in. Returns the numbers the removed projectiles were fired as, with
+        their states and bounces.
+        """
+        state = self.state[:self.n]
+        done = state != VOLLEY_FLYING
+        if not done.any():
+            return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.int8), np.zeros(0, dtype=np.int32)
+        retired = self.index[:self.n][done], state[done], self.bounces[:self.n][done]
+        keep = np.flatnonzero(~done)
+        for values in (self.x, self.y, self.vx, self.vy, self.last_x, self.last_y, self.still_time, self.state, self.bounces, self.index):
+            values[:keep.size] = values[keep]
+        self.n = keep.size
+        return retired
+
+    def clear(self):
+        """
+        A method to remove every projectile from the volley.
+        """
+        self.n = 0
+
+    def __len__(self):
+        """
+        A method to return the number of projectiles in the volley.
+        """
+        return self.n
+
+    def count(self, state=VOLLEY_FLYING):
+        """
+        A method to return the number of projectiles in a state.
+        """
+        return int(np.count_nonzero(self.state[:self.n] == state))
+
+    def step(self):
+        """
+        A method to move every flying projectile by one time step.
+        """
+        flying = np.flatnonzero(self.state[:self.n] == VOLLEY_FLYING) # Only the flying projectiles are worked on
+        if flying.size == 0:
+            return flying
+        picked = slice(0, self.n) if flying.size == self.n else flying # When every projectile is flying the arrays are used in place
+        x, y, vx, vy = self.x[picked], self.y[picked], self.vx[picked], self.vy[picked]
+        wind_x, wind_y = self.wind_x, self.wind_y
+        if np.ndim(wind_x): # Each projectile has its own wind
+            number = self.index[flying]
+            wind_x, wind_y = wind_x[number], wind_y[number]
+        drag = 0.5 * self.Cd * self.B2
+        ax = (wind_x - drag * vx * vx) / self.mass # Acceleration as in Projectile.update_position
+        ay = (self.gravity - wind_y - drag * vy * vy) / self.mass
+        self.last_x[picked] = x
+        self.last_y[picked] = y
+        self.x[picked] = x + vx * self.dt # Screen y-axis points down so y and vy change with the opposite sign
+        self.y[picked] = y - vy * self.dt
+        self.vx[picked] = vx + ax * self.dt
+        self.vy[picked] = vy - ay * self.dt
+        return flying
+
+    def collide(self, rects, goal, width, height, absorption=0.7, friction=0.05, rest_speed=1.0, sleep_speed=0.5, sleep_time=1.0):
+        """
+        A method to collide every flying projectile with the obstacles, the goal and the screen edges.
+        rects is an array of (x, y, width, height) obstacles and goal an (x, y, width, height) rectangle. To give each
+        projectile its own obstacles and goal, rects can be an (n, count, 4) array padded with rows of NaN and goal
+        an (n, 4) array. rects is None to use the obstacles given to set_obstacles, which are only binned once.
+        A projectile only moves about a pixel a step and obstacles are at least 5 pixels thick, so the overlap at
+        the end of the step is tested rather than the swept path. Returns the number of projectiles that reached
+        the goal this step and the fastest impact speed with an obstacle (0 if there was none).
+        """
+        flying = np.flatnonzero(self.state[:self.n] == VOLLEY_FLYING)
+        if flying.size == 0:
+            return 0, 0.0
+        picked = slice(0, self.n) if flying.size == self.n else flying # When every projectile is flying the arrays are used in place
+        x, y, vx, vy = self.x[picked], self.y[picked], self.vx[picked], self.vy[picked]
+        number = self.index[flying] # The number each projectile was fired as, which picks its own obstacles and goal
+        impact = 0.0
+        grid = self.grid if rects is None else VolleyGrid(rects, self.size)
+        candidates = grid.query(x, y, number) # Only the obstacles in the cell of each projectile can touch it
+        if candidates.shape[1]:
+            centre_x, centre_y = grid.centre_x[candidates], grid.centre_y[candidates] # Padding looks up the row of NaN, which never touches
+            # Separating Axis Theorem for every projectile against the obstacles near it at once
+            overlap_x = grid.half_width[candidates] - np.abs(x[:, None] - centre_x)
+            overlap_y = grid.half_height[candidates] - np.abs(y[:, None] - centre_y)
+            touching = (overlap_x > 0) & (overlap_y > 0)
+            hit = np.flatnonzero(touching.any(axis=1)) # The projectiles touching an obstacle
+            if hit.size:
+                j = touching[hit].argmax(axis=1) # The first obstacle each one touches, as the candidates are in order
+                speed = np.sqrt(vx[hit] ** 2 + vy[hit] ** 2)
+                impact = float(speed.max())
+                self.bounces[flying[hit[speed > 5]]] += 1 # Count the bounces loud enough to be heard, as check_collision does
+                along_x = overlap_x[hit, j] < overlap_y[hit, j] # Resolve along the axis with the smallest overlap
+                hx, hy, hvx, hvy = x[hit], y[hit], vx[hit], vy[hit]
+                cx, cy, r = centre_x[hit, j], centre_y[hit, j], grid.rects[candidates[hit, j]]
+                # Hits on the left or right side
+                hx = np.where(along_x, np.where(hx < cx, r[:, 0] - self.size / 2, r[:, 0] + r[:, 2] + self.size / 2), hx)
+                new_vx = np.where(along_x, -hvx * absorption, hvx * (1 - friction))
+                # Hits on the top or bottom, slow landings on the top rest instead of bouncing
+                top = hy < cy
+                hy = np.where(along_x, hy, np.where(top, r[:, 1] - self.size / 2, r[:, 1] + r[:, 3] + self.size / 2))
+                resting = (hvy < 0) & (-hvy < rest_speed) & top
+                new_vy = np.where(along_x, hvy * (1 - friction), np.where(resting, 0.0, -hvy * absorption))
+                x[hit], y[hit], vx[hit], vy[hit] = hx, hy, new_vx, new_vy
+
+        state = np.full(flying.size, VOLLEY_FLYING, dtype=np.int8)
+        goal = np.asarray(goal, dtype=float)
+        gx, gy, gw, gh = goal[number].T if goal.ndim == 2 else goal
+        state[(x > gx) & (x < gx + gw) & (y > gy) & (y < gy + gh)] = VOLLEY_HIT
+        state[(state == VOLLEY_FLYING) & ((x < 0) | (x > width) | (y > height))] = VOLLEY_OUT
+        # Put projectiles that have been still for long enough to sleep, as Projectile.update_sleep does
+        still = vx * vx + vy * vy < sleep_speed * sleep_speed
+        still_time = np.where(still, self.still_time[picked] + self.dt, 0)
+        asleep = (state == VOLLEY_FLYING) & (still_time >= sleep_time)
+        state[asleep] = VOLLEY_RESTING
+        vx[asleep] = 0
+        vy[asleep] = 0
+
+        self.x[picked], self.y[picked], self.vx[picked], self.vy[picked] = x, y, vx, vy
+        self.still_time[picked] = still_time
+        self.state[picked] = state
+        self.last_x[flying[asleep]] = x[asleep] # A resting projectile is drawn where it stopped
+        self.last_y[flying[asleep]] = y[asleep]
+        return int(np.count_nonzero(state == VOLLEY_HIT)), impact
+
+    def get_positions(self, alpha=1.0):
+        """
+        A method to return the positions of the projectiles that are still on the screen (flying or resting) as an
+        (n, 2) array, alpha of the way from the position before the last step to the current one.
+        """
+        shown = np.flatnonzero((self.state[:self.n] == VOLLEY_FLYING) | (self.state[:self.n] == VOLLEY_RESTING))
+        x = self.last_x[shown] + (self.x[shown] - self.last_x[shown]) * alpha
+        y = self.last_y[shown] + (self.y[shown] - self.last_y[shown]) * alpha
+        return np.stack((x, y), axis=-1)
+
+if __name__ == "__main__":
+    # Sweep a grid of angles and powers and report how many shots per second were simulated
+    angles = np.linspace(-30, 80, 100)
+    powers = np.linspace(10, 140, 100)
+    start = time.perf_counter()
+    result = sweep_aim(130, 425, angles, powers, wind_speed=2, wind_angle=171, floor_y=800, x_max=1000)
+    elapsed = time.perf_counter() - start
+    print(f"{len(result.landing_x.ravel())} shots in {elapsed:.3f}s ({len(result.landing_x.ravel()) / elapsed:.0f} shots/s, {result.steps} steps)")
+    print(f"{np.count_nonzero(result.landed)} shots landed on the floor")
+
+    # Solve the launch for a goal through a few obstacles
+    goal = (850, 380, 50, 40)
+    obstacles = [(0, 795, 1000, 50), (400, 300, 80, 80), (600, 450, 60, 200)]
+    solution = solve_aim(130, 425, goal, obstacles, wind_speed=2, wind_angle=171)
+    print(f"{len(solution)} feasible shots found in {solution.elapsed * 1000:.1f}ms with {solution.simulations} simulations, best (angle, power): {solution.best()}")
@@ -0,0 +1,188 @@
+"""
+Shot telemetry.
+
+Every shot the player fires is recorded: the level, the launch velocity, the wind, how far the projectile went, how
+long it flew, how many times it bounced and how it ended. Records are put on a queue and a background thread writes
+them to an SQLite database in batches, one transaction per batch, so recording a shot never makes a frame wait for the
+disk. Each run of the game is a session, and every session is kept in the same database so the difficulty of the
+levels can be compared across many of them.
+
+Run with: python telemetry.py [database] [--by level|session|wind|outcome] [--session N]
+"""
+import atexit # Import the atexit module used to write the last records when the game exits
+import math # Import the math module
+import queue # Import the queue module used to pass records to the writer thread
+import sqlite3 # Import the sqlite3 module
+import sys # Import the sys module
+import threading # Import the threading module
+import time # Import the time module
+from replay import SHOT_HIT, OUTCOME_NAMES # Import how a shot can end
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    started REAL, seed INTEGER, width INTEGER, height INTEGER, mass REAL, Cd REAL, B2 REAL, physics_rate REAL
+);
+CREATE TABLE IF NOT EXISTS shots (
+    session INTEGER REFERENCES sessions(id),
+    time REAL, level INTEGER, layout INTEGER, vx REAL, vy REAL, angle REAL, power REAL, wind_speed REAL,
+    wind_angle REAL, obstacles INTEGER, steps INTEGER, flight_time REAL, distance REAL, distance_x REAL,
+    distance_y REAL, bounces INTEGER, outcome INTEGER
+);
+CREATE INDEX IF NOT EXISTS shots_level ON shots (level);
+CREATE INDEX IF NOT EXISTS shots_session ON shots (session);
+"""
+
+SESSION_COLUMNS = ("started", "seed", "width", "height", "mass", "Cd", "B2", "physics_rate") # The columns of a session
+SHOT_COLUMNS = ("time", "level", "layout", "vx", "vy", "angle", "power", "wind_speed", "wind_angle", "obstacles", "steps",
+                "flight_time", "distance", "distance_x", "distance_y", "bounces", "outcome") # The columns of a shot, after its session
+
+# The ways shots can be grouped by the query tool, as the SQL expression of the group
+GROUPS = {
+    "level": "level",
+    "session": "session",
+    "wind": "CAST(wind_speed AS INTEGER)", # Whole metres per second
+    "outcome": "outcome",
+}
+
+class Telemetry:
+    """
+    A class to record shots to an SQLite database from a background thread. record_shot never waits: the records
+    are queued and the thread writes everything that is waiting in one transaction, at most every flush_interval
+    seconds. The database is only created once there is a shot to write.
+    """
+    def __init__(self, file_name="telemetry.db", session=None, batch_size=1000, flush_interval=2.0, max_queue=100000):
+        """
+        Initialize the telemetry and start its thread. session is a dictionary with the values of SESSION_COLUMNS
+        that describe the run of the game.
+        """
+        self.file_name = file_name # The database the shots are written to
+        self.session = dict(session or {}, started=time.time()) # The values stored for the session
+        self.sessionId = None # The id of the session in the database, known once it has been written
+        self.batch_size = batch_size # The most records written in one transaction
+        self.flush_interval = flush_interval # The longest time a record waits before it is written
+        self.queue = queue.Queue(maxsize=max_queue) # The records waiting to be written
+        self.dropped = 0 # The number of records dropped because the queue was full
+        self.written = 0 # The number of records written
+        self.connection = None # The database, only used by the thread
+        self.closed = False # True once the telemetry has been closed
+        self.thread = threading.Thread(target=self.worker, daemon=True)
+        self.thread.start()
+        atexit.register(self.close) # Write what is left even if the game does not close the telemetry
+
+    def record_shot(self, level, layout, vx, vy, wind_speed, wind_angle, obstacles, steps, flight_time, distance,
+                    distance_x, distance_y, bounces, outcome):
+        """
+        A method to add a shot to the queue. Never waits: if the queue is full the shot is dropped and counted.
+        flight_time is in simulated seconds, not real ones, so sessions with different physics rates can be compared.
+        """
+        if self.closed:
+            return
+        record = (time.time(), level, layout, vx, vy, math.degrees(math.atan2(vy, vx)), math.hypot(vx, vy), wind_speed,
+                  wind_angle, obstacles, steps, flight_time, distance, distance_x, distance_y, bounces, outcome)
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def open(self):
+        """
+        A method to open the database, make its tables and add the session. Only called by the thread.
+        """
+        self.connection = sqlite3.connect(self.file_name)
+        self.connection.execute("PRAGMA journal_mode=WAL") # Readers such as the query tool do not block the writer
+        self.connection.execute("PRAGMA synchronous=NORMAL") # A batch is only lost if the computer itself crashes
+        self.connection.executescript(SCHEMA)
+        with self.connection:
+            cursor = self.connection.execute(f"INSERT INTO sessions ({', '.join(SESSION_COLUMNS)}) VALUES ({', '.join('?' * len(SESSION_COLUMNS))})",
+                                             [self.session.get(name) for name in SESSION_COLUMNS])
+        self.sessionId = cursor.lastrowid
+
+    def write(self, records):
+        """
+        A method to write a batch of records in one transaction. Only called by the thread.
+        """
+        if self.connection is None:
+            self.open()
+        with self.connection:
+            self.connection.executemany(f"INSERT INTO shots (session, {', '.join(SHOT_COLUMNS)}) VALUES ({', '.join('?' * (len(SHOT_COLUMNS) + 1))})",
+                                        [(self.sessionId, *record) for record in records])
+        self.written += len(records)
+
+    def worker(self):
+        """
+        A method run by the thread: gather records for up to flush_interval seconds and write them in batches,
+        until the telemetry is closed.
+        """
+        batch = []
+        deadline = None # When the oldest record of the batch has to be written
+        stop = False
+        while not stop:
+            try:
+                item = self.queue.get(timeout=None if deadline is None else max(deadline - time.monotonic(), 0))
+                if item is None: # Closing
+                    stop = True
+                else:
+                    batch.append(item)
+                    if deadline is None:
+                        deadline = time.monotonic() + self.flush_interval
+            except queue.Empty:
+                pass
+            if batch and (stop or len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                try:
+                    self.write(batch)
+                except Exception as e:
+                    print(f"Error: Could not write the telemetry. {e}")
+                batch = []
+                deadline = None
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def close(self):
+        """
+        A method to write every record still in the queue and stop the thread.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(None) # Waits for room, so the stop is never dropped
+        self.thread.join()
+
+def summarize(connection, by="level", session=None):
+    """
+    A function to add up the shots of a database by level, session, wind or outcome, for every session or just one.
+    Returns a list of (group, shots, hits, hit rate, average bounces, average flight time, average distance).
+    """
+    if by not in GROUPS:
+        raise ValueError(f"Shots can be grouped by {', '.join(GROUPS)}, not {by}")
+    where = "WHERE session = ?" if session is not None else ""
+    rows = connection.execute(f"SELECT {GROUPS[by]} AS grp, COUNT(*), SUM(outcome = {SHOT_HIT}), AVG(bounces), AVG(flight_time), AVG(distance) "
+                              f"FROM shots {where} GROUP BY grp ORDER BY grp", () if session is None else (session,)).fetchall()
+    return [(group, shots, hits, hits / shots, bounces, flight_time, distance) for group, shots, hits, bounces, flight_time, distance in rows]
+
+def last_session(connection):
+    """
+    A function to return the id of the newest session, or None if there is none.
+    """
+    return connection.execute("SELECT MAX(id) FROM sessions").fetchone()[0]
+
+if __name__ == "__main__":
+    file_name = sys.argv[1] if len(sys.argv) > 1 and not sys.argv[1].startswith("--") else "telemetry.db"
+    by = sys.argv[sys.argv.index("--by") + 1] if "--by" in sys.argv else "level"
+    session = sys.argv[sys.argv.index("--session") + 1] if "--session" in sys.argv else None # A session id or "last"
+    try:
+        connection = sqlite3.connect(f"file:{file_name}?mode=ro", uri=True) # Read only, so a running game is never held up
+    except sqlite3.OperationalError as e:
+        print(f"Could not open {file_name}: {e}")
+        sys.exit(1)
+    if session == "last":
+        session = last_session(connection)
+    sessions, shots = connection.execute("SELECT COUNT(DISTINCT session), COUNT(*) FROM shots" + (" WHERE session = ?" if session is not None else ""),
+                                         () if session is None else (int(session),)).fetchone()
+    print(f"{file_name}: {shots} shots in {sessions} sessions")
+    print(f"{by:>10}{'shots':>8}{'hits':>8}{'hit rate':>10}{'bounces':>9}{'flight s':>10}{'distance':>10}")
+    for group, shots, hits, rate, bounces, flight_time, distance in summarize(connection, by, None if session is None else int(session)):
+        name = OUTCOME_NAMES.get(group, group) if by == "outcome" else group
+        print(f"{name:>10}{shots:>8}{hits:>8}{rate:>10.1%}{bounces:>9.2f}{flight_time:>10.2f}{distance:>10.0f}")
+    connection.close()